@@ -3,8 +3,14 @@ import requests
 import time
 import json
 import os
-from typing import Dict, Optional, Any, List
+from typing import Dict, Optional, Any, List, Iterator
 from dotenv import load_dotenv
+import numpy as np
+from map_codec import layer_to_array, BITS
+from map_analysis import get_land_components, NO_COMPONENT
+from ai_board import encode_board
+from ai_context import ConversationPool
+from ai_stream import ActionStreamParser
 
 class GroqAPIClient:
     """Cliente para realizar llamadas a la API de Groq con manejo de errores y cambio de modelos."""
@@ -42,6 +48,8 @@ class GroqAPIClient:
         }
         # Inicializar el historial de conversación
         self.conversation_history = []
+        # Tokens de la última respuesta según la API (prompt_tokens, completion_tokens, total_tokens)
+        self.last_usage = None
         print(f"Cliente inicializado. Modelo inicial: {self.current_model}")
     
     @property
@@ -63,6 +71,22 @@ class GroqAPIClient:
         ]
         print("Instrucciones del sistema establecidas en el historial de conversación")
     
+    def remember_response(self, content: str) -> None:
+        """Guarda la respuesta del asistente en el historial y lo recorta."""
+        self.conversation_history.append({
+            "role": "assistant", 
+            "content": content
+        })
+        
+        # Limitar el historial si es necesario (mantener sistema + últimos 4 pares)
+        if len(self.conversation_history) > 9:  # sistema + 4 pares
+            # Mantener el mensaje del sistema
+            system_msg = self.conversation_history[0] if self.conversation_history[0]["role"] == "system" else None
+            # Mantener los últimos 8 mensajes (4 pares)
+            recent_msgs = self.conversation_history[-8:]
+            # Reconstruir el historial
+            self.conversation_history = ([system_msg] if system_msg else []) + recent_msgs
+    
     def call_api(self, prompt: str = None, temperature: float = 0.4) -> Dict[str, Any]:
         """
         Realiza una llamada a la API de Groq con manejo de errores.
@@ -102,23 +126,12 @@ class GroqAPIClient:
                 # Si la respuesta es exitosa, devolver los datos
                 if response.status_code == 200:
                     data = response.json()
+                    self.last_usage = data.get("usage")
                     print(f"Respuesta exitosa recibida (tokens: {data.get('usage', {}).get('total_tokens', 'N/A')})")
                     
                     # Guardar la respuesta del asistente en el historial
                     if "choices" in data and len(data["choices"]) > 0:
-                        self.conversation_history.append({
-                            "role": "assistant", 
-                            "content": data["choices"][0]["message"]["content"]
-                        })
-                        
-                        # Limitar el historial si es necesario (mantener sistema + últimos 4 pares)
-                        if len(self.conversation_history) > 9:  # sistema + 4 pares
-                            # Mantener el mensaje del sistema
-                            system_msg = self.conversation_history[0] if self.conversation_history[0]["role"] == "system" else None
-                            # Mantener los últimos 8 mensajes (4 pares)
-                            recent_msgs = self.conversation_history[-8:]
-                            # Reconstruir el historial
-                            self.conversation_history = ([system_msg] if system_msg else []) + recent_msgs
+                        self.remember_response(data["choices"][0]["message"]["content"])
                     
                     retries = 0
                     return data
@@ -159,6 +172,84 @@ class GroqAPIClient:
         # Si se agotaron todos los reintentos
         raise Exception("Se agotaron todos los reintentos con todos los modelos disponibles.")
     
+    def stream_call(self, prompt: str = None, temperature: float = 0.4) -> Iterator[str]:
+        """
+        Igual que call_api pero en modo streaming: devuelve los fragmentos de
+        texto según los genera el modelo. Solo se cambia de modelo si falla
+        antes del primer fragmento. La respuesta completa se guarda en el historial.
+        """
+        if prompt:
+            self.conversation_history.append({"role": "user", "content": prompt})
+        
+        if not self.conversation_history:
+            raise ValueError("No hay mensajes en el historial de conversación para enviar")
+        
+        self.last_usage = None
+        retries = 0
+        while retries < len(self.MODELS):
+            parts = []
+            payload = {
+                "model": self.current_model,
+                "messages": self.conversation_history,
+                "temperature": temperature,
+                "stream": True
+            }
+            try:
+                print(f"Enviando solicitud (stream) a {self.current_model} con {len(self.conversation_history)} mensajes")
+                response = requests.post(
+                    self.BASE_URL,
+                    headers=self.headers,
+                    json=payload,
+                    timeout=30,
+                    stream=True
+                )
+                
+                if response.status_code != 200:
+                    error_info = response.json() if response.content else {"error": {"message": "Error desconocido"}}
+                    error_message = error_info.get("error", {}).get("message", "Error desconocido")
+                    if response.status_code in (400, 401, 403):
+                        print(f"Error {response.status_code}: {error_message}")
+                        raise Exception(f"Error en la API: {error_message}")
+                    print(f"Error {response.status_code}: {error_message}. Cambiando de modelo.")
+                    self.rotate_model()
+                    retries += 1
+                    continue
+                
+                with response:
+                    # Server-sent events: "data: {json}" por fragmento, "data: [DONE]" al final
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        # Groq manda el uso de tokens en el último fragmento
+                        usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+                        if usage:
+                            self.last_usage = usage
+                        choices = chunk.get("choices") or []
+                        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                
+                print(f"Respuesta (stream) recibida: {sum(len(part) for part in parts)} caracteres")
+                self.remember_response("".join(parts))
+                return
+                
+            except (requests.RequestException, json.JSONDecodeError) as e:
+                print(f"Error de conexión: {str(e)}")
+                if parts:
+                    # La respuesta ya se ha empezado a enviar: no se puede repetir con otro modelo
+                    self.remember_response("".join(parts))
+                    raise
+                time.sleep(1)
+                retries += 1
+                self.rotate_model()
+        
+        raise Exception("Se agotaron todos los reintentos con todos los modelos disponibles.")
+    
     def run_call(self, prompt: str = None, system_instructions: str = None) -> str:
         """
         Ejecuta una llamada a la API con manejo del historial de conversación.
@@ -210,27 +301,16 @@ def filter_game_state(game_state: dict) -> dict:
     # Get AI fog of war grid
     ai_fog_grid = game_state.get("ia", {}).get("fog_grid", [])
     
-    # Create optimized fog_of_war representation
-    # Instead of sending full 2D array, we'll send only visible coordinates
-    visible_tiles = []
-    if ai_fog_grid:
-        for y in range(min(len(ai_fog_grid), map_height)):
-            for x in range(min(len(ai_fog_grid[y]), map_width)):
-                if ai_fog_grid[y][x] == 1:  # If tile is visible to AI
-                    visible_tiles.append([x, y])
+    # Visible tiles as a bitmask (O(1) lookups instead of searching a list)
+    ai_fog = np.zeros((map_height, map_width), dtype=bool)
+    if ai_fog_grid is not None and len(ai_fog_grid):
+        ai_fog = layer_to_array(ai_fog_grid, map_width, map_height, BITS)[:map_height, :map_width] == 1
     
-    # Only keep essential terrain data for visible tiles
-    terrain_visible = {}
+    # Visible part of the map as one character per tile (see ai_board.py)
+    terrain = None
     if "terrain" in game_state.get("map_data", {}):
-        terrain = game_state["map_data"]["terrain"]
-        
-        # Process terrain only for visible tiles
-        for [x, y] in visible_tiles:
-            if y < len(terrain) and x < len(terrain[y]):
-                # Only store non-zero terrains to save tokens
-                if terrain[y][x] != 0:
-                    # Store as "x,y": terrain_type
-                    terrain_visible[f"{x},{y}"] = terrain[y][x]
+        terrain = layer_to_array(game_state["map_data"]["terrain"], map_width, map_height)[:map_height, :map_width]
+    board = encode_board(terrain, ai_fog)
     
     # Extract essential IA info (units and cities with minimal properties)
     ia_units = []
@@ -260,6 +340,17 @@ def filter_game_state(game_state: dict) -> dict:
                 "population": city.get("population", 0)
             })
     
+    # Islands of the AI units: enemies elsewhere cannot be reached by land
+    ai_islands = set()
+    labels = None
+    if game_state.get("map_data", {}).get("terrain") is not None:
+        labels = get_land_components(game_state)
+        for unit in game_state.get("ia", {}).get("units", []):
+            unit_pos = unit.get("position") or []
+            if len(unit_pos) >= 2 and 0 <= unit_pos[0] < map_width and 0 <= unit_pos[1] < map_height:
+                ai_islands.add(int(labels[unit_pos[1], unit_pos[0]]))
+        ai_islands.discard(NO_COMPONENT)
+    
     # Extract visible player units (those within AI's fog of war)
     visible_player_units = []
     player_unit_positions = [] # For easy checking
@@ -270,12 +361,13 @@ def filter_game_state(game_state: dict) -> dict:
             if len(unit_pos) >= 2:
                 x, y = unit_pos[0], unit_pos[1]
                 # Check if unit position is within AI's visibility
-                if any(pos[0] == x and pos[1] == y for pos in visible_tiles):
+                if 0 <= x < map_width and 0 <= y < map_height and ai_fog[y, x]:
                     player_unit_positions.append((x, y))
                     visible_player_units.append({
                         "id": unit.get("id"),
                         "type_id": unit.get("type_id"),
-                        "position": unit_pos
+                        "position": unit_pos,
+                        "reachable": labels is None or int(labels[y, x]) in ai_islands
                     })
     
     # Create minimal filtered state
@@ -283,8 +375,7 @@ def filter_game_state(game_state: dict) -> dict:
         "difficulty": game_state.get("difficulty"),
         "turn": game_state.get("turn"),
         "map_size": {"width": map_width, "height": map_height},
-        "visible_tiles": visible_tiles,
-        "terrain_visible": terrain_visible,
+        "board": board,
         "player_units_visible": visible_player_units,
         "player_unit_positions": player_unit_positions,  # Add positions array for easier AI logic
         "ia": {
@@ -297,19 +388,8 @@ def filter_game_state(game_state: dict) -> dict:
     
     return filtered_state
 
-def iaDeitu(prompt: str = None, game_state: dict = None) -> str:
-    """
-    Function to interact with the game AI.
-    If a prompt is provided, send it directly to the LLM and return its response.
-    If no prompt is provided, use the default behavior (filtered game state, system instructions, etc).
-    Returns the LLM response (usually JSON).
-    """
-    try:
-        # Initialize the client (keep a persistent instance)
-        if not hasattr(iaDeitu, "_client"):
-            iaDeitu._client = GroqAPIClient()
-            # System instructions (only sent once)
-            system_instructions = """
+# System instructions of every AI conversation
+AI_SYSTEM_INSTRUCTIONS = """
             You are an AI controlling a player in a turn-based strategy game similar to Civilization.
             Your role is to return ONLY a valid JSON response with your actions based on the game state.
             DO NOT include any text, explanations, or comments outside the JSON structure.
@@ -338,7 +418,8 @@ def iaDeitu(prompt: str = None, game_state: dict = None) -> str:
                - Units CANNOT move outside map boundaries (all x must be 0 to width-1, all y must be 0 to height-1)
                - Units CANNOT move onto water tiles (terrain type 1)
                - Units CANNOT occupy tiles with other units
-               - Units CANNOT move to tiles outside visible_tiles list
+               - Units CANNOT move to tiles that are not visible on the board
+               - Enemy units with "reachable": false are on another island: no land path leads to them, do not move towards them
             4. COMBAT RULES:
                - You can ONLY attack enemy units that are VISIBLE in your fog of war
                - You can ONLY attack enemy units that are within 3 tiles of one of your units
@@ -395,7 +476,8 @@ def iaDeitu(prompt: str = None, game_state: dict = None) -> str:
             8. FOG OF WAR:
                - You start with a 4x4 area of visibility around your starting position
                - When units move, they reveal a 4x4 area around their new position
-               - You can only see tiles listed in "visible_tiles"
+               - You can only see the tiles of "board": {"origin": [x0, y0], "rows": [...]}
+                 Row y - y0, character x - x0 is tile (x, y): its terrain type digit, or "?" if it is not visible
                - Terrain information is only available for visible tiles
                - Enemy units are only shown if they're within your visible tiles
 
@@ -448,50 +530,121 @@ def iaDeitu(prompt: str = None, game_state: dict = None) -> str:
             - You can't attack while in a ceasefire
             - You can't move to a tile that is another troop or city
             """
-            
-            # Set system instructions
-            iaDeitu._client.set_system_instructions(system_instructions)
 
+def build_game_prompt(filtered_game_state: dict, state_text: str = None, changes: bool = False) -> str:
+    """
+    User message of an AI turn: the game state (or its changes since the
+    state sent before, see ai_memory.py) and the turn rules.
+    """
+    if state_text is None:
+        state_text = json.dumps(filtered_game_state)
+    if changes:
+        header = ("Generate actions based on the game state above with these changes applied "
+                  "(revealed_tiles [x, y, \"tiles\"] are now visible from x onwards, hidden_tiles [x, y, n] are not, units, cities and player_units_visible lists replace "
+                  "the ones above, *_changed entries replace the ones with the same id, *_gone ids no longer exist):")
+    else:
+        header = "Generate actions based on this game state:"
+    return f"""
+    {header}
+    {state_text}
+    
+    Return ONLY a valid JSON with your actions. Your response must follow exactly the format from the instructions:
+    1. Map boundaries are {filtered_game_state["map_size"]["width"]}x{filtered_game_state["map_size"]["height"]} (0-indexed). Never move outside these bounds.
+    2. Only move to tiles that are visible in your fog of war (not "?" on the board)
+    3. Only attack enemy units that are VISIBLE and within 2 tiles of your units
+    4. Calculate remaining movement and status correctly
+    5. ALWAYS include a unit_id for all actions - if a unit has no ID, generate one using its position: "unit-x-y"
+    6. You SHOULD perform multiple actions in a single turn - move all available units!
+    7. Remember that cavalry units can move up to 4 tiles per turn (instead of 2)
+    8. Your PRIMARY OBJECTIVE is to maximize exploration and visibility - prioritize movements that reveal new areas
+    9. Your SECONDARY OBJECTIVE is to secure valuable resource tiles (gold, iron, wood, stone)
+    10. IMPORTANT: This is a NEW TURN - all units shown in the game state have full movement points and status "ready"
+    11. CITY MANAGEMENT: For each city without active production:
+    a) Build Sawmills and Quarries first to secure resource production
+    b) Build a Farm when food drops below 100
+    c) Build a Library when you have at least 70 wood and 50 stone
+    d) Start researching "medium" technology once you have a Library
+    e) Train units when defenses are needed or for expansion
+
+    IMPORTANT: Prioritize building cities in resource-rich areas when you have settlers
+    CRITICAL: Always verify x coordinates are between 0 and {filtered_game_state["map_size"]["width"]-1} and y coordinates are between 0 and {filtered_game_state["map_size"]["height"]-1}.
+    """
+
+def fill_unit_id(action: dict) -> dict:
+    """If unit_id is missing or null, generate one from the action position"""
+    if isinstance(action, dict) and action.get("unit_id") is None:
+        if "position" in action and isinstance(action["position"], list) and len(action["position"]) >= 2:
+            x, y = action["position"][0], action["position"][1]
+            action["unit_id"] = f"unit-{x}-{y}"
+    return action
+
+# Una conversación por partida (ver ai_context.py)
+ai_conversations = ConversationPool(GroqAPIClient)
+
+def prepare_ai_turn(client: GroqAPIClient, memory, game_state: dict):
+    """
+    Replace the conversation history with the messages of this turn (system
+    instructions, last full state and the changes since then).
+    Returns the turn info for memory.record.
+    """
+    filtered_game_state = filter_game_state(game_state)
+    messages, info = memory.build_messages(
+        AI_SYSTEM_INSTRUCTIONS, filtered_game_state,
+        lambda state_text, changes: build_game_prompt(filtered_game_state, state_text, changes))
+    client.conversation_history = messages
+    return info
+
+def iaDeitu(prompt: str = None, game_state: dict = None, game_id: str = None, cancelled=None) -> str:
+    """
+    Function to interact with the game AI.
+    If a prompt is provided, send it directly to the LLM and return its response.
+    If no prompt is provided, use the default behavior (filtered game state, system instructions, etc).
+    Each game (game_id) has its own conversation; calls of one game are serialized.
+    If the cancelled event (threading.Event) is set before the call gets the
+    conversation, the LLM is not called.
+    Returns the LLM response (usually JSON).
+    """
+    try:
+        with ai_conversations.session(str(game_id)) as context:
+            if cancelled is not None and cancelled.is_set():
+                return json.dumps({"error": "AI turn cancelled"})
+            client = context.client
+            # System instructions (only sent once per conversation)
+            if not client.conversation_history:
+                client.set_system_instructions(AI_SYSTEM_INSTRUCTIONS)
+            return run_ai_turn(client, prompt, game_state, context.memory)
+    except Exception as e:
+        print(f"Error in execution: {str(e)}")
+        return json.dumps({"error": str(e)})
+
+def run_ai_turn(client: GroqAPIClient, prompt: str = None, game_state: dict = None, memory=None) -> str:
+    """
+    Send one request of a game to the LLM (the caller holds the game's conversation).
+    With the game's TurnMemory, AI turns send only the changes of the state.
+    """
+    try:
         # --- NUEVO: Si se pasa un prompt explícito, mándalo tal cual al LLM ---
 
         if prompt is not None:
             # Si hay prompt, simplemente llama al LLM con ese prompt y devuelve la respuesta
-            response = iaDeitu._client.run_call(prompt)
+            response = client.run_call(prompt)
             return response
 
         # --- Si no hay prompt, sigue el flujo normal (acción de la IA en el juego) ---
-        # Filter game state
-        filtered_game_state = filter_game_state(game_state)
+        if memory is not None:
+            # Mensajes de este turno: estado completo anterior + cambios
+            info = prepare_ai_turn(client, memory, game_state)
+            api_response = client.run_call()
+            memory.record(info, api_response, client.last_usage)
+        else:
+            # Filter game state
+            filtered_game_state = filter_game_state(game_state)
 
-        # Build current message with minimal essential information
-        game_prompt = f"""
-        Generate actions based on this game state:
-        {json.dumps(filtered_game_state)}
-        
-        Return ONLY a valid JSON with your actions. Your response must follow exactly the format from the instructions:
-        1. Map boundaries are {filtered_game_state["map_size"]["width"]}x{filtered_game_state["map_size"]["height"]} (0-indexed). Never move outside these bounds.
-        2. Only move to tiles that are visible in your fog of war (visible_tiles)
-        3. Only attack enemy units that are VISIBLE and within 2 tiles of your units
-        4. Calculate remaining movement and status correctly
-        5. ALWAYS include a unit_id for all actions - if a unit has no ID, generate one using its position: "unit-x-y"
-        6. You SHOULD perform multiple actions in a single turn - move all available units!
-        7. Remember that cavalry units can move up to 4 tiles per turn (instead of 2)
-        8. Your PRIMARY OBJECTIVE is to maximize exploration and visibility - prioritize movements that reveal new areas
-        9. Your SECONDARY OBJECTIVE is to secure valuable resource tiles (gold, iron, wood, stone)
-        10. IMPORTANT: This is a NEW TURN - all units shown in the game state have full movement points and status "ready"
-        11. CITY MANAGEMENT: For each city without active production:
-        a) Build Sawmills and Quarries first to secure resource production
-        b) Build a Farm when food drops below 100
-        c) Build a Library when you have at least 70 wood and 50 stone
-        d) Start researching "medium" technology once you have a Library
-        e) Train units when defenses are needed or for expansion
+            # Build current message with minimal essential information
+            game_prompt = build_game_prompt(filtered_game_state)
 
-        IMPORTANT: Prioritize building cities in resource-rich areas when you have settlers
-        CRITICAL: Always verify x coordinates are between 0 and {filtered_game_state["map_size"]["width"]-1} and y coordinates are between 0 and {filtered_game_state["map_size"]["height"]-1}.
-        """
-
-        # Call the API with the specific game prompt
-        api_response = iaDeitu._client.run_call(prompt=game_prompt)
+            # Call the API with the specific game prompt
+            api_response = client.run_call(prompt=game_prompt)
 
         # Post-process the response to ensure all actions have unit_ids
         try:
@@ -501,11 +654,7 @@ def iaDeitu(prompt: str = None, game_state: dict = None) -> str:
             # Check if we have actions
             if "actions" in response_data and isinstance(response_data["actions"], list):
                 for action in response_data["actions"]:
-                    # If unit_id is missing or null, generate one from position
-                    if "unit_id" not in action or action["unit_id"] is None:
-                        if "position" in action and isinstance(action["position"], list) and len(action["position"]) >= 2:
-                            x, y = action["position"][0], action["position"][1]
-                            action["unit_id"] = f"unit-{x}-{y}"
+                    fill_unit_id(action)
 
             # Return the fixed response
             return json.dumps(response_data)
@@ -516,3 +665,31 @@ def iaDeitu(prompt: str = None, game_state: dict = None) -> str:
     except Exception as e:
         print(f"Error in execution: {str(e)}")
         return json.dumps({"error": str(e)})
+
+def iaDeituStream(game_state: dict = None, game_id: str = None, on_action=None, cancelled=None) -> str:
+    """
+    AI turn in streaming mode: on_action(action) is called with every element
+    of the "actions" array as soon as the model closes it.
+    Setting the cancelled event (threading.Event) stops reading the stream.
+    Returns the complete LLM response, like iaDeitu.
+    """
+    try:
+        with ai_conversations.session(str(game_id)) as context:
+            if cancelled is not None and cancelled.is_set():
+                return json.dumps({"error": "AI turn cancelled"})
+            client = context.client
+            info = prepare_ai_turn(client, context.memory, game_state)
+            parser = ActionStreamParser()
+            for chunk in client.stream_call():
+                if cancelled is not None and cancelled.is_set():
+                    print("AI turn cancelled, closing the stream")
+                    break
+                for action in parser.feed(chunk):
+                    if on_action:
+                        on_action(fill_unit_id(action))
+            print(f"Streamed {parser.actions_count} AI actions")
+            context.memory.record(info, parser.text, client.last_usage)
+            return parser.text
+    except Exception as e:
+        print(f"Error in execution: {str(e)}")
+        return json.dumps({"error": str(e)})
@@ -0,0 +1,75 @@
+"""
+Compact board encoding for the AI prompt.
+
+The tiles the AI can see are sent as a rectangular viewport (the bounding
+box of the visible tiles) with one character per tile: the terrain type
+digit ("0" land, "1" water, "2"-"5" resources) or HIDDEN for tiles under the
+fog of war. Tile (x, y) is character x - x0 of row y - y0:
+
+    {"origin": [x0, y0], "rows": ["0041??", "0001??", "?1100?"]}
+
+Compared with a list of [x, y] pairs plus a "x,y": type dictionary this is
+one character per tile instead of about fifteen.
+
+Changes of the board between two observations are sent as horizontal runs
+[x, y, "chars"] (run-length rows of the tiles that changed).
+"""
+import numpy as np
+
+HIDDEN = "?"
+_HIDDEN_CODE = ord(HIDDEN)
+_DIGIT_ZERO = ord("0")
+
+
+def encode_board(terrain, visible):
+    """
+    Viewport of the visible tiles. terrain is a (height, width) array of
+    terrain types (or None if unknown), visible a boolean array of the same shape.
+    """
+    ys, xs = np.nonzero(visible)
+    if len(xs) == 0:
+        return {"origin": [0, 0], "rows": []}
+    x0, x1, y0, y1 = int(xs.min()), int(xs.max()) + 1, int(ys.min()), int(ys.max()) + 1
+    window = visible[y0:y1, x0:x1]
+    if terrain is None:
+        codes = np.full(window.shape, _DIGIT_ZERO, dtype=np.uint8)
+    else:
+        codes = np.asarray(terrain[y0:y1, x0:x1], dtype=np.uint8) + _DIGIT_ZERO
+    codes = np.where(window, codes, _HIDDEN_CODE).astype(np.uint8)
+    return {"origin": [x0, y0], "rows": [row.tobytes().decode("ascii") for row in codes]}
+
+
+def board_codes(board, width, height):
+    """Characters of a board as a (height, width) uint8 array (HIDDEN outside the viewport)"""
+    codes = np.full((height, width), _HIDDEN_CODE, dtype=np.uint8)
+    rows = board.get("rows") or []
+    if rows:
+        x0, y0 = board.get("origin", [0, 0])
+        window = np.frombuffer("".join(rows).encode("ascii"), dtype=np.uint8).reshape(len(rows), -1)
+        codes[y0:y0 + window.shape[0], x0:x0 + window.shape[1]] = window
+    return codes
+
+
+def tile_runs(codes, mask):
+    """Horizontal runs of the masked tiles: [[x, y, "chars"], ...]"""
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_ys, run_starts = np.nonzero(edges == 1)
+    _, run_ends = np.nonzero(edges == -1)
+    return [[int(x), int(y), codes[y, x:end].tobytes().decode("ascii")]
+            for y, x, end in zip(run_ys, run_starts, run_ends)]
+
+
+def board_changes(before, after, width, height):
+    """
+    Changes from one board to another: (revealed, hidden). revealed holds the
+    [x, y, "chars"] runs of the tiles that became visible or changed, hidden
+    the [x, y, length] runs of the tiles no longer visible
+    """
+    old = board_codes(before, width, height)
+    new = board_codes(after, width, height)
+    revealed = (new != _HIDDEN_CODE) & (new != old)
+    hidden = (new == _HIDDEN_CODE) & (old != _HIDDEN_CODE)
+    return tile_runs(new, revealed), [[x, y, len(chars)] for x, y, chars in tile_runs(new, hidden)]
+
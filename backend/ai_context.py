@@ -0,0 +1,118 @@
+"""
+Per-game LLM conversation contexts.
+
+Every game gets its own conversation (system instructions, recent history
+and the turn memory of ai_memory.py), so games never see each other's
+messages. Contexts live in a
+bounded pool:
+
+- LRU: at most AI_CONTEXT_MAX_GAMES conversations per process
+- TTL: conversations idle for AI_CONTEXT_TTL seconds are dropped
+- memory cap: the history of all conversations together is kept under
+  AI_CONTEXT_MAX_CHARS characters (least recently used evicted first)
+
+Calls for different games run in parallel; calls for the same game take the
+game's lock and are serialized, so a history is never modified by two
+requests at once.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from ai_memory import TurnMemory
+
+AI_CONTEXT_MAX_GAMES = int(os.environ.get('AI_CONTEXT_MAX_GAMES', '64'))
+AI_CONTEXT_TTL = int(os.environ.get('AI_CONTEXT_TTL', '3600'))
+AI_CONTEXT_MAX_CHARS = int(os.environ.get('AI_CONTEXT_MAX_CHARS', '4000000'))
+
+
+def history_size(history):
+    """Characters held by a conversation history"""
+    return sum(len(message.get("content") or "") for message in history)
+
+
+class ConversationContext:
+    """Conversation state of one game"""
+
+    def __init__(self, client):
+        self.client = client
+        self.memory = TurnMemory()
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.size = 0
+
+
+class ConversationPool:
+    """Bounded pool of conversation contexts keyed by game id"""
+
+    def __init__(self, client_factory, max_games=AI_CONTEXT_MAX_GAMES, ttl=AI_CONTEXT_TTL,
+                 max_chars=AI_CONTEXT_MAX_CHARS):
+        self.client_factory = client_factory
+        self.max_games = max_games
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, keep=None):
+        """Drop expired contexts, then the least recently used over the limits"""
+        now = time.monotonic()
+        for game_id in [game_id for game_id, context in self._contexts.items()
+                        if game_id != keep and now - context.last_used > self.ttl]:
+            del self._contexts[game_id]
+        total = sum(context.size for context in self._contexts.values())
+        for game_id in list(self._contexts):
+            if len(self._contexts) <= self.max_games and total <= self.max_chars:
+                break
+            if game_id == keep:
+                continue
+            total -= self._contexts.pop(game_id).size
+
+    def get(self, game_id):
+        """Context of a game, created (with an empty history) if needed"""
+        with self._lock:
+            context = self._contexts.get(game_id)
+            if context is None:
+                context = ConversationContext(self.client_factory())
+                self._contexts[game_id] = context
+            self._contexts.move_to_end(game_id)
+            context.last_used = time.monotonic()
+            self._evict(keep=game_id)
+            return context
+
+    def peek(self, game_id):
+        """Context of a game if it exists (not created, not marked as used)"""
+        with self._lock:
+            return self._contexts.get(game_id)
+
+    def drop(self, game_id):
+        """Forget the conversation of a game (e.g. when it is deleted)"""
+        with self._lock:
+            self._contexts.pop(game_id, None)
+
+    @contextmanager
+    def session(self, game_id):
+        """
+        Use the conversation of a game with its lock held:
+
+            with pool.session(game_id) as context:
+                context.client.run_call(prompt)
+        """
+        context = self.get(game_id)
+        with context.lock:
+            try:
+                yield context
+            finally:
+                context.size = history_size(context.client.conversation_history) + context.memory.size
+                context.last_used = time.monotonic()
+                with self._lock:
+                    self._evict(keep=game_id)
+
+    def stats(self):
+        """Number of conversations and characters held"""
+        with self._lock:
+            return {
+                "games": len(self._contexts),
+                "chars": sum(context.size for context in self._contexts.values()),
+            }
@@ -0,0 +1,157 @@
+"""
+Background jobs for AI turns.
+
+An LLM call can take more than a minute (several models, 30 s timeout each),
+so AI turns run in a bounded pool of worker threads instead of the web
+request. Submitting returns a job id at once; the client polls the job or
+listens to its server-sent events.
+
+- AI_JOB_WORKERS threads run the jobs; at most AI_JOB_MAX_PENDING jobs wait
+  or run at the same time (further submissions are rejected)
+- a job for a key (game id and turn) that is already queued, running or done
+  is returned instead of starting a second LLM call
+- finished jobs are kept for AI_JOB_TTL seconds
+- jobs can publish partial results while they run (streamed AI actions),
+  which listeners read with wait_progress
+- start_call runs an LLM call that the caller waits for with a deadline
+  (see AI_LLM_DEADLINE in ai_planner.py)
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', '4'))
+AI_JOB_MAX_PENDING = int(os.environ.get('AI_JOB_MAX_PENDING', '64'))
+AI_JOB_TTL = int(os.environ.get('AI_JOB_TTL', '600'))
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when the pool already has AI_JOB_MAX_PENDING unfinished jobs"""
+
+
+class AIJob:
+    """One AI turn"""
+
+    def __init__(self, key, owner):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.owner = owner
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+        self.progress = []
+        self._changed = threading.Condition()
+
+    def publish(self, item):
+        """Add a partial result (e.g. one streamed action) and wake the listeners"""
+        with self._changed:
+            self.progress.append(item)
+            self._changed.notify_all()
+
+    def wait_progress(self, seen, timeout):
+        """
+        Partial results after the first `seen`, waiting up to timeout seconds
+        for new ones unless the job has finished
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.progress) > seen or self.done.is_set(), timeout)
+            return self.progress[seen:]
+
+    def finish(self, status):
+        self.status = status
+        self.finished_at = time.time()
+        with self._changed:
+            self.done.set()
+            self._changed.notify_all()
+
+    def to_dict(self):
+        job = {"job_id": self.id, "status": self.status}
+        if self.status == DONE:
+            job["result"] = self.result
+        elif self.status == FAILED:
+            job["error"] = self.error
+        return job
+
+
+class AIJobRunner:
+    """Bounded worker pool with per-key deduplication"""
+
+    def __init__(self, workers=AI_JOB_WORKERS, max_pending=AI_JOB_MAX_PENDING, ttl=AI_JOB_TTL):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-job")
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        """Forget finished jobs older than the TTL"""
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.ttl]:
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+    def submit(self, key, owner, fn, *args, progress=False, **kwargs):
+        """
+        Run fn(*args, **kwargs) in the pool, unless a job with the same key is
+        already queued, running or done. Failed jobs can be submitted again.
+        With progress=True fn also gets publish=job.publish.
+        Returns (job, created).
+        """
+        with self._lock:
+            self._expire()
+            job = self._by_key.get(key)
+            if job is not None and job.status != FAILED:
+                return job, False
+
+            pending = sum(1 for other in self._jobs.values() if other.finished_at is None)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"Too many AI turns in progress ({pending})")
+
+            job = AIJob(key, owner)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        if progress:
+            kwargs["publish"] = job.publish
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job, True
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = RUNNING
+        try:
+            job.result = fn(*args, **kwargs)
+            job.finish(DONE)
+        except Exception as e:
+            print(f"AI job {job.id} failed: {e}")
+            job.error = str(e)
+            job.finish(FAILED)
+
+    def get(self, job_id):
+        """Job by id, or None if unknown or expired"""
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+
+ai_jobs = AIJobRunner()
+
+# LLM calls raced against a deadline (they keep running after it expires)
+_deadline_executor = ThreadPoolExecutor(max_workers=AI_JOB_WORKERS, thread_name_prefix="ai-deadline")
+
+
+def start_call(fn, *args, **kwargs):
+    """Run fn in the background, returns its Future (wait with result(timeout))"""
+    return _deadline_executor.submit(fn, *args, **kwargs)
@@ -0,0 +1,211 @@
+"""
+Compact memory of the AI conversation of a game.
+
+Instead of replaying the last user/assistant pairs (each with a full copy of
+the board), the messages of every AI turn are rebuilt as:
+
+1. the static system instructions
+2. the last full observation of the game (the "keyframe"), unless this turn
+   is itself a keyframe
+3. the current turn: a short summary of the actions the AI played last turn
+   (after validation or the local plan, see played()) and only
+   the state that changed since the keyframe (moved units, newly revealed
+   tiles, cities, visible enemies) plus the resource deltas
+
+Changes are always relative to the keyframe, so keyframe + changes is the
+complete current state. A new keyframe is sent when the changes grow past
+AI_DELTA_MAX_RATIO of the full state, every AI_KEYFRAME_TURNS turns, or when
+the game does not follow the keyframe (new map, loaded save, turn going back).
+
+Token counts are estimated locally (AI_CHARS_PER_TOKEN) and recorded next to
+the counts returned by the API for every turn.
+"""
+import json
+import math
+import os
+from collections import deque
+from ai_board import board_changes
+
+AI_KEYFRAME_TURNS = int(os.environ.get('AI_KEYFRAME_TURNS', '10'))
+AI_DELTA_MAX_RATIO = float(os.environ.get('AI_DELTA_MAX_RATIO', '0.5'))
+AI_CHARS_PER_TOKEN = 4
+
+# Actions listed in the summary of the last turn
+SUMMARY_MAX_ACTIONS = 12
+# Turns kept in the usage log of a game
+USAGE_LOG_SIZE = 50
+
+# Unit and city fields whose change is reported (status and remaining
+# movement are reset every turn)
+UNIT_FIELDS = ("type_id", "position", "health", "attack", "defense", "movement")
+CITY_FIELDS = ("name", "position", "population")
+
+
+def estimate_tokens(text):
+    """Approximate token count of a text"""
+    return math.ceil(len(text) / AI_CHARS_PER_TOKEN)
+
+
+def compact_json(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _diff_entities(delta, name, before, after, fields):
+    """
+    Add to delta the new or changed entities ("<name>_changed") and the ids of
+    the ones gone ("<name>_gone"). Entities without id cannot be matched, so
+    the whole list is sent instead ("<name>") if it changed.
+    """
+    if not all(entity.get("id") is not None for entity in list(before) + list(after)):
+        if [[entity.get(field) for field in fields] for entity in before] != \
+                [[entity.get(field) for field in fields] for entity in after]:
+            delta[name] = after
+        return
+    old = {entity["id"]: entity for entity in before}
+    new = {entity["id"]: entity for entity in after}
+    changed = [entity for key, entity in new.items()
+               if key not in old or any(old[key].get(field) != entity.get(field) for field in fields)]
+    gone = [key for key in old if key not in new]
+    if changed:
+        delta[f"{name}_changed"] = changed
+    if gone:
+        delta[f"{name}_gone"] = gone
+
+
+def state_delta(keyframe, state, previous=None):
+    """
+    Changes of a filtered game state (IAProba.filter_game_state) since the
+    keyframe. Resource deltas are relative to the previous observation.
+    """
+    delta = {
+        "turn": state.get("turn"),
+        "ceasefire_turns": state.get("ceasefire_turns", 0),
+    }
+
+    map_size = state.get("map_size", {})
+    revealed, hidden = board_changes(keyframe.get("board", {}), state.get("board", {}),
+                                     map_size.get("width", 0), map_size.get("height", 0))
+    if revealed:
+        delta["revealed_tiles"] = revealed
+    if hidden:
+        delta["hidden_tiles"] = hidden
+
+    old_ia, ia = keyframe.get("ia", {}), state.get("ia", {})
+    _diff_entities(delta, "units", old_ia.get("units", []), ia.get("units", []), UNIT_FIELDS)
+    _diff_entities(delta, "cities", old_ia.get("cities", []), ia.get("cities", []), CITY_FIELDS)
+    _diff_entities(delta, "player_units_visible", keyframe.get("player_units_visible", []),
+                   state.get("player_units_visible", []), ("id", "type_id", "position", "reachable"))
+
+    resources = ia.get("resources", {}) or {}
+    delta["resources"] = resources
+    before = ((previous or keyframe).get("ia", {}).get("resources", {})) or {}
+    resource_delta = {name: amount - before.get(name, 0) for name, amount in resources.items()
+                      if isinstance(amount, (int, float)) and amount != before.get(name, 0)}
+    if resource_delta:
+        delta["resources_delta"] = resource_delta
+    return delta
+
+
+def summarize_actions(turn, actions):
+    """One line per action of the AI's last turn"""
+    if not actions:
+        return f"Turn {turn}: you took no actions."
+    lines = []
+    for action in actions[:SUMMARY_MAX_ACTIONS]:
+        if not isinstance(action, dict):
+            continue
+        parts = [str(action.get("type", "action"))]
+        for field in ("unit_id", "city_id", "action", "item_id", "building", "city_name", "target_unit_id"):
+            if action.get(field) is not None:
+                parts.append(str(action[field]))
+        if action.get("position") is not None:
+            parts.append(compact_json(action["position"]))
+        if action.get("target_position") is not None:
+            parts.append("-> " + compact_json(action["target_position"]))
+        lines.append(" ".join(parts))
+    if len(actions) > SUMMARY_MAX_ACTIONS:
+        lines.append(f"(+{len(actions) - SUMMARY_MAX_ACTIONS} more)")
+    return f"Turn {turn}: " + "; ".join(lines)
+
+
+class TurnMemory:
+    """Keyframe, last observation and last actions of one AI conversation"""
+
+    def __init__(self):
+        self.keyframe = None
+        self.keyframe_text = None
+        self.previous = None
+        self.summary = None
+        self.usage = deque(maxlen=USAGE_LOG_SIZE)
+
+    @property
+    def size(self):
+        """Characters held (counted in the conversation pool memory cap)"""
+        return len(self.keyframe_text or "") + len(self.summary or "")
+
+    def _needs_keyframe(self, state, delta_text, full_text):
+        keyframe = self.keyframe
+        if keyframe is None or keyframe.get("map_size") != state.get("map_size"):
+            return True
+        turn, keyframe_turn = state.get("turn") or 0, keyframe.get("turn") or 0
+        if turn <= keyframe_turn or turn - keyframe_turn >= AI_KEYFRAME_TURNS:
+            return True
+        return len(delta_text) > AI_DELTA_MAX_RATIO * len(full_text)
+
+    def build_messages(self, system_instructions, state, build_prompt):
+        """
+        Messages of an AI turn for the filtered state. build_prompt(state_text,
+        changes) returns the user message (changes is False for a full state).
+        Returns (messages, info) where info describes the turn for record().
+        """
+        full_text = compact_json(state)
+        delta_text = None
+        if self.keyframe is not None:
+            delta_text = compact_json(state_delta(self.keyframe, state, self.previous))
+
+        messages = [{"role": "system", "content": system_instructions}]
+        if delta_text is None or self._needs_keyframe(state, delta_text, full_text):
+            mode = "full"
+            self.keyframe, self.keyframe_text = state, full_text
+            prompt = build_prompt(full_text, False)
+        else:
+            mode = "delta"
+            messages.append({
+                "role": "user",
+                "content": f"Game state at turn {self.keyframe.get('turn')}:\n{self.keyframe_text}"
+            })
+            prompt = build_prompt(delta_text, True)
+
+        if self.summary:
+            prompt = f"Your last turn: {self.summary}\n{prompt}"
+        messages.append({"role": "user", "content": prompt})
+
+        info = {
+            "turn": state.get("turn"),
+            "mode": mode,
+            "state_tokens": estimate_tokens(full_text if mode == "full" else delta_text),
+            "full_state_tokens": estimate_tokens(full_text),
+            "estimated_prompt_tokens": sum(estimate_tokens(message["content"]) for message in messages),
+        }
+        self.previous = state
+        return messages, info
+
+    def played(self, turn, actions):
+        """
+        Remember the actions the AI plays this turn: the validated actions or
+        the local plan, not what the LLM answered (it may have been dropped)
+        """
+        self.summary = summarize_actions(turn, actions if isinstance(actions, list) else [])
+
+    def record(self, info, response, api_usage=None):
+        """Log the token counts of the LLM call of this turn"""
+        entry = dict(info)
+        entry["estimated_completion_tokens"] = estimate_tokens(response if isinstance(response, str) else "")
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            if api_usage and api_usage.get(field) is not None:
+                entry[field] = api_usage[field]
+        self.usage.append(entry)
+        print(f"AI turn {entry['turn']} ({entry['mode']}): state ~{entry['state_tokens']} tokens "
+              f"(full ~{entry['full_state_tokens']}), prompt ~{entry['estimated_prompt_tokens']} tokens, "
+              f"API prompt/completion: {entry.get('prompt_tokens', 'N/A')}/{entry.get('completion_tokens', 'N/A')}")
+        return entry
@@ -0,0 +1,408 @@
+"""
+Local AI planner.
+
+A deterministic, in-process AI turn that returns the same actions as the LLM
+(the format processAIActions in Map.svelte consumes) and follows the
+priorities of the IAProba system instructions:
+
+1. settlers found cities on the best known site they can reach (resource
+   tiles around it, away from other cities) when there are 20 wood and 15 stone
+2. units attack visible enemies in range they are expected to beat (no
+   attacks during a ceasefire)
+3. the other units explore: each one moves to the reachable tile that
+   reveals the most unknown tiles, or towards the nearest unknown tile
+4. idle cities build sawmill, quarry, farm (food under 100) and library,
+   research "medium" with a library, and train settlers and warriors
+
+It is used as the fast path for the difficulties in AI_LOCAL_DIFFICULTIES
+and as the fallback when the LLM does not answer within AI_LLM_DEADLINE
+seconds or answers without valid actions.
+"""
+import math
+import os
+
+import numpy as np
+
+from combat import damage_multiplier
+from database import get_building_types, get_troop_types
+from fog_of_war import UNIT_SIGHT_RADIUS, CITY_SIGHT_RADIUS
+from map_codec import layer_to_array, BITS
+from movement import MovementMap, search_reachable, remaining_movement, position_of, ATTACK_RANGE, WATER
+from spatial_index import build_spatial_index
+
+AI_LLM_DEADLINE = float(os.environ.get('AI_LLM_DEADLINE', '20'))
+AI_LOCAL_DIFFICULTIES = {difficulty.strip() for difficulty in
+                         os.environ.get('AI_LOCAL_DIFFICULTIES', 'easy').split(',') if difficulty.strip()}
+
+# Founding a city (IAProba system instructions)
+CITY_COST = {"wood": 20, "stone": 15}
+# No new city this close (Manhattan) to another one
+MIN_CITY_DISTANCE = 4
+# Site value: resource tiles count this much more than plain land around a city
+RESOURCE_SITE_WEIGHT = 3
+RESOURCE_TERRAIN = (2, 3, 4, 5)
+
+# Buildings in order of priority, farm only when food is low
+BUILD_ORDER = ("sawmill", "quarry", "farm", "library")
+LOW_FOOD = 100
+# Train a settler while there are fewer cities than this and no settler
+MAX_CITIES = 4
+# Military units per city
+MILITARY_PER_CITY = 2
+
+
+def uses_local_planner(game_state):
+    """Difficulties whose AI turns are planned locally only"""
+    return (game_state or {}).get("difficulty") in AI_LOCAL_DIFFICULTIES
+
+
+def has_actions(response):
+    """An LLM response that can be played (a dict with an actions list and no error)"""
+    return isinstance(response, dict) and "error" not in response and isinstance(response.get("actions"), list)
+
+
+def box_sums(mask, radius):
+    """Number of masked tiles in the (2 * radius + 1) square around every tile"""
+    height, width = mask.shape
+    padded = np.zeros((height + 1, width + 1), dtype=np.int32)
+    padded[1:, 1:] = np.cumsum(np.cumsum(mask, axis=0, dtype=np.int32), axis=1)
+    ys = np.arange(height)
+    xs = np.arange(width)
+    y0, y1 = np.clip(ys - radius, 0, height), np.clip(ys + radius + 1, 0, height)
+    x0, x1 = np.clip(xs - radius, 0, width), np.clip(xs + radius + 1, 0, width)
+    return (padded[y1][:, x1] - padded[y0][:, x1] - padded[y1][:, x0] + padded[y0][:, x0])
+
+
+def expected_blows(attacker, defender):
+    """Average blows the attacker needs to kill the defender (a roll averages 1x attack)"""
+    damage = (attacker.get("attack") or 0) * damage_multiplier(defender.get("defense"))
+    if damage <= 0:
+        return math.inf
+    return math.ceil((defender.get("health") or 0) / damage)
+
+
+def unit_reference(unit):
+    """unit_id of an action: the unit id, or its type (processAIActions matches it with the position)"""
+    return unit.get("id") if unit.get("id") is not None else unit.get("type_id")
+
+
+def ids_of(items, field):
+    """Set of the ids of a list of dicts (or of plain ids)"""
+    return {item.get(field) if isinstance(item, dict) else item for item in items or []}
+
+
+class TurnState:
+    """
+    Copy of the AI side of a game state at the start of its turn: units with
+    their full movement (or the movement they have left, new_turn=False),
+    occupancy (spatial index), known tiles and resources.
+    Planning or checking actions updates the copy, never the game state.
+    """
+
+    def __init__(self, game_state, new_turn=True):
+        map_size = game_state.get("map_size", {})
+        self.width, self.height = map_size.get("width", 0), map_size.get("height", 0)
+        shape = (self.height, self.width)
+
+        terrain = game_state.get("map_data", {}).get("terrain")
+        if terrain is None or not len(terrain):
+            self.terrain = np.zeros(shape, dtype=np.uint8)
+        else:
+            self.terrain = layer_to_array(terrain, self.width, self.height)[:self.height, :self.width]
+
+        ia = game_state.get("ia", {})
+        fog_grid = ia.get("fog_grid")
+        self.known = np.zeros(shape, dtype=bool)
+        if fog_grid is not None and len(fog_grid):
+            self.known = layer_to_array(fog_grid, self.width, self.height, BITS)[:self.height, :self.width] == 1
+
+        # New turn: every unit has its full movement (copies, the state is not modified)
+        if new_turn:
+            self.units = [dict(unit, remainingMovement=unit.get("movement", 2), status="ready")
+                          for unit in ia.get("units", []) if unit.get("position")]
+        else:
+            self.units = [dict(unit, status=unit.get("status") or "ready")
+                          for unit in ia.get("units", []) if unit.get("position")]
+        self.cities = list(ia.get("cities", []))
+        self.enemies = [unit for unit in game_state.get("player", {}).get("units", [])
+                        if unit.get("position") and self._is_known(position_of(unit))]
+        self.resources = dict(ia.get("resources") or {})
+        self.technologies = ids_of(ia.get("technologies"), "id")
+        self.ceasefire = (game_state.get("ceasefire_turns") or 0) > 0
+
+        plan_game = {
+            "map_size": {"width": self.width, "height": self.height},
+            "map_data": {"terrain": self.terrain},
+            "ia": {"units": self.units, "cities": self.cities},
+            "player": {"units": self.enemies, "cities": game_state.get("player", {}).get("cities", [])},
+        }
+        self.index = build_spatial_index(plan_game)
+        self.map = MovementMap(plan_game, "ia", index=self.index)
+        self.city_positions = [position_of(city) for side in ("ia", "player")
+                               for city in plan_game[side]["cities"] if city.get("position")]
+
+        self.founded = set()
+
+    def _is_known(self, tile):
+        x, y = tile
+        return 0 <= x < self.width and 0 <= y < self.height and self.known[y, x]
+
+    def _reveal(self, tile, radius=UNIT_SIGHT_RADIUS):
+        x, y = tile
+        self.known[max(0, y - radius):y + radius + 1, max(0, x - radius):x + radius + 1] = True
+
+    def destinations(self, unit):
+        """{tile: cost} of the tiles a unit can end its move on, its own tile included"""
+        start = position_of(unit)
+        visited = search_reachable(self.map, start, remaining_movement(unit))
+        tiles = {tile: cost for tile, (cost, _) in visited.items() if self.map.can_stop(*tile)}
+        tiles[start] = 0
+        return tiles
+
+    def remove_unit(self, player_type, tile):
+        """A unit of a player on a tile is gone (e.g. it lost a fight)"""
+        entries = self.index.units.get(tuple(tile), ())
+        unit = next((other for owner, other in entries if owner == player_type), None)
+        if unit is None:
+            return
+        self.index.remove_unit(player_type, unit)
+        if player_type == "ia":
+            self.units = [other for other in self.units if other is not unit]
+        else:
+            self.enemies = [other for other in self.enemies if other is not unit]
+
+    def can_afford(self, cost):
+        return all(self.resources.get(resource, 0) >= amount for resource, amount in (cost or {}).items())
+
+    def spend(self, cost):
+        for resource, amount in (cost or {}).items():
+            self.resources[resource] = self.resources.get(resource, 0) - amount
+
+    def move(self, unit, tile, cost):
+        """Move a unit that can reach tile for cost movement points. Returns its movement action"""
+        start = position_of(unit)
+        before = {"position": list(start), "remainingMovement": remaining_movement(unit), "status": unit["status"]}
+        self.index.move_unit("ia", unit, start, tile)
+        unit["position"] = list(tile)
+        unit["remainingMovement"] = before["remainingMovement"] - cost
+        unit["status"] = "exhausted" if unit["remainingMovement"] <= 0 else "moved"
+        self._reveal(tile)
+        return {
+            "type": "movement",
+            "unit_id": unit_reference(unit),
+            "position": list(start),
+            "target_position": list(tile),
+            "state_before": before,
+            "state_after": {"position": list(tile), "remainingMovement": unit["remainingMovement"],
+                            "status": unit["status"]},
+        }
+
+    def found_city(self, settler, name=None):
+        """Found a city with a settler on its tile (pays CITY_COST). Returns the construction action"""
+        tile = position_of(settler)
+        self.spend(CITY_COST)
+        self.founded.add(id(settler))
+        self.city_positions.append(tile)
+        city = {"name": name or f"IA Hiria {len(self.city_positions)}", "position": list(tile), "buildings": []}
+        self.index.remove_unit("ia", settler)
+        self.index.add_city("ia", city)
+        self.cities.append(city)
+        self._reveal(tile, CITY_SIGHT_RADIUS)
+        settler["status"] = "exhausted"
+        settler["remainingMovement"] = 0
+        return {
+            "type": "construction",
+            "building": "city",
+            "unit_id": unit_reference(settler),
+            "position": list(tile),
+            "city_name": city["name"],
+        }
+
+    def attack(self, unit, target):
+        """Attack of a unit on an enemy unit (the unit is exhausted). Returns the attack action"""
+        before = {"position": list(position_of(unit)), "remainingMovement": remaining_movement(unit),
+                  "status": unit["status"]}
+        unit["remainingMovement"] = 0
+        unit["status"] = "exhausted"
+        action = {
+            "type": "attack",
+            "unit_id": unit_reference(unit),
+            "position": list(position_of(unit)),
+            "target_position": list(position_of(target)),
+            "state_before": before,
+            "state_after": {"position": list(position_of(unit)), "remainingMovement": 0, "status": "exhausted"},
+        }
+        if target.get("id") is not None:
+            action["target_unit_id"] = target["id"]
+        return action
+
+
+class TurnPlanner(TurnState):
+    """Plans one AI turn on a copy of the game state"""
+
+    def __init__(self, game_state):
+        super().__init__(game_state)
+        land = self.terrain != WATER
+        resource = np.isin(self.terrain, RESOURCE_TERRAIN)
+        self.site_value = box_sums(self.known & land, CITY_SIGHT_RADIUS - 1) + \
+            (RESOURCE_SITE_WEIGHT - 1) * box_sums(self.known & resource, CITY_SIGHT_RADIUS - 1)
+        self.actions = []
+
+    def unknown_counts(self, tiles):
+        """{tile: unknown tiles a unit would reveal from it}, computed on the window around the tiles"""
+        xs, ys = [tile[0] for tile in tiles], [tile[1] for tile in tiles]
+        x0, y0 = max(0, min(xs) - UNIT_SIGHT_RADIUS), max(0, min(ys) - UNIT_SIGHT_RADIUS)
+        x1 = min(self.width, max(xs) + UNIT_SIGHT_RADIUS + 1)
+        y1 = min(self.height, max(ys) + UNIT_SIGHT_RADIUS + 1)
+        counts = box_sums(~self.known[y0:y1, x0:x1], UNIT_SIGHT_RADIUS)
+        return {tile: int(counts[tile[1] - y0, tile[0] - x0]) for tile in tiles}
+
+    def move_unit(self, unit, tile, cost):
+        if tile != position_of(unit):
+            self.actions.append(self.move(unit, tile, cost))
+
+    # --- 1. Cities ---
+
+    def valid_site(self, tile):
+        x, y = tile
+        if not self._is_known(tile) or self.terrain[y, x] == WATER:
+            return False
+        return all(abs(x - cx) + abs(y - cy) >= MIN_CITY_DISTANCE for cx, cy in self.city_positions)
+
+    def found_cities(self):
+        for settler in [unit for unit in self.units if unit.get("type_id") == "settler"]:
+            tiles = self.destinations(settler)
+            sites = [tile for tile in tiles if self.valid_site(tile)]
+            if not sites:
+                continue
+            best = max(sites, key=lambda tile: (self.site_value[tile[1], tile[0]], -tiles[tile], -tile[1], -tile[0]))
+            self.move_unit(settler, best, tiles[best])
+            if self.can_afford(CITY_COST):
+                self.actions.append(self.found_city(settler))
+
+    # --- 2. Attacks ---
+
+    def attack_enemies(self):
+        if self.ceasefire:
+            return
+        attacked = set()
+        for unit in self.units:
+            if unit.get("type_id") == "settler" or remaining_movement(unit) <= 0:
+                continue
+            targets = [enemy for enemy in self.index.units_within("player", position_of(unit), ATTACK_RANGE)
+                       if id(enemy) not in attacked and self._is_known(position_of(enemy))]
+            scored = [(expected_blows(enemy, unit) - expected_blows(unit, enemy), enemy) for enemy in targets]
+            scored = [(score, enemy) for score, enemy in scored if score >= 0]
+            if not scored:
+                continue
+            _, target = max(scored, key=lambda pair: pair[0])
+            attacked.add(id(target))
+            self.actions.append(self.attack(unit, target))
+
+    # --- 3. Exploration ---
+
+    def nearest_goal(self, start):
+        """Nearest unknown tile, else the nearest visible enemy (Manhattan), or None"""
+        x, y = start
+        # Growing windows: a tile outside a window of radius r is farther than r
+        radius = 2 * UNIT_SIGHT_RADIUS + 1
+        while True:
+            x0, y0 = max(0, x - radius), max(0, y - radius)
+            window = self.known[y0:y + radius + 1, x0:x + radius + 1]
+            ys, xs = np.nonzero(~window)
+            if len(xs):
+                distances = np.abs(xs + x0 - x) + np.abs(ys + y0 - y)
+                nearest = int(np.argmin(distances))
+                if distances[nearest] <= radius or window.shape == self.known.shape:
+                    return int(xs[nearest]) + x0, int(ys[nearest]) + y0
+            elif window.shape == self.known.shape:
+                break
+            radius *= 2
+        if self.enemies:
+            return min((position_of(enemy) for enemy in self.enemies),
+                       key=lambda tile: (abs(tile[0] - x) + abs(tile[1] - y), tile[1], tile[0]))
+        return None
+
+    def explore(self):
+        for unit in self.units:
+            if unit.get("type_id") == "settler" or remaining_movement(unit) <= 0:
+                continue
+            tiles = self.destinations(unit)
+            counts = self.unknown_counts(tiles)
+            best = max(tiles, key=lambda tile: (counts[tile], tiles[tile], -tile[1], -tile[0]))
+            if counts[best] == 0:
+                goal = self.nearest_goal(position_of(unit))
+                if goal is None:
+                    continue
+                best = min(tiles, key=lambda tile: (abs(tile[0] - goal[0]) + abs(tile[1] - goal[1]),
+                                                    tiles[tile], tile[1], tile[0]))
+            self.move_unit(unit, best, tiles[best])
+
+    # --- 4. City production ---
+
+    def production_for(self, city, settlers, military):
+        """(action, item_id) of the next production of an idle city, or None"""
+        buildings = ids_of(city.get("buildings"), "type_id")
+        building_costs = {building["type_id"]: building.get("cost") for building in get_building_types()}
+        for building in BUILD_ORDER:
+            if building in buildings or (building == "farm" and self.resources.get("food", 0) >= LOW_FOOD):
+                continue
+            if self.can_afford(building_costs.get(building)):
+                self.spend(building_costs.get(building))
+                return "build", building
+        if "library" in buildings and "medium" not in self.technologies and not city.get("research"):
+            self.technologies.add("medium")
+            return "research", "medium"
+
+        troop_costs = {troop["type_id"]: troop.get("cost") for troop in get_troop_types()}
+        if settlers == 0 and len(self.city_positions) < MAX_CITIES:
+            troop = "settler"
+        elif military < MILITARY_PER_CITY * max(1, len(self.cities)):
+            troop = "warrior"
+        else:
+            return None
+        if self.can_afford(troop_costs.get(troop)):
+            self.spend(troop_costs.get(troop))
+            return "train", troop
+        return None
+
+    def manage_cities(self):
+        settlers = sum(1 for unit in self.units if unit.get("type_id") == "settler" and id(unit) not in self.founded)
+        military = sum(1 for unit in self.units if unit.get("type_id") != "settler")
+        for city in self.cities:
+            production = city.get("production") or {}
+            if production.get("current_item") and (production.get("turns_remaining") or 0) > 0:
+                continue
+            choice = self.production_for(city, settlers, military)
+            if choice is None:
+                continue
+            action, item_id = choice
+            settlers += item_id == "settler"
+            military += action == "train" and item_id != "settler"
+            self.actions.append({
+                "type": "city_production",
+                "city_id": city.get("id") or city.get("name"),
+                "action": action,
+                "item_id": item_id,
+                "position": list(position_of(city)),
+            })
+
+    def plan(self):
+        self.found_cities()
+        self.attack_enemies()
+        self.explore()
+        self.manage_cities()
+        counts = {}
+        for action in self.actions:
+            counts[action["type"]] = counts.get(action["type"], 0) + 1
+        summary = ", ".join(f"{count} {kind}" for kind, count in counts.items()) or "no actions"
+        return {
+            "actions": self.actions,
+            "reasoning": f"Local plan: expand and explore ({summary})",
+            "planner": "local",
+        }
+
+
+def plan_turn(game_state):
+    """AI actions of one turn, planned locally"""
+    return TurnPlanner(game_state or {}).plan()
@@ -0,0 +1,100 @@
+"""
+Incremental parsing of streamed AI responses.
+
+The LLM answers with one JSON object such as {"actions": [{...}, {...}], ...},
+usually after some text. ActionStreamParser reads the response chunk by
+chunk as it is generated and returns every element of the top-level
+"actions" array as soon as its closing bracket arrives, so the first action
+can be shown before the model has finished writing the rest.
+"""
+import json
+
+# Parser states
+BEFORE_OBJECT = 0   # text before the first {
+IN_OBJECT = 1       # inside the top-level object, outside "actions"
+IN_ACTIONS = 2      # inside the "actions" array
+FINISHED = 3        # the top-level object is closed
+
+
+class ActionStreamParser:
+    """
+    Feed chunks of the response with feed(); it returns the actions completed
+    by that chunk. text holds everything received so far.
+    """
+
+    def __init__(self, key="actions"):
+        self.key = key
+        self.text = ""
+        self.state = BEFORE_OBJECT
+        self.depth = 0           # bracket depth ({ and [) from the top-level object
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_string = None  # last string closed at depth 1 (candidate key)
+        self.element_start = None
+        self.actions_count = 0
+        self._pos = 0
+
+    def feed(self, chunk):
+        """Add a chunk of the response. Returns the list of actions it completed."""
+        self.text += chunk
+        completed = []
+        text = self.text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self.state in (BEFORE_OBJECT, FINISHED):
+                if char == "{" and self.state == BEFORE_OBJECT:
+                    self.state = IN_OBJECT
+                    self.depth = 1
+                continue
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_string = text[self.string_start:pos + 1]
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = pos
+            elif char in "{[":
+                self.depth += 1
+                if self.state == IN_OBJECT and char == "[" and self.depth == 2 and self._is_actions_key():
+                    self.state = IN_ACTIONS
+                elif self.state == IN_ACTIONS and self.depth == 3:
+                    self.element_start = pos
+            elif char in "}]":
+                self.depth -= 1
+                if self.state == IN_ACTIONS and self.depth == 2 and self.element_start is not None:
+                    completed.extend(self._emit(text[self.element_start:pos + 1]))
+                    self.element_start = None
+                elif self.state == IN_ACTIONS and self.depth == 1:
+                    self.state = IN_OBJECT
+                elif self.depth == 0:
+                    self.state = FINISHED
+            elif char == "," and self.depth == 1:
+                self.last_string = None
+        self._pos = len(text)
+        return completed
+
+    def _is_actions_key(self):
+        if self.last_string is None:
+            return False
+        try:
+            return json.loads(self.last_string) == self.key
+        except json.JSONDecodeError:
+            return False
+
+    def _emit(self, element):
+        try:
+            action = json.loads(element)
+        except json.JSONDecodeError:
+            print(f"Skipping malformed streamed action: {element[:100]}")
+            return []
+        self.actions_count += 1
+        return [action]
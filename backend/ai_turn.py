@@ -0,0 +1,209 @@
+"""
+Server-side application of an AI turn.
+
+apply_ai_turn plays a list of AI actions (the format processAIActions in
+Map.svelte consumes) on the stored game in one pass, instead of the browser
+mutating its copy action by action and uploading the whole game afterwards:
+
+- every action is checked with ai_validator.ActionValidator right before it is
+  applied (invalid ones are repaired or skipped, with their reason)
+- movement: the unit walks its path and the AI's fog of war is updated
+  incrementally (movement.move_unit)
+- attacks are resolved on the server (combat.fight); the health reported by
+  the LLM is ignored
+- cities are founded by settlers (CITY_COST is paid, the settler is removed)
+- productions and research start and are scheduled (scheduler.py), their
+  cost is paid
+
+The turn is applied to a working copy of the game. The stored game is
+replaced by it only when the whole turn was applied, so a failure leaves the
+game as it was. The result is a compact list of events, in order, for the
+client to animate. Units without id (build_game creates the AI's first units
+without one) are named by their type, as in the actions (unit_reference); the
+client finds them on the first tile of the path, "from" or the city position.
+"""
+import copy
+import uuid
+
+from ai_planner import CITY_COST, unit_reference
+from ai_validator import ActionValidator
+from combat import fight, remove_unit
+from database import get_building_type, get_troop_type, get_technology_type
+from economy import DEFAULT_CITY_AREA
+from fog_of_war import add_sight_source, CITY_SIGHT_RADIUS
+from movement import find_unit, move_unit, position_of
+from scheduler import schedule_timer, PRODUCTION, RESEARCH, SCHEDULE_FIELD
+from spatial_index import get_spatial_index
+from turns import EMPTY_PRODUCTION
+
+# Big per-player layers, copied row by row instead of deep copied
+LAYER_FIELDS = ("fog_grid", "visible_grid")
+
+
+class AITurnError(Exception):
+    """An AI turn could not be applied (the game is left unchanged)"""
+
+
+def copy_layer(layer):
+    if hasattr(layer, "copy") and not isinstance(layer, list):
+        return layer.copy()
+    return [list(row) for row in layer]
+
+
+def working_copy(game):
+    """Copy of a game that an AI turn can modify (the map is shared, it is never modified)"""
+    work = dict(game)
+    for player_type in ("player", "ia"):
+        side = game.get(player_type)
+        if side is None:
+            continue
+        work[player_type] = copy.deepcopy({key: value for key, value in side.items() if key not in LAYER_FIELDS})
+        for field in LAYER_FIELDS:
+            if side.get(field) is not None:
+                work[player_type][field] = copy_layer(side[field])
+    if SCHEDULE_FIELD in game:
+        work[SCHEDULE_FIELD] = [list(event) for event in game[SCHEDULE_FIELD]]
+    return work
+
+
+def game_unit(game, player_type, unit_id, position):
+    """Unit of the game by id, else by position (actions name units without id by their type)"""
+    unit = find_unit(game, player_type, unit_id=unit_id) if unit_id is not None else None
+    return unit or find_unit(game, player_type, position=position)
+
+
+def game_city(game, city_id, position):
+    for city in game["ia"].get("cities", []):
+        if city_id in (city.get("id"), city.get("name")):
+            return city
+    for city in game["ia"].get("cities", []):
+        if city.get("position") and list(position_of(city)) == list(position):
+            return city
+    return None
+
+
+def pay(game, cost):
+    resources = game["ia"].setdefault("resources", {})
+    for resource, amount in (cost or {}).items():
+        resources[resource] = resources.get(resource, 0) - amount
+
+
+def apply_movement(game, action):
+    unit = game_unit(game, "ia", action.get("unit_id"), action["position"])
+    if unit is None:
+        raise AITurnError(f"Unit not found at {action['position']}")
+    result, error = move_unit(game, "ia", unit, action["target_position"])
+    if error:
+        raise AITurnError(error)
+    return {"type": "move", "unit_id": unit_reference(unit), "path": result["path"],
+            "remainingMovement": result["remainingMovement"]}
+
+
+def apply_attack(game, validator, action):
+    """Attack event, or None if the target cannot be attacked (not visible now)"""
+    attacker = game_unit(game, "ia", action.get("unit_id"), action["position"])
+    defender = game_unit(game, "player", action.get("target_unit_id"), action["target_position"])
+    if attacker is None or defender is None:
+        raise AITurnError(f"Unit not found for the attack from {action['position']}")
+    result, error = fight(game, "ia", attacker, defender)
+    if error:
+        return None
+    # The validator's copy follows the real outcome
+    if result["winner"] == "attacker":
+        validator.remove_unit("player", result["defender_position"])
+    elif result["winner"] == "defender":
+        validator.remove_unit("ia", result["attacker_position"])
+    return {"type": "attack", "unit_id": unit_reference(attacker), "target_id": unit_reference(defender),
+            "from": result["attacker_position"], "target": result["defender_position"],
+            "winner": result["winner"], "attacker_health": result["attacker_health"],
+            "defender_health": result["defender_health"], "blows": result["blows"]}
+
+
+def apply_city(game, action):
+    settler = game_unit(game, "ia", action.get("unit_id"), action["position"])
+    if settler is None:
+        raise AITurnError(f"Settler not found at {action['position']}")
+    position = list(position_of(settler))
+    city = {
+        "id": f"city_{uuid.uuid4().hex[:12]}",
+        "name": action.get("city_name") or f"IA Hiria {len(game['ia'].get('cities', [])) + 1}",
+        "position": position,
+        "owner": "ia",
+        "population": 1,
+        "area": DEFAULT_CITY_AREA,
+        "buildings": [],
+        "production": dict(EMPTY_PRODUCTION),
+    }
+    remove_unit(game, "ia", settler)
+    add_sight_source(game, "ia", position, CITY_SIGHT_RADIUS)
+    get_spatial_index(game).add_city("ia", city)
+    game["ia"].setdefault("cities", []).append(city)
+    pay(game, CITY_COST)
+    return {"type": "city", "unit_id": unit_reference(settler), "position": position,
+            "city_id": city["id"], "name": city["name"]}
+
+
+def apply_production(game, action):
+    city = game_city(game, action.get("city_id"), action["position"])
+    if city is None:
+        raise AITurnError(f"City {action.get('city_id')} not found")
+    kind, item_id = action["action"], action["item_id"]
+    if kind == "research":
+        turns = get_technology_type(item_id)["turns"]
+        city["research"] = {"current_technology": item_id, "turns_remaining": turns}
+        schedule_timer(game, "ia", city, RESEARCH)
+    else:
+        item = get_building_type(item_id) if kind == "build" else get_troop_type(item_id, [0, 0])
+        turns = item.get("turns") or 1
+        city["production"] = {
+            "current_item": item_id,
+            "turns_remaining": turns,
+            "itemType": "building" if kind == "build" else "troop",
+            "production_type": kind,
+        }
+        pay(game, item.get("cost"))
+        schedule_timer(game, "ia", city, PRODUCTION)
+    return {"type": "production", "city_id": city.get("id") or city.get("name"),
+            "action": kind, "item_id": item_id, "turns": turns}
+
+
+def apply_ai_turn(game, actions):
+    """
+    Apply AI actions to a copy of the game.
+    Returns (game, result): the updated copy to store and {"events",
+    "rejected", "repaired", "resources"}. Raises AITurnError if the turn cannot
+    be applied.
+    """
+    work = working_copy(game)
+    validator = ActionValidator(work, new_turn=False)
+    # Fights are resolved here, not with the health the LLM reported
+    actions = [{key: value for key, value in action.items() if key not in ("state_after", "target_state_after")}
+               if isinstance(action, dict) and action.get("type") == "attack" else action
+               for action in actions]
+
+    result = {"events": [], "rejected": [], "repaired": []}
+    for index, (action, checked, reason) in enumerate(validator.replay(actions)):
+        kind = action.get("type") if isinstance(action, dict) else None
+        if checked is None:
+            result["rejected"].append({"index": index, "type": kind, "reason": reason, "action": action})
+            continue
+
+        if kind == "movement":
+            event = apply_movement(work, checked)
+        elif kind == "attack":
+            event = apply_attack(work, validator, checked)
+            if event is None:
+                result["rejected"].append({"index": index, "type": kind, "reason": "target not visible",
+                                           "action": action})
+                continue
+        elif kind == "construction":
+            event = apply_city(work, checked)
+        else:
+            event = apply_production(work, checked)
+
+        if reason:
+            result["repaired"].append({"index": index, "type": kind, "reason": reason})
+        result["events"].append(event)
+
+    result["resources"] = work["ia"].get("resources", {})
+    return work, result
@@ -0,0 +1,325 @@
+"""
+Validation and repair of the AI actions.
+
+The LLM plans a whole turn at once and often breaks the rules: moves into
+water, out of the map, onto occupied tiles or beyond the unit's movement,
+attacks during a ceasefire, cities or productions it cannot pay. The actions
+are checked on the server against a copy of the game state (ai_planner.TurnState)
+before they reach the client:
+
+1. the target tiles of all the actions are checked at once with numpy
+   (well formed, inside the map, water)
+2. the actions are replayed in order, so each one sees the units moved, the
+   cities founded and the resources spent by the previous ones
+
+Invalid actions are repaired when possible and dropped otherwise:
+- a move to a tile the unit cannot end its move on this turn (water,
+  occupied, too far) is clamped to the reachable tile nearest to the target
+- units, cities, positions and state_before/state_after are rewritten from
+  the replay (processAIActions finds the units with them)
+- the health the LLM reports after an attack is clamped to the units' health
+
+Every dropped or repaired action is reported with its reason.
+"""
+import numpy as np
+
+from ai_planner import TurnState, CITY_COST, ids_of
+from database import get_building_type, get_troop_type, get_technology_type
+from movement import position_of, remaining_movement, ATTACK_RANGE, WATER
+
+ACTION_TYPES = ("movement", "attack", "construction", "city_production")
+PRODUCTION_ACTIONS = ("build", "train", "research")
+
+# Field with the tile an action targets
+TARGET_FIELDS = {"movement": "target_position", "attack": "target_position", "construction": "position"}
+
+
+def as_tile(value):
+    """(x, y) of a [x, y] or {"x", "y"} position, or None if it is not one"""
+    if isinstance(value, dict):
+        value = [value.get("x"), value.get("y")]
+    if not isinstance(value, (list, tuple)) or len(value) < 2:
+        return None
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) and float(v).is_integer() for v in value[:2]):
+        return None
+    return int(value[0]), int(value[1])
+
+
+def distance(a, b):
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+def production_busy(city):
+    production = city.get("production") or {}
+    return bool(production.get("current_item")) and (production.get("turns_remaining") or 0) > 0
+
+
+def research_busy(city):
+    research = city.get("research") or {}
+    return bool(research.get("current_technology")) and (research.get("turns_remaining") or 0) > 0
+
+
+class ActionValidator(TurnState):
+    """Checks the actions of one AI turn, in order, on a copy of the game state"""
+
+    def __init__(self, game_state, new_turn=True):
+        super().__init__(game_state, new_turn)
+        self.technologies.add("basic")
+        self.producing = set()
+        self.researching = set()
+
+    # --- 1. Target tiles (all the actions at once) ---
+
+    def check_tiles(self, actions):
+        """
+        (reason, on_water) of the target tile of every action: reason to drop it
+        (unknown type, malformed or outside the map) or None
+        """
+        checks = [(None, False)] * len(actions)
+        indices, tiles = [], []
+        for i, action in enumerate(actions):
+            if not isinstance(action, dict) or action.get("type") not in ACTION_TYPES:
+                checks[i] = ("unknown action type", False)
+                continue
+            field = TARGET_FIELDS.get(action["type"])
+            if field is None or action.get(field) is None:
+                continue
+            tile = as_tile(action[field])
+            if tile is None:
+                checks[i] = (f"{field} must be [x, y]", False)
+            else:
+                indices.append(i)
+                tiles.append(tile)
+        if not tiles:
+            return checks
+
+        xs, ys = np.array(tiles, dtype=np.int64).T
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        water = np.zeros(len(tiles), dtype=bool)
+        water[inside] = self.terrain[ys[inside], xs[inside]] == WATER
+        for i, is_inside, on_water in zip(indices, inside.tolist(), water.tolist()):
+            checks[i] = (None if is_inside else "target outside the map", on_water)
+        return checks
+
+    # --- 2. Replay ---
+
+    def find_unit(self, action, type_id=None):
+        """AI unit of an action: by id, else the unit on its position (of the type of unit_id if several)"""
+        unit_id = action.get("unit_id")
+        for unit in self.units:
+            if unit_id is not None and unit.get("id") == unit_id and id(unit) not in self.founded:
+                if type_id is None or unit.get("type_id") == type_id:
+                    return unit
+        tile = as_tile(action.get("position"))
+        if tile is None:
+            return None
+        candidates = [unit for owner, unit in self.index.units.get(tile, ()) if owner == "ia"
+                      and (type_id is None or unit.get("type_id") == type_id)]
+        if len(candidates) > 1:
+            candidates = [unit for unit in candidates if unit.get("type_id") == unit_id] or candidates
+        return candidates[0] if candidates else None
+
+    def find_target(self, action):
+        """Visible enemy unit of an attack: by target_unit_id, else the one on target_position"""
+        target_id = action.get("target_unit_id")
+        if target_id is not None:
+            for enemy in self.enemies:
+                if enemy.get("id") == target_id:
+                    return enemy
+        tile = as_tile(action.get("target_position"))
+        if tile is None:
+            return None
+        return next((unit for owner, unit in self.index.units.get(tile, ()) if owner == "player"), None)
+
+    def find_city(self, action):
+        city_id = action.get("city_id")
+        tile = as_tile(action.get("position"))
+        for city in self.cities:
+            if city_id is not None and city_id in (city.get("id"), city.get("name")):
+                return city
+        for city in self.cities:
+            if tile is not None and city.get("position") and position_of(city) == tile:
+                return city
+        return None
+
+    def check_movement(self, action, on_water):
+        unit = self.find_unit(action)
+        if unit is None:
+            return None, "unit not found"
+        if remaining_movement(unit) <= 0:
+            return None, "unit has no movement left"
+        start = position_of(unit)
+        target = as_tile(action.get("target_position"))
+        if target is None:
+            return None, "target_position must be [x, y]"
+        if target == start:
+            return None, "unit is already on the target tile"
+
+        repairs = []
+        if as_tile(action.get("position")) != start:
+            repairs.append(f"unit is on {list(start)}")
+        tiles = self.destinations(unit)
+        if target not in tiles:
+            if on_water:
+                problem = "target on water"
+            elif self.index.grid[target[1], target[0]]:
+                problem = "target occupied"
+            else:
+                problem = "target not reachable this turn"
+            best = min(tiles, key=lambda tile: (distance(tile, target), tiles[tile], tile[1], tile[0]))
+            if distance(best, target) >= distance(start, target):
+                return None, problem
+            repairs.append(f"{problem}, moved to {list(best)} instead")
+            target = best
+        return {**action, **self.move(unit, target, tiles[target])}, "; ".join(repairs) or None
+
+    def check_attack(self, action):
+        if self.ceasefire:
+            return None, "ceasefire"
+        unit = self.find_unit(action)
+        if unit is None:
+            return None, "unit not found"
+        if remaining_movement(unit) <= 0:
+            return None, "unit has no movement left"
+        target = self.find_target(action)
+        if target is None:
+            return None, "target not found"
+        if distance(position_of(unit), position_of(target)) > ATTACK_RANGE:
+            return None, "target out of range"
+
+        repairs = []
+        if as_tile(action.get("position")) != position_of(unit):
+            repairs.append(f"unit is on {list(position_of(unit))}")
+        checked = {**action, **self.attack(unit, target)}
+        # Health reported by the LLM, never above what the units have
+        for field, fighter in (("state_after", unit), ("target_state_after", target)):
+            reported = (action.get(field) or {}).get("health")
+            if not isinstance(reported, (int, float)) or isinstance(reported, bool):
+                continue
+            health = min(max(reported, 0), fighter.get("health", 0))
+            if health != reported:
+                repairs.append(f"{field} health clamped to {health}")
+            checked[field] = {**checked.get(field, {}), "health": health}
+        if checked.get("target_state_after", {}).get("health", 1) <= 0:
+            self.remove_unit("player", position_of(target))
+        return checked, "; ".join(repairs) or None
+
+    def check_construction(self, action):
+        if action.get("building", "city") != "city":
+            return None, "only cities can be founded"
+        settler = self.find_unit(action, "settler")
+        if settler is None:
+            return None, "settler not found"
+        tile = position_of(settler)
+        if self.index.city_at(*tile):
+            return None, "there is already a city on the tile"
+        if not self.can_afford(CITY_COST):
+            return None, "not enough resources for a city"
+        repair = None if as_tile(action.get("position")) == tile else f"city founded on the settler's tile {list(tile)}"
+        return {**action, **self.found_city(settler, action.get("city_name"))}, repair
+
+    def check_production(self, action):
+        city = self.find_city(action)
+        if city is None:
+            return None, "city not found"
+        kind, item_id = action.get("action"), action.get("item_id")
+        if kind not in PRODUCTION_ACTIONS:
+            return None, "action must be build, train or research"
+
+        if kind == "research":
+            technology = get_technology_type(item_id)
+            if technology is None:
+                return None, "unknown technology"
+            if item_id in self.technologies:
+                return None, "technology already known"
+            if research_busy(city) or id(city) in self.researching:
+                return None, "city is already researching"
+            if "library" not in ids_of(city.get("buildings"), "type_id"):
+                return None, "city needs a library to research technologies"
+            missing = [tech for tech in technology.get("prerequisites", []) if tech not in self.technologies]
+            if missing:
+                return None, f"missing prerequisite technology: {missing[0]}"
+            self.researching.add(id(city))
+            cost = None
+        else:
+            if production_busy(city) or id(city) in self.producing:
+                return None, "city is already producing"
+            if kind == "build":
+                item = get_building_type(item_id)
+                if item is None:
+                    return None, "unknown building"
+                if item_id in ids_of(city.get("buildings"), "type_id"):
+                    return None, "building already built"
+            else:
+                item = get_troop_type(item_id, [0, 0])
+                if item is None:
+                    return None, "unknown troop"
+            if item.get("technology", "basic") not in self.technologies:
+                return None, f"requires the {item.get('technology')} technology"
+            cost = item.get("cost")
+            if not self.can_afford(cost):
+                return None, "not enough resources"
+            self.producing.add(id(city))
+
+        self.spend(cost)
+        checked = {**action, "city_id": city.get("id") or city.get("name"), "position": list(position_of(city))}
+        repair = None if checked["city_id"] == action.get("city_id") else "city_id corrected"
+        return checked, repair
+
+    def _check(self, action, tiles):
+        reason, on_water = tiles
+        if reason:
+            return None, reason
+        kind = action["type"]
+        if kind == "movement":
+            return self.check_movement(action, on_water)
+        if kind == "attack":
+            return self.check_attack(action)
+        if kind == "construction":
+            return self.check_construction(action)
+        return self.check_production(action)
+
+    def check(self, action):
+        """
+        Check the next action of the turn (e.g. while streaming).
+        Returns (action, reason): the action, repaired if reason is set, or
+        (None, reason) if it was dropped.
+        """
+        return self._check(action, self.check_tiles([action])[0])
+
+    def replay(self, actions):
+        """
+        Check a list of actions one by one: yields (action, checked, reason)
+        per action, so the caller can act on each one before the next is checked
+        """
+        for action, tiles in zip(actions, self.check_tiles(actions)):
+            checked, reason = self._check(action, tiles)
+            yield action, checked, reason
+
+    def validate(self, actions):
+        """Check a list of actions: {"actions", "rejected", "repaired"}"""
+        result = {"actions": [], "rejected": [], "repaired": []}
+        for index, (action, checked, reason) in enumerate(self.replay(actions)):
+            kind = action.get("type") if isinstance(action, dict) else None
+            if checked is None:
+                result["rejected"].append({"index": index, "type": kind, "reason": reason, "action": action})
+                continue
+            if reason:
+                result["repaired"].append({"index": index, "type": kind, "reason": reason})
+            result["actions"].append(checked)
+        return result
+
+
+def validate_plan(game_state, response):
+    """
+    LLM response with its actions validated: invalid actions repaired or
+    removed, and listed in "rejected" and "repaired"
+    """
+    actions = response.get("actions")
+    if not isinstance(actions, list):
+        actions = []
+    checked = ActionValidator(game_state or {}).validate(actions)
+    if checked["rejected"] or checked["repaired"]:
+        print(f"AI actions: {len(checked['actions'])} valid, {len(checked['rejected'])} rejected, "
+              f"{len(checked['repaired'])} repaired")
+    return {**response, **checked}
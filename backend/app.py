@@ -8,11 +8,12 @@ from routes import (
     ia_blueprint,
     troop_blueprint,
     building_blueprint,
-    civilization_blueprint
+    civilization_blueprint,
+    combat_blueprint
 )
 # Import your technology blueprint
 from routes.technologyRoute import technology_blueprint
-from database import init_db, close_db
+from database import init_db, close_db, ping_db
 import os
 from bson import ObjectId
 import datetime
@@ -46,21 +47,6 @@ def before_request():
         session['username'] = None
         session['user'] = None
 
-# Convert ObjectID to string for all sessions
-@app.after_request
-def after_request(response):
-    # Manually clean any ObjectId in session to avoid serialization issues
-    if 'game' in session and session['game'] is not None:
-        # Convert ObjectId to string in game
-        session_game = session['game']
-        if isinstance(session_game, dict):
-            if 'map_id' in session_game and isinstance(session_game['map_id'], ObjectId):
-                session_game['map_id'] = str(session_game['map_id'])
-            # Recursively check for other ObjectIds in the game object
-    return response
-
-
-
 @app.teardown_appcontext
 def teardown_db(exception):
     close_db(exception)
@@ -77,8 +63,23 @@ app.register_blueprint(ia_blueprint)
 app.register_blueprint(troop_blueprint)
 app.register_blueprint(building_blueprint)
 app.register_blueprint(civilization_blueprint)
+app.register_blueprint(combat_blueprint)
 app.register_blueprint(technology_blueprint)
 
+# Health checks
+@app.route('/api/health', methods=['GET'])
+def health():
+    """Liveness probe: the worker process is up and serving requests"""
+    return jsonify({"status": "ok", "pid": os.getpid()}), 200
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: the worker can reach MongoDB through its connection pool"""
+    ok, detail = ping_db()
+    if ok:
+        return jsonify({"status": "ready", "mongo_ping_ms": detail}), 200
+    return jsonify({"status": "unavailable", "error": detail}), 503
+
 # Error handling
 @app.errorhandler(500)
 def handle_500_error(e):
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark: time of a local AI turn (ai_planner.plan_turn) at several map
+sizes, with part of the map explored, a few cities and enemies in sight.
+
+Usage:
+    python benchmarks/bench_ai_planner.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ai_planner import plan_turn
+from terrain_generator import generate_scatter_terrain
+
+# (width, height, AI units, AI cities)
+SCENARIOS = ((30, 15, 3, 0), (30, 15, 8, 2), (100, 100, 20, 5), (300, 300, 40, 10))
+EXPLORED = 0.3
+
+
+def game_state(width, height, units, cities, seed=11):
+    rng = np.random.default_rng(seed)
+    terrain = np.asarray(generate_scatter_terrain(width, height, "medium", seed), dtype=np.uint8)
+    fog = np.zeros((height, width), dtype=np.uint8)
+    fog[:, :max(1, int(width * EXPLORED))] = 1
+    land = np.argwhere((terrain != 1) & (fog == 1))
+    picks = rng.choice(len(land), size=units + cities + 4, replace=False)
+    tiles = [[int(x), int(y)] for y, x in land[picks]]
+    types = ("settler", "warrior", "archer", "cavalry")
+    return {
+        "turn": 12,
+        "difficulty": "easy",
+        "map_size": {"width": width, "height": height},
+        "map_data": {"terrain": terrain.tolist()},
+        "ia": {
+            "fog_grid": fog.tolist(),
+            "units": [{"id": f"ia-{i}", "type_id": types[i % len(types)], "position": tiles[i],
+                       "health": 100, "attack": 10, "defense": 8, "movement": 4 if i % 4 == 3 else 2}
+                      for i in range(units)],
+            "cities": [{"id": f"city-{i}", "name": f"City {i}", "position": tiles[units + i], "buildings": []}
+                       for i in range(cities)],
+            "resources": {"food": 300, "gold": 100, "wood": 200, "stone": 150, "iron": 0},
+        },
+        "player": {"units": [{"id": f"p-{i}", "type_id": "warrior", "position": tile,
+                              "health": 60, "attack": 10, "defense": 10}
+                             for i, tile in enumerate(tiles[units + cities:])]},
+        "ceasefire_turns": 0,
+    }
+
+
+if __name__ == '__main__':
+    for width, height, units, cities in SCENARIOS:
+        state = game_state(width, height, units, cities)
+        times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            plan = plan_turn(state)
+            times.append((time.perf_counter() - start) * 1000)
+        print(f"{width}x{height}, {units} units, {cities} cities: {min(times):.2f} ms "
+              f"({len(plan['actions'])} actions)")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark: input tokens of the AI turns when the conversation replays the
+last 4 user/assistant pairs with the full state in every user message (the
+history kept by GroqAPIClient.call_api) versus the keyframe + changes
+messages of ai_memory.TurnMemory.
+
+A game is simulated without calling the LLM: the AI units walk two tiles
+per turn and the fog of war opens around them. Tokens are estimated with
+ai_memory.estimate_tokens.
+
+Usage:
+    python benchmarks/bench_ai_prompt_tokens.py [turns]
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ai_memory import TurnMemory, estimate_tokens
+from IAProba import AI_SYSTEM_INSTRUCTIONS, build_game_prompt, filter_game_state
+from terrain_generator import generate_scatter_terrain
+
+SIGHT = 2
+HISTORY_PAIRS = 4
+
+
+def simulated_turns(width, height, turns, units=6, seed=3):
+    """Game states of an AI exploring the map"""
+    rng = np.random.default_rng(seed)
+    terrain = np.asarray(generate_scatter_terrain(width, height, "medium", seed), dtype=np.uint8)
+    fog = np.zeros((height, width), dtype=np.uint8)
+    positions = [[int(rng.integers(width)), int(rng.integers(height))] for _ in range(units)]
+    resources = {"food": 100, "gold": 20, "wood": 50, "stone": 30, "iron": 0}
+    for turn in range(1, turns + 1):
+        for position in positions:
+            position[0] = int(np.clip(position[0] + rng.integers(-2, 3), 0, width - 1))
+            position[1] = int(np.clip(position[1] + rng.integers(-2, 3), 0, height - 1))
+            x, y = position
+            fog[max(0, y - SIGHT):y + SIGHT + 1, max(0, x - SIGHT):x + SIGHT + 1] = 1
+        resources = {name: amount + 5 for name, amount in resources.items()}
+        yield {
+            "turn": turn,
+            "difficulty": "medium",
+            "map_size": {"width": width, "height": height},
+            "map_data": {"terrain": terrain.tolist()},
+            "ia": {
+                "fog_grid": fog.tolist(),
+                "units": [{"id": f"ia-{i}", "type_id": "warrior", "position": list(position),
+                           "health": 100, "attack": 10, "defense": 5, "movement": 2}
+                          for i, position in enumerate(positions)],
+                "cities": [],
+                "resources": dict(resources),
+            },
+            "player": {"units": []},
+        }
+
+
+def response_for(state):
+    return json.dumps({"actions": [{"type": "movement", "unit_id": unit["id"], "position": unit["position"],
+                                    "target_position": unit["position"]} for unit in state["ia"]["units"]]})
+
+
+def compare(width, height, turns):
+    history = []
+    memory = TurnMemory()
+    totals = {"history": 0, "delta": 0}
+    keyframes = 0
+    for game_state in simulated_turns(width, height, turns):
+        filtered = filter_game_state(game_state)
+        response = response_for(game_state)
+
+        # Last HISTORY_PAIRS pairs with a full state each, plus this turn
+        prompt = build_game_prompt(filtered)
+        messages = [AI_SYSTEM_INSTRUCTIONS] + history[-2 * HISTORY_PAIRS:] + [prompt]
+        totals["history"] += sum(estimate_tokens(message) for message in messages)
+        history += [prompt, response]
+
+        _, info = memory.build_messages(
+            AI_SYSTEM_INSTRUCTIONS, filtered,
+            lambda state_text, changes: build_game_prompt(filtered, state_text, changes))
+        with contextlib.redirect_stdout(io.StringIO()):  # record() logs every turn
+            memory.record(info, response)
+        memory.played(info["turn"], json.loads(response)["actions"])
+        totals["delta"] += info["estimated_prompt_tokens"]
+        keyframes += info["mode"] == "full"
+
+    print(f"{width}x{height}, {turns} turns: history {totals['history'] / turns:.0f} tokens/turn, "
+          f"keyframe + changes {totals['delta'] / turns:.0f} tokens/turn "
+          f"({totals['history'] / totals['delta']:.1f}x less, {keyframes} keyframes)")
+
+
+if __name__ == '__main__':
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for width, height in ((30, 15), (100, 100)):
+        compare(width, height, turns)
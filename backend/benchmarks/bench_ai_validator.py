@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Benchmark: time to validate a whole AI turn (ai_validator.validate_plan) at
+several map sizes. The turn is the local plan (valid actions) plus as many
+broken actions as an LLM typically sends: moves into water, outside the map,
+too far or onto occupied tiles, and productions in unknown cities.
+
+Usage:
+    python benchmarks/bench_ai_validator.py
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ai_planner import plan_turn
+from ai_validator import validate_plan
+from bench_ai_planner import SCENARIOS, game_state
+
+
+def broken_actions(state, rng):
+    """One broken action per AI unit"""
+    width, height = state["map_size"]["width"], state["map_size"]["height"]
+    terrain = np.asarray(state["map_data"]["terrain"])
+    water = np.argwhere(terrain == 1)
+    actions = []
+    for i, unit in enumerate(state["ia"]["units"]):
+        x, y = unit["position"]
+        targets = ([int(water[i % len(water)][1]), int(water[i % len(water)][0])] if len(water) else [x, y],
+                   [width + i, y], [(x + 9) % width, (y + 9) % height], list(state["player"]["units"][0]["position"]))
+        actions.append({"type": "movement", "unit_id": unit["id"], "position": [x, y],
+                        "target_position": targets[int(rng.integers(len(targets)))]})
+    actions.append({"type": "city_production", "city_id": "nowhere", "action": "train", "item_id": "warrior"})
+    return actions
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(2)
+    for width, height, units, cities in SCENARIOS:
+        state = game_state(width, height, units, cities)
+        actions = broken_actions(state, rng) + plan_turn(state)["actions"]
+        times = []
+        for _ in range(5):
+            with contextlib.redirect_stdout(io.StringIO()):  # validate_plan logs the rejections
+                start = time.perf_counter()
+                result = validate_plan(state, {"actions": actions})
+                times.append((time.perf_counter() - start) * 1000)
+        print(f"{width}x{height}, {len(actions)} actions: {min(times):.2f} ms "
+              f"({len(result['actions'])} valid, {len(result['repaired'])} repaired, "
+              f"{len(result['rejected'])} rejected)")
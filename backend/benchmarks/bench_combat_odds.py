@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Benchmark: battle odds with one fight at a time (the resolve_battle loop, as
+the browser runs startBattle) versus the vectorized Monte Carlo simulation,
+and the cost of precomputing every pair of the troop catalog.
+
+Usage:
+    python benchmarks/bench_combat_odds.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from combat import resolve_battle, simulate_battles, ODDS_SAMPLES
+from database import get_troop_types
+
+
+def measure(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    types = {troop_type["type_id"]: troop_type for troop_type in get_troop_types()}
+    attacker, defender = types["warrior"], types["archer"]
+
+    loop_ms = measure(lambda: [resolve_battle(attacker, defender, random) for _ in range(ODDS_SAMPLES)])
+    vector_ms = measure(lambda: simulate_battles([attacker], [defender], ODDS_SAMPLES))
+    print(f"one pair, {ODDS_SAMPLES} fights: loop {loop_ms:.1f} ms, vectorized {vector_ms:.1f} ms "
+          f"({loop_ms / vector_ms:.1f}x)")
+
+    pairs = [(a, d) for a in types.values() for d in types.values()]
+    catalog_ms = measure(lambda: simulate_battles([a for a, _ in pairs], [d for _, d in pairs], ODDS_SAMPLES), 1)
+    print(f"catalog, {len(pairs)} pairs: {catalog_ms:.1f} ms")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: filter_game_state with the board encoding (one character per
+visible tile, ai_board.py) versus the previous encoding (visible_tiles as
+[x, y] pairs and terrain_visible as "x,y": type), at several map sizes.
+
+Reports the time to filter the state and the size of the serialized state
+(characters and estimated tokens, ai_memory.estimate_tokens).
+
+Usage:
+    python benchmarks/bench_filter_game_state.py
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ai_memory import estimate_tokens
+from IAProba import filter_game_state
+from terrain_generator import generate_scatter_terrain
+
+SIZES = ((30, 15), (100, 100), (300, 300))
+# Fraction of the map explored by the AI
+EXPLORED = 0.4
+UNITS = 20
+
+
+def explored_fog(width, height, rng):
+    """Fog of war opened by random walks"""
+    fog = np.zeros((height, width), dtype=np.uint8)
+    x, y = width // 2, height // 2
+    while fog.mean() < EXPLORED:
+        x = int(np.clip(x + rng.integers(-3, 4), 0, width - 1))
+        y = int(np.clip(y + rng.integers(-3, 4), 0, height - 1))
+        fog[max(0, y - 2):y + 3, max(0, x - 2):x + 3] = 1
+    return fog
+
+
+def game_state(width, height, seed=5):
+    rng = np.random.default_rng(seed)
+    terrain = np.asarray(generate_scatter_terrain(width, height, "medium", seed), dtype=np.uint8)
+    fog = explored_fog(width, height, rng)
+    ys, xs = np.nonzero(fog)
+    picks = rng.choice(len(xs), size=2 * UNITS)
+    units = [{"id": f"u{i}", "type_id": "warrior", "position": [int(xs[p]), int(ys[p])],
+              "health": 100, "attack": 10, "defense": 5, "movement": 2} for i, p in enumerate(picks)]
+    return {
+        "turn": 10,
+        "difficulty": "medium",
+        "map_size": {"width": width, "height": height},
+        "map_data": {"terrain": terrain},
+        "ia": {"fog_grid": fog, "units": units[:UNITS], "cities": [], "resources": {"wood": 50}},
+        "player": {"units": units[UNITS:]},
+    }
+
+
+def legacy_tiles(state):
+    """visible_tiles and terrain_visible as filter_game_state sent them before"""
+    fog = state["ia"]["fog_grid"] == 1
+    terrain = state["map_data"]["terrain"]
+    ys, xs = np.nonzero(fog)
+    visible_tiles = np.stack([xs, ys], axis=1).tolist()
+    values = terrain[ys, xs]
+    terrain_visible = {}
+    for x, y, value in zip(xs[values != 0].tolist(), ys[values != 0].tolist(), values[values != 0].tolist()):
+        terrain_visible[f"{x},{y}"] = value
+    return visible_tiles, terrain_visible
+
+
+def measure(fn, repeat=5):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+if __name__ == '__main__':
+    for width, height in SIZES:
+        state = game_state(width, height)
+        board_ms, filtered = measure(lambda: filter_game_state(state))
+        legacy_ms, (visible_tiles, terrain_visible) = measure(lambda: legacy_tiles(state))
+        legacy = {key: value for key, value in filtered.items() if key != "board"}
+        legacy.update({"visible_tiles": visible_tiles, "terrain_visible": terrain_visible})
+        board_text, legacy_text = json.dumps(filtered), json.dumps(legacy)
+        print(f"{width}x{height}: filter {board_ms:.1f} ms (old tile lists alone {legacy_ms:.1f} ms), "
+              f"state {len(legacy_text)} -> {len(board_text)} chars, "
+              f"~{estimate_tokens(legacy_text)} -> ~{estimate_tokens(board_text)} tokens "
+              f"({len(legacy_text) / len(board_text):.1f}x smaller)")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark: land component labelling in add_map (once per map) versus
+answering "can a unit on A reach B" with a breadth-first search, which is what
+a query costs without the labels when the goal is on another island.
+
+Usage:
+    python benchmarks/bench_land_components.py
+"""
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from terrain_generator import generate_terrain
+from map_analysis import land_components, same_component
+
+SIZES = [(30, 15), (300, 300), (1000, 1000), (4096, 4096)]
+
+
+def bfs_reachable(terrain, start, goal):
+    """Flood fill from start until goal is found (or the island is exhausted)"""
+    height, width = terrain.shape
+    seen = np.zeros(terrain.shape, dtype=bool)
+    seen[start[1], start[0]] = True
+    queue = deque([tuple(start)])
+    while queue:
+        x, y = queue.popleft()
+        if (x, y) == tuple(goal):
+            return True
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and not seen[ny, nx] and terrain[ny, nx] != 1:
+                seen[ny, nx] = True
+                queue.append((nx, ny))
+    return False
+
+
+def measure(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    print(f"{'size':>11}  {'generator':>9}  {'islands':>8}  {'label':>11}  {'bfs query':>11}  {'label query':>11}")
+    for width, height in SIZES:
+        for generator in ("scatter", "noise"):
+            start = [width // 2, height // 2]
+            terrain = np.asarray(generate_terrain(generator, width, height, "easy", 42, start), dtype=np.uint8)
+            repeat = 1 if width * height >= 1000000 else 5
+            labels, count = land_components(terrain)
+            label_ms = measure(lambda: land_components(terrain), repeat)
+
+            # Worst case for the search: goal on another island (or water)
+            other = np.argwhere(labels != labels[start[1], start[0]])
+            goal = other[-1][::-1].tolist() if len(other) else start
+            bfs_ms = measure(lambda: bfs_reachable(terrain, start, goal), 1)
+            query_ms = measure(lambda: same_component(labels, start, goal), 5)
+            print(f"{width:>5}x{height:<5}  {generator:>9}  {count:>8}  {label_ms:>8.1f} ms  "
+                  f"{bfs_ms:>8.1f} ms  {query_ms:>8.4f} ms")
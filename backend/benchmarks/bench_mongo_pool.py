@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request MongoDB latency with a new MongoClient per request
+(old get_db/close_db behaviour) versus the shared per-process client.
+
+Usage (MongoDB must be reachable through MONGO_URI):
+    python benchmarks/bench_mongo_pool.py [requests]
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pymongo import MongoClient
+from database import MONGO_URI, get_client
+
+
+def simulated_request(db):
+    """The cheapest query a typical API call does: one indexed user lookup"""
+    db.users.find_one({"username": "benchmark-user"})
+
+
+def client_per_request():
+    client = MongoClient(MONGO_URI)
+    try:
+        simulated_request(client.game_database)
+    finally:
+        client.close()
+
+
+def shared_client():
+    simulated_request(get_client().game_database)
+
+
+def measure(label, fn, requests):
+    # Warm up once so server discovery of the shared client is not counted
+    fn()
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<22} mean {statistics.mean(timings):8.2f} ms   "
+          f"p50 {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+if __name__ == '__main__':
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"MongoDB: {MONGO_URI} - {requests} requests each")
+    measure("MongoClient/request", client_per_request, requests)
+    measure("shared client", shared_client, requests)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark: occupancy queries with list scans (any() over the unit positions,
+as find_unoccupied_position and canAttack did) versus the game's spatial
+index, for games with many units.
+
+Usage:
+    python benchmarks/bench_spatial_index.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from spatial_index import build_spatial_index
+
+MAP_SIZE = (300, 300)
+UNIT_COUNTS = [100, 500, 2000]
+ATTACK_RANGE = 3
+
+
+def make_game(unit_count, rng):
+    width, height = MAP_SIZE
+    tiles = rng.choice(width * height, size=unit_count, replace=False)
+    units = [{"id": f"u{i}", "position": [int(tile % width), int(tile // width)]} for i, tile in enumerate(tiles)]
+    half = unit_count // 2
+    return {
+        "game_id": f"bench-{unit_count}",
+        "map_size": {"width": width, "height": height},
+        "player": {"units": units[:half], "cities": []},
+        "ia": {"units": units[half:], "cities": []},
+    }
+
+
+def scan_occupied(positions, x, y):
+    return any(pos[0] == x and pos[1] == y for pos in positions)
+
+
+def scan_enemies(enemies, x, y):
+    return [enemy for enemy in enemies
+            if abs(enemy["position"][0] - x) + abs(enemy["position"][1] - y) <= ATTACK_RANGE]
+
+
+def measure(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(42)
+    print(f"{'units':>6}  {'occupied scan':>13}  {'occupied idx':>12}  {'targets scan':>12}  {'targets idx':>11}")
+    for unit_count in UNIT_COUNTS:
+        game = make_game(unit_count, rng)
+        positions = [unit["position"] for side in ("player", "ia") for unit in game[side]["units"]]
+        index = build_spatial_index(game)
+        queries = rng.integers(0, MAP_SIZE[0], size=(1000, 2)).tolist()
+
+        # One occupancy check per query tile, one target search per player unit
+        occupied_scan = measure(lambda: [scan_occupied(positions, x, y) for x, y in queries])
+        occupied_index = measure(lambda: [(x, y) in index for x, y in queries])
+        attackers = game["player"]["units"]
+        targets_scan = measure(lambda: [scan_enemies(game["ia"]["units"], *unit["position"]) for unit in attackers])
+        targets_index = measure(lambda: [index.units_within("ia", unit["position"], ATTACK_RANGE) for unit in attackers])
+        print(f"{unit_count:>6}  {occupied_scan:>10.1f} ms  {occupied_index:>9.1f} ms  "
+              f"{targets_scan:>9.1f} ms  {targets_index:>8.1f} ms")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Benchmark: original tile-by-tile terrain generator (random.randint retry
+loops, list.pop(0) lake queue) versus the vectorized, seeded generator in
+terrain_generator.py, plus the noise-based biome generator on large maps.
+
+Usage:
+    python benchmarks/bench_terrain_generator.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from terrain_generator import generate_scatter_terrain, generate_noise_terrain
+
+SIZES = [(30, 15), (200, 200), (1000, 1000)]
+NOISE_SIZES = [(30, 15), (1000, 1000), (4096, 4096)]
+
+
+# Baseline: the generator add_map used before (diagnostic prints removed)
+def legacy_generate_terrain(width, height, difficulty):
+    """
+    Generate terrain with patterns:
+    - 0: Normal terrain (most common)
+    - 1: Water (forms lakes and rivers)
+    - 2: Gold mineral (rare, 7% of minerals)
+    - 3: Iron mineral (uncommon, 13% of minerals)
+    - 4: Wood resource (common, 60% of minerals)
+    - 5: Stone resource (semi-common, 20% of minerals)
+    """
+    # Initialize terrain with normal terrain
+    terrain = [[0 for _ in range(width)] for _ in range(height)]
+    
+    # Calculate total tiles
+    total_tiles = width * height
+    
+    # Fixed water percentage regardless of difficulty
+    water_percent = 15  # Always 15% of map is water
+    
+    # Set mineral percentage based on difficulty
+    if difficulty == "easy":
+        mineral_percent = 20  # 20% minerals on easy difficulty
+    elif difficulty == "medium":
+        mineral_percent = 15  # 15% minerals on medium difficulty
+    elif difficulty == "hard":
+        mineral_percent = 10  # 10% minerals on hard difficulty
+    else:
+        # Default to easy if unknown difficulty
+        mineral_percent = 20
+    
+    # Calculate exact number of tiles for each type
+    water_tiles = int(total_tiles * water_percent / 100)
+    mineral_tiles = int(total_tiles * mineral_percent / 100)
+    
+    # Subdivide minerals by type with new percentages
+    gold_tiles = int(mineral_tiles * 0.07)    # 7% of minerals are gold
+    iron_tiles = int(mineral_tiles * 0.13)    # 13% of minerals are iron
+    stone_tiles = int(mineral_tiles * 0.20)   # 20% of minerals are stone
+    wood_tiles = mineral_tiles - gold_tiles - iron_tiles - stone_tiles  # Remaining ~60% are wood
+    
+    
+    # First place water features with clustering
+    placed_water = 0
+    water_seeds = min(water_tiles // 10, 15)  # Use at most 15 seed points
+    water_seeds = max(water_seeds, 3)  # At least 3 seed points
+    
+    water_per_seed = water_tiles // water_seeds
+    
+    for _ in range(water_seeds):
+        if placed_water >= water_tiles:
+            break
+            
+        # Place a water seed
+        x = random.randint(2, width - 3)
+        y = random.randint(2, height - 3)
+        
+        # Skip if already water
+        if terrain[y][x] != 0:
+            continue
+            
+        # Define size of this water body (avoid one large body consuming everything)
+        size = min(random.randint(5, 15), water_per_seed)
+        
+        # Generate water cluster
+        placed_water += legacy_generate_water_pattern(terrain, x, y, size, width, height)
+    
+    # If we still have water to place, add random individual water tiles
+    remaining_water = water_tiles - placed_water
+    attempts = 0
+    
+    while remaining_water > 0 and attempts < remaining_water * 3:
+        x = random.randint(0, width - 1)
+        y = random.randint(0, height - 1)
+        
+        if terrain[y][x] == 0:  # Only place on normal terrain
+            terrain[y][x] = 1  # Water
+            remaining_water -= 1
+        
+        attempts += 1
+    
+    # Now place minerals - first distribute them individually
+    mineral_placement_order = []
+    
+    # Add gold tiles
+    for _ in range(gold_tiles):
+        mineral_placement_order.append(2)  # Gold
+    
+    # Add iron tiles
+    for _ in range(iron_tiles):
+        mineral_placement_order.append(3)  # Iron
+    
+    # Add stone tiles
+    for _ in range(stone_tiles):
+        mineral_placement_order.append(5)  # Stone (code 5)
+    
+    # Add wood tiles
+    for _ in range(wood_tiles):
+        mineral_placement_order.append(4)  # Wood
+    
+    # Shuffle the placement order
+    random.shuffle(mineral_placement_order)
+    
+    # Attempt to place each mineral (with some clustering)
+    to_place = len(mineral_placement_order)
+    placed = 0
+    cluster_chance = 0.3  # 30% chance to try to form a small cluster
+    
+    for mineral_type in mineral_placement_order:
+        # Try to place the mineral
+        attempts = 0
+        max_attempts = 10  # Try up to 10 times to find a suitable spot
+        
+        while attempts < max_attempts:
+            x = random.randint(0, width - 1)
+            y = random.randint(0, height - 1)
+            
+            if terrain[y][x] == 0:  # Only place on normal terrain
+                terrain[y][x] = mineral_type
+                placed += 1
+                
+                # Try to form a small cluster (occasionally)
+                if random.random() < cluster_chance:
+                    # Try to add one adjacent mineral of the same type
+                    directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+                    random.shuffle(directions)
+                    
+                    for dx, dy in directions:
+                        nx, ny = x + dx, y + dy
+                        if (0 <= nx < width and 0 <= ny < height and 
+                            terrain[ny][nx] == 0):
+                            terrain[ny][nx] = mineral_type
+                            placed += 1
+                            break  # Only add one adjacent tile
+                
+                break  # Successfully placed
+            
+            attempts += 1
+    
+    
+    return terrain
+
+def legacy_generate_water_pattern(terrain, x, y, size, width, height):
+    """Generate a natural-looking water body. Returns the number of water tiles placed."""
+    # Mark the center as water
+    if terrain[y][x] != 0:  # Already something else
+        return 0
+        
+    terrain[y][x] = 1
+    placed = 1
+    
+    # Generate water in a randomized pattern around the center
+    directions = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+    queue = [(x, y, size)]
+    
+    while queue and placed < size:
+        cx, cy, remaining_size = queue.pop(0)
+        if remaining_size <= 0:
+            continue
+        
+        # Choose random directions to expand
+        random.shuffle(directions)
+        for dx, dy in directions[:random.randint(1, min(4, remaining_size))]:
+            nx, ny = cx + dx, cy + dy
+            if (0 <= nx < width and 0 <= ny < height and 
+                terrain[ny][nx] == 0 and placed < size):
+                terrain[ny][nx] = 1
+                placed += 1
+                # Continue expanding with reduced size
+                if random.random() < 0.7:  # 70% chance to continue
+                    queue.append((nx, ny, remaining_size - 1))
+    
+    return placed
+
+
+def measure(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    print(f"{'size':>11}  {'legacy':>12}  {'vectorized':>12}  {'speedup':>8}")
+    for width, height in SIZES:
+        repeat = 1 if width * height >= 1000000 else 5
+        random.seed(42)
+        legacy_ms = measure(lambda: legacy_generate_terrain(width, height, "easy"), repeat)
+        vector_ms = measure(lambda: generate_scatter_terrain(width, height, "easy", 42), repeat)
+        print(f"{width:>5}x{height:<5}  {legacy_ms:>9.1f} ms  {vector_ms:>9.1f} ms  {legacy_ms / vector_ms:>7.1f}x")
+
+    print()
+    print(f"{'size':>11}  {'noise':>12}")
+    for width, height in NOISE_SIZES:
+        repeat = 1 if width * height >= 1000000 else 5
+        noise_ms = measure(lambda: generate_noise_terrain(width, height, "easy", 42, [width // 2, height // 2]), repeat)
+        print(f"{width:>5}x{height:<5}  {noise_ms:>9.1f} ms")
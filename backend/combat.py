@@ -0,0 +1,205 @@
+"""
+Server-side combat.
+
+Same formula as startBattle in Battle.svelte: the attacker and the defender
+strike in turns (attacker first) until one of them has no health left. Each
+blow deals round(random(0, 2) * attack * multiplier), where every defense
+point of the target removes 5% of the damage and at least 10% always passes.
+
+- resolve_battle: one authoritative fight, blow by blow (for the animation)
+- simulate_battles: many fights of many attacker/defender pairs at once with
+  NumPy (Monte Carlo odds: win probability, expected remaining health)
+- catalog_odds: odds of every pair of troop types at full health, computed
+  once per process and served from memory
+"""
+import math
+import random
+import threading
+import numpy as np
+from database import get_troop_types
+from fog_of_war import remove_sight_source
+from spatial_index import get_spatial_index
+from movement import attack_targets, position_of
+
+# Damage formula (Battle.svelte)
+DEFENSE_REDUCTION_PER_POINT = 0.05
+MIN_DAMAGE_MULTIPLIER = 0.1
+
+# Fights that last longer than this end without a winner (units with no attack)
+MAX_ROUNDS = 1000
+
+# Monte Carlo fights per pair
+ODDS_SAMPLES = 4000
+MAX_ODDS_SAMPLES = 100000
+
+# Seed of the precomputed catalog odds, so they are the same in every process
+CATALOG_SEED = 7
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def damage_multiplier(defense):
+    """Fraction of the damage that passes a defense"""
+    return max(MIN_DAMAGE_MULTIPLIER, 1 - (defense or 0) * DEFENSE_REDUCTION_PER_POINT)
+
+
+def blow_damage(attack, defense, roll):
+    """Damage of one blow for a roll in [0, 1) (Math.round rounds halves up)"""
+    return math.floor((attack or 0) * roll * 2 * damage_multiplier(defense) + 0.5)
+
+
+def resolve_battle(attacker, defender, rng=random):
+    """
+    Fight until one unit dies. The units are not modified.
+    Returns {"winner": "attacker" | "defender" | None, "attacker_health",
+    "defender_health", "blows": [{"by", "damage"}, ...]}
+    """
+    health = {"attacker": attacker.get("health", 0), "defender": defender.get("health", 0)}
+    stats = {"attacker": attacker, "defender": defender}
+    blows = []
+    striker, target = "attacker", "defender"
+    while health["attacker"] > 0 and health["defender"] > 0 and len(blows) < MAX_ROUNDS:
+        damage = blow_damage(stats[striker].get("attack", 0), stats[target].get("defense", 0), rng.random())
+        health[target] -= damage
+        blows.append({"by": striker, "damage": damage})
+        striker, target = target, striker
+
+    winner = None
+    if health["defender"] <= 0:
+        winner = "attacker"
+    elif health["attacker"] <= 0:
+        winner = "defender"
+    return {
+        "winner": winner,
+        "attacker_health": max(health["attacker"], 0),
+        "defender_health": max(health["defender"], 0),
+        "blows": blows,
+    }
+
+
+def _stat_column(units, field):
+    return np.array([unit.get(field) or 0 for unit in units], dtype=np.float64)[:, None]
+
+
+def simulate_battles(attackers, defenders, samples=ODDS_SAMPLES, seed=None):
+    """
+    Monte Carlo odds of the pairs (attackers[i], defenders[i]), all pairs and
+    samples advanced together one blow at a time.
+    Returns one {"win_probability", "loss_probability", "expected_attacker_health",
+    "expected_defender_health", "expected_blows"} per pair.
+    """
+    if not attackers:
+        return []
+    rng = np.random.default_rng(seed)
+    shape = (len(attackers), samples)
+
+    attack = (_stat_column(attackers, "attack"), _stat_column(defenders, "attack"))
+    multiplier = (
+        np.maximum(MIN_DAMAGE_MULTIPLIER, 1 - _stat_column(defenders, "defense") * DEFENSE_REDUCTION_PER_POINT),
+        np.maximum(MIN_DAMAGE_MULTIPLIER, 1 - _stat_column(attackers, "defense") * DEFENSE_REDUCTION_PER_POINT),
+    )
+    # Damage per unit of roll of the attacker's and of the defender's blows
+    scale = (attack[0] * 2 * multiplier[0], attack[1] * 2 * multiplier[1])
+    health = [np.broadcast_to(_stat_column(attackers, "health"), shape).copy(),
+              np.broadcast_to(_stat_column(defenders, "health"), shape).copy()]
+    blows = np.zeros(shape, dtype=np.int32)
+
+    for blow in range(MAX_ROUNDS):
+        active = (health[0] > 0) & (health[1] > 0)
+        if not active.any():
+            break
+        striker = blow % 2
+        damage = np.floor(rng.random(shape) * scale[striker] + 0.5)
+        health[1 - striker] -= damage * active
+        blows += active
+
+    wins = health[1] <= 0
+    losses = health[0] <= 0
+    remaining = (np.maximum(health[0], 0), np.maximum(health[1], 0))
+    return [{
+        "win_probability": round(float(wins[i].mean()), 4),
+        "loss_probability": round(float(losses[i].mean()), 4),
+        "expected_attacker_health": round(float(remaining[0][i].mean()), 2),
+        "expected_defender_health": round(float(remaining[1][i].mean()), 2),
+        "expected_blows": round(float(blows[i].mean()), 2),
+    } for i in range(len(attackers))]
+
+
+def catalog_odds():
+    """
+    Odds of every attacker/defender pair of troop types at full health:
+    {attacker_type: {defender_type: odds}}. Computed once per process.
+    """
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                types = get_troop_types()
+                pairs = [(a, d) for a in types for d in types]
+                odds = simulate_battles([a for a, _ in pairs], [d for _, d in pairs], seed=CATALOG_SEED)
+                catalog = {}
+                for (a, d), pair_odds in zip(pairs, odds):
+                    catalog.setdefault(a["type_id"], {})[d["type_id"]] = pair_odds
+                _catalog = catalog
+    return _catalog
+
+
+def _matches_type(unit, troop_type):
+    return all(unit.get(field) == troop_type.get(field) for field in ("health", "attack", "defense"))
+
+
+def battle_odds(attacker, defender, samples=ODDS_SAMPLES):
+    """
+    Odds of a fight: precomputed when both units are catalog types at full
+    health with the default sample count, simulated otherwise
+    """
+    if samples == ODDS_SAMPLES:
+        types = {troop_type["type_id"]: troop_type for troop_type in get_troop_types()}
+        attacker_type = types.get(attacker.get("type_id"))
+        defender_type = types.get(defender.get("type_id"))
+        if attacker_type and defender_type and _matches_type(attacker, attacker_type) \
+                and _matches_type(defender, defender_type):
+            return catalog_odds()[attacker_type["type_id"]][defender_type["type_id"]]
+    return simulate_battles([attacker], [defender], samples)[0]
+
+
+def remove_unit(game, player_type, unit):
+    """Remove a dead unit from the game, its fog sight and the spatial index"""
+    position = list(position_of(unit))
+    remove_sight_source(game, player_type, position)
+    get_spatial_index(game).remove_unit(player_type, unit)
+    units = game[player_type]["units"]
+    for index, other in enumerate(units):
+        if other is unit:
+            del units[index]
+            break
+
+
+def fight(game, player_type, attacker, defender):
+    """
+    Resolve an attack of the active game: the defender must be a visible enemy
+    within range of an attacker that can still act. The loser is removed and
+    the attacker has no movement left afterwards.
+    Returns (result, error).
+    """
+    if not any(target is defender for target in attack_targets(game, player_type, attacker)):
+        return None, "Target is not within range"
+
+    enemy = "ia" if player_type == "player" else "player"
+    result = resolve_battle(attacker, defender)
+    attacker["health"] = result["attacker_health"]
+    defender["health"] = result["defender_health"]
+    attacker["status"] = "exhausted"
+    attacker["remainingMovement"] = 0
+
+    if result["winner"] == "attacker":
+        remove_unit(game, enemy, defender)
+    elif result["winner"] == "defender":
+        remove_unit(game, player_type, attacker)
+
+    result.update({
+        "attacker_position": list(position_of(attacker)),
+        "defender_position": list(position_of(defender)),
+    })
+    return result, None
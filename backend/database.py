@@ -1,15 +1,40 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
 from flask import g, session
 import os
 import datetime
-import random
+import time
 import uuid
 import json
-from bson import ObjectId
+import threading
+from bson import ObjectId, Binary
+import numpy as np
+from game_store import get_game_store
+from terrain_generator import new_seed, generate_terrain, clear_water_around, DEFAULT_GENERATOR
+from fog_of_war import get_fog, add_sight_source
+from movement import find_unit, move_unit
+from spatial_index import get_spatial_index
+from map_analysis import spawn_candidates, land_components, cache_land_components
+from economy import cache_resource_tables
+from scheduler import schedule_timer, RESEARCH
+from map_thumbnails import count_resources, render_terrain_thumbnail
+from map_codec import (pack_map_layers, unpack_map_layers, pack_game_layers,
+                       unpack_game_layers, layer_to_list, layer_to_array, is_packed, pack_layer,
+                       LAYER_ENCODINGS, LABELS)
 
 # MongoDB connection string - using environment variable for security
 MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://mongodb:27017/')
 
+# Connection pool settings, shared by every request of a worker process
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '20000'))
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
 # Add this utility function for JSON serialization
 class JSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -25,22 +50,97 @@ def sanitize_for_json(obj):
     """
     return json.loads(JSONEncoder().encode(obj))
 
+def get_client():
+    """
+    Get the MongoClient of this worker process, creating it on first use.
+    The client keeps its own connection pool and is thread-safe, so it is
+    shared by all requests. A forked worker gets a new client because
+    MongoClient instances must not be used across fork().
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                    connect=False
+                )
+                _client_pid = pid
+    return _client
+
 def get_db():
     """
-    Configure the MongoDB connection
+    Get the game database from the shared MongoDB client
     """
     if 'db' not in g:
-        client = MongoClient(MONGO_URI)
-        g.db = client.game_database
+        g.db = get_client().game_database
     return g.db
 
 def close_db(e=None):
     """
-    Close the MongoDB connection
+    Release the database handle of the request. The shared client (and its
+    connection pool) stays open for the next requests.
+    """
+    g.pop('db', None)
+
+def ping_db():
+    """
+    Check that MongoDB is reachable. Returns (ok, latency in ms or error message)
     """
-    db = g.pop('db', None)
-    if db is not None:
-        db.client.close()
+    try:
+        start = time.perf_counter()
+        get_client().admin.command('ping')
+        return True, round((time.perf_counter() - start) * 1000, 2)
+    except Exception as e:
+        return False, str(e)
+
+def get_session_game():
+    """
+    Get the active game of the current session from the game store.
+    The session only holds the game_id; the game document lives server-side.
+    """
+    game_id = session.get('game_id')
+    if not game_id:
+        return None
+    
+    game = get_game_store().get(game_id)
+    if game is None:
+        # The game was evicted from the store, fall back to the last saved copy
+        db = get_db()
+        saved_game = db.games.find_one({"game_id": game_id})
+        if not saved_game or saved_game.get('username') != session.get('username'):
+            return None
+        game = sanitize_for_json(unpack_game_layers(saved_game))
+        get_game_store().put(game_id, game)
+    return game
+
+def set_session_game(game):
+    """
+    Store a game in the game store and make it the active game of the session
+    """
+    game_id = game.get('game_id') or session.get('game_id')
+    if not game_id:
+        game_id = str(int(datetime.datetime.now().timestamp() * 1000))
+    game_id = str(game_id)
+    game['game_id'] = game_id
+    
+    get_game_store().put(game_id, game)
+    session['game_id'] = game_id
+    return game
+
+def clear_session_game():
+    """
+    Remove the active game from the session and the game store
+    """
+    game_id = session.pop('game_id', None)
+    if game_id:
+        get_game_store().delete(game_id)
 
 def init_db():
     """
@@ -60,9 +160,183 @@ def init_db():
         db.create_collection('games')
         print("Games collection created")
     
+    # Legacy games must have string ids before the unique index can be built
+    normalize_game_ids()
+    normalize_last_saved()
+    create_indexes()
+    backfill_map_catalog_fields()
+    backfill_spawn_candidates()
+    backfill_land_components()
+    
     # Check if any map exists, if not create a test map
     create_test_map_if_not_exists()
 
+def normalize_last_saved():
+    """
+    One-off migration: older saves stored last_saved as an ISO string, and some
+    have none. Convert them to dates (created_at, else the epoch, when missing)
+    so sorting and paginating by last_saved is consistent.
+    """
+    db = get_db()
+    migrated = 0
+    legacy_games = db.games.find(
+        {"$or": [{"last_saved": {"$not": {"$type": "date"}}}, {"last_saved": {"$exists": False}}]},
+        {"_id": 1, "last_saved": 1, "created_at": 1}
+    )
+    for game in legacy_games:
+        last_saved = saved_at(game)
+        if last_saved == datetime.datetime.min:
+            last_saved = saved_at({"last_saved": game.get("created_at")})
+        if last_saved == datetime.datetime.min:
+            last_saved = datetime.datetime(1970, 1, 1)
+        db.games.update_one({"_id": game["_id"]}, {"$set": {"last_saved": last_saved}})
+        migrated += 1
+    
+    if migrated:
+        print(f"Normalized last_saved of {migrated} games")
+    return migrated
+
+def backfill_map_catalog_fields():
+    """
+    One-off migration: compute resource counts and thumbnails for maps created
+    before they were generated in add_map
+    """
+    db = get_db()
+    migrated = 0
+    for map_doc in db.maps.find({"thumbnail": {"$exists": False}},
+                                {"terrain": 1, "external_layers": 1, "width": 1, "height": 1}):
+        terrain = layer_to_list(load_map_layer(map_doc, "terrain") or [], map_doc.get("width", 0), map_doc.get("height", 0))
+        db.maps.update_one({"_id": map_doc["_id"]}, {"$set": {
+            "resource_counts": count_resources(terrain),
+            "thumbnail": Binary(render_terrain_thumbnail(terrain))
+        }})
+        migrated += 1
+    
+    if migrated:
+        print(f"Generated catalog fields for {migrated} maps")
+    return migrated
+
+def backfill_spawn_candidates():
+    """
+    One-off migration: compute the spawn candidates of maps created before
+    they were stored in add_map
+    """
+    db = get_db()
+    migrated = 0
+    for map_doc in db.maps.find({"spawn_candidates": {"$exists": False}},
+                                {"terrain": 1, "external_layers": 1, "width": 1, "height": 1, "startPoint": 1}):
+        terrain = layer_to_array(load_map_layer(map_doc, "terrain") or [], map_doc.get("width", 0), map_doc.get("height", 0))
+        db.maps.update_one({"_id": map_doc["_id"]}, {"$set": {
+            "spawn_candidates": spawn_candidates(terrain, map_doc.get("startPoint", [15, 7]))
+        }})
+        migrated += 1
+    
+    if migrated:
+        print(f"Generated spawn candidates for {migrated} maps")
+    return migrated
+
+def backfill_land_components():
+    """
+    One-off migration: label the land components of maps created before they
+    were stored in add_map
+    """
+    db = get_db()
+    migrated = 0
+    for map_doc in db.maps.find({"land_components": {"$exists": False}, "external_layers": {"$exists": False}},
+                                {"terrain": 1, "width": 1, "height": 1}):
+        terrain = layer_to_array(map_doc.get("terrain") or [], map_doc.get("width", 0), map_doc.get("height", 0))
+        labels, count = land_components(terrain)
+        db.maps.update_one({"_id": map_doc["_id"]}, {"$set": {
+            "land_components": Binary(pack_layer(labels, LABELS)),
+            "land_component_count": count
+        }})
+        migrated += 1
+    
+    if migrated:
+        print(f"Labelled land components for {migrated} maps")
+    return migrated
+
+def create_indexes():
+    """
+    Create the indexes used by the lookup paths (no-op if they already exist)
+    """
+    db = get_db()
+    indexes = [
+        (db.games, [("game_id", ASCENDING)], {"unique": True, "name": "game_id_unique"}),
+        (db.games, [("username", ASCENDING), ("last_saved", DESCENDING), ("game_id", DESCENDING)],
+         {"name": "username_last_saved_game_id"}),
+        (db.users, [("username", ASCENDING)], {"unique": True, "name": "username_unique"}),
+        (db.maps, [("difficulty", ASCENDING)], {"name": "difficulty"}),
+        (db.map_layers, [("map_id", ASCENDING), ("layer", ASCENDING), ("chunk", ASCENDING)],
+         {"unique": True, "name": "map_layer_chunk"}),
+    ]
+    for collection, keys, options in indexes:
+        try:
+            collection.create_index(keys, **options)
+        except Exception as e:
+            print(f"Could not create index {options['name']} on {collection.name}: {e}")
+    
+    # Superseded by username_last_saved_game_id (it also covers the tie-break sort)
+    if "username_last_saved" in db.games.index_information():
+        db.games.drop_index("username_last_saved")
+
+def normalize_game_id(game_id):
+    """
+    Canonical form of a game_id: always a string
+    """
+    return str(game_id) if game_id is not None else None
+
+def saved_at(game):
+    """
+    last_saved of a game as a datetime (ISO strings of older saves are parsed),
+    datetime.min if it was never saved
+    """
+    last_saved = game.get("last_saved")
+    if isinstance(last_saved, str):
+        try:
+            last_saved = datetime.datetime.fromisoformat(last_saved)
+        except ValueError:
+            last_saved = None
+    if not isinstance(last_saved, datetime.datetime):
+        return datetime.datetime.min
+    return last_saved.replace(tzinfo=None)
+
+def normalize_game_ids():
+    """
+    One-off migration: convert legacy int game_ids to strings and give games
+    without a game_id the string form of their ObjectId. Returns the number
+    of migrated games (0 once the collection is normalized).
+    """
+    db = get_db()
+    migrated = 0
+    legacy_games = db.games.find(
+        {"$or": [{"game_id": {"$exists": False}}, {"game_id": {"$not": {"$type": "string"}}}]},
+        {"_id": 1, "game_id": 1, "last_saved": 1}
+    )
+    for game in legacy_games:
+        legacy_id = game.get("game_id")
+        if legacy_id is None or isinstance(legacy_id, ObjectId):
+            new_id = str(game["_id"])
+        else:
+            new_id = str(legacy_id)
+        
+        # Keep the newest copy if the string id is already taken
+        existing = db.games.find_one({"game_id": new_id, "_id": {"$ne": game["_id"]}}, {"_id": 1, "last_saved": 1})
+        if existing:
+            if saved_at(existing) >= saved_at(game):
+                print(f"Game id {new_id} already exists, removing older legacy duplicate {game['_id']}")
+                db.games.delete_one({"_id": game["_id"]})
+                continue
+            print(f"Legacy game {game['_id']} is newer than {new_id}, removing the older copy")
+            db.games.delete_one({"_id": existing["_id"]})
+        
+        db.games.update_one({"_id": game["_id"]}, {"$set": {"game_id": new_id}})
+        migrated += 1
+    
+    if migrated:
+        print(f"Normalized {migrated} legacy game ids")
+    return migrated
+
 def create_test_map_if_not_exists():
     """
     Create a test map if there are no maps in the database
@@ -129,40 +403,80 @@ def get_all_users():
     db = get_db()
     return list(db.users.find({}, {'_id': 0, 'password': 0}))
 
-def add_map(width, height, startPoint, difficulty="easy", name=None):
+# Largest map side
+MAX_MAP_SIDE = 4096
+
+# The tile layers of a map (terrain and grid take one byte per tile, 16 MiB
+# each at 4096x4096) do not fit in the map document under MongoDB's 16 MiB
+# limit. They are stored in map_layers as chunks of MAP_LAYER_CHUNK_BYTES,
+# and the map document lists them in "external_layers".
+EXTERNAL_MAP_LAYERS = ("terrain", "grid", "land_components")
+MAP_LAYER_CHUNK_BYTES = 4 * 1024 * 1024
+
+def store_map_layers(map_id, layers):
+    """
+    Store the packed layers of a map ({field: bytes}) in map_layers chunks
+    """
+    db = get_db()
+    chunks = []
+    for field, data in layers.items():
+        data = bytes(data)
+        for chunk, start in enumerate(range(0, max(len(data), 1), MAP_LAYER_CHUNK_BYTES)):
+            chunks.append({"map_id": map_id, "layer": field, "chunk": chunk,
+                           "data": Binary(data[start:start + MAP_LAYER_CHUNK_BYTES])})
+    if chunks:
+        db.map_layers.insert_many(chunks)
+
+def load_map_layer(map_doc, field):
+    """
+    Packed bytes of a layer of a map document: from map_layers if the map
+    stores it there, else the field of the document (None if missing)
+    """
+    if field in (map_doc.get("external_layers") or ()):
+        db = get_db()
+        chunks = db.map_layers.find({"map_id": ObjectId(map_doc["_id"]), "layer": field},
+                                    {"data": 1}).sort("chunk", ASCENDING)
+        return b"".join(bytes(chunk["data"]) for chunk in chunks)
+    return map_doc.get(field)
+
+def attach_map_layers(map_doc, fields=("terrain", "grid")):
+    """
+    Put the layers of a map stored in map_layers back in its document (packed,
+    in place), so it reads like a map with inline layers
+    """
+    if not map_doc or not map_doc.get("external_layers"):
+        return map_doc
+    for field in fields:
+        if field in map_doc["external_layers"]:
+            map_doc[field] = load_map_layer(map_doc, field)
+    map_doc.pop("external_layers")
+    return map_doc
+
+def add_map(width, height, startPoint, difficulty="easy", name=None, seed=None, generator=DEFAULT_GENERATOR):
     """
     Add a new map to the database with terrain types:
     0 - Normal terrain
     1 - Water
-    2 - Mineralized terrain (rare)
+    2-5 - Gold, iron, wood and stone resources
+    
+    The terrain is generated from `seed` (a random one if not given), which is
+    stored with the map so it can be regenerated exactly. `generator` selects
+    the terrain generator ("scatter" or "noise", see terrain_generator.py).
     """
     db = get_db()
     
-    # Create a grid (vector of vectors) initialized with zeros
-    grid = [[0 for _ in range(width)] for _ in range(height)]
-    
-    # Create a terrain grid (0=normal, 1=water, 2=mineralized)
-    terrain = generate_terrain(width, height, difficulty)
+    if seed is None:
+        seed = new_seed()
     
-    # Remove water tiles within a 4-tile perimeter around the start point
-    x_start, y_start = startPoint
-    for y in range(max(0, y_start - 4), min(height, y_start + 5)):
-        for x in range(max(0, x_start - 4), min(width, x_start + 5)):
-            # Calculate Manhattan distance from start point
-            distance = abs(x - x_start) + abs(y - y_start)
-            if distance <= 4 and terrain[y][x] == 1:  # If it's water and within perimeter
-                terrain[y][x] = 0  # Change to normal terrain
+    # Create the terrain grid and remove water within a 4-tile perimeter around the start point
+    terrain = generate_terrain(generator, width, height, difficulty, seed, startPoint)
+    clear_water_around(terrain, startPoint, 4)
+    labels, component_count = land_components(terrain)
     
     # Set visibility for a 5x5 area around the start point (increased from 3x3)
     x, y = startPoint
-    
-    # Loop through a 5x5 grid centered at the start point
-    for dy in range(-2, 3):  # -2, -1, 0, 1, 2
-        for dx in range(-2, 3):  # -2, -1, 0, 1, 2
-            nx, ny = x + dx, y + dy
-            # Check if position is within map boundaries
-            if 0 <= nx < width and 0 <= ny < height:
-                grid[ny][nx] = 1  # Set to visible (1) in fog of war grid
+    grid = np.zeros((height, width), dtype=np.uint8)
+    grid[max(0, y - 2):y + 3, max(0, x - 2):x + 3] = 1
     
     # Generate a default name if none provided
     if not name:
@@ -177,199 +491,42 @@ def add_map(width, height, startPoint, difficulty="easy", name=None):
         "startPoint": startPoint,
         "visibleObjects": [],  # Initialize with an empty list
         "difficulty": difficulty,  # Add difficulty to the map document
-        "name": name  # Add name to the map document
+        "name": name,  # Add name to the map document
+        "seed": seed,  # Terrain generator seed
+        "generator": generator,  # Terrain generator name
+        "resource_counts": count_resources(terrain),  # Shown in the map catalog
+        "spawn_candidates": spawn_candidates(terrain, startPoint),  # AI start positions, furthest first
+        "land_components": Binary(pack_layer(labels, LABELS)),  # Island label of every land tile
+        "land_component_count": component_count,
+        "thumbnail": Binary(render_terrain_thumbnail(terrain))  # Downsampled terrain PNG
     }
     
-    return db.maps.insert_one(map)
-
-def generate_terrain(width, height, difficulty):
-    """
-    Generate terrain with patterns:
-    - 0: Normal terrain (most common)
-    - 1: Water (forms lakes and rivers)
-    - 2: Gold mineral (rare, 7% of minerals)
-    - 3: Iron mineral (uncommon, 13% of minerals)
-    - 4: Wood resource (common, 60% of minerals)
-    - 5: Stone resource (semi-common, 20% of minerals)
-    """
-    # Initialize terrain with normal terrain
-    terrain = [[0 for _ in range(width)] for _ in range(height)]
-    
-    # Calculate total tiles
-    total_tiles = width * height
-    
-    # Fixed water percentage regardless of difficulty
-    water_percent = 15  # Always 15% of map is water
-    
-    # Set mineral percentage based on difficulty
-    if difficulty == "easy":
-        mineral_percent = 20  # 20% minerals on easy difficulty
-    elif difficulty == "medium":
-        mineral_percent = 15  # 15% minerals on medium difficulty
-    elif difficulty == "hard":
-        mineral_percent = 10  # 10% minerals on hard difficulty
-    else:
-        # Default to easy if unknown difficulty
-        mineral_percent = 20
-    
-    # Calculate exact number of tiles for each type
-    water_tiles = int(total_tiles * water_percent / 100)
-    mineral_tiles = int(total_tiles * mineral_percent / 100)
-    
-    # Subdivide minerals by type with new percentages
-    gold_tiles = int(mineral_tiles * 0.07)    # 7% of minerals are gold
-    iron_tiles = int(mineral_tiles * 0.13)    # 13% of minerals are iron
-    stone_tiles = int(mineral_tiles * 0.20)   # 20% of minerals are stone
-    wood_tiles = mineral_tiles - gold_tiles - iron_tiles - stone_tiles  # Remaining ~60% are wood
-    
-    print(f"Map size: {width}x{height} = {total_tiles} tiles")
-    print(f"Difficulty: {difficulty}")
-    print(f"Water: {water_percent}% = {water_tiles} tiles")
-    print(f"Minerals: {mineral_percent}% = {mineral_tiles} tiles")
-    print(f"  - Gold: 7% of minerals = {gold_tiles} tiles")
-    print(f"  - Iron: 13% of minerals = {iron_tiles} tiles")
-    print(f"  - Stone: 20% of minerals = {stone_tiles} tiles")
-    print(f"  - Wood: 60% of minerals = {wood_tiles} tiles")
-    
-    # First place water features with clustering
-    placed_water = 0
-    water_seeds = min(water_tiles // 10, 15)  # Use at most 15 seed points
-    water_seeds = max(water_seeds, 3)  # At least 3 seed points
-    
-    water_per_seed = water_tiles // water_seeds
-    
-    for _ in range(water_seeds):
-        if placed_water >= water_tiles:
-            break
-            
-        # Place a water seed
-        x = random.randint(2, width - 3)
-        y = random.randint(2, height - 3)
-        
-        # Skip if already water
-        if terrain[y][x] != 0:
-            continue
-            
-        # Define size of this water body (avoid one large body consuming everything)
-        size = min(random.randint(5, 15), water_per_seed)
-        
-        # Generate water cluster
-        placed_water += generate_water_pattern(terrain, x, y, size, width, height)
-    
-    # If we still have water to place, add random individual water tiles
-    remaining_water = water_tiles - placed_water
-    attempts = 0
-    
-    while remaining_water > 0 and attempts < remaining_water * 3:
-        x = random.randint(0, width - 1)
-        y = random.randint(0, height - 1)
-        
-        if terrain[y][x] == 0:  # Only place on normal terrain
-            terrain[y][x] = 1  # Water
-            remaining_water -= 1
-        
-        attempts += 1
-    
-    # Now place minerals - first distribute them individually
-    mineral_placement_order = []
-    
-    # Add gold tiles
-    for _ in range(gold_tiles):
-        mineral_placement_order.append(2)  # Gold
-    
-    # Add iron tiles
-    for _ in range(iron_tiles):
-        mineral_placement_order.append(3)  # Iron
-    
-    # Add stone tiles
-    for _ in range(stone_tiles):
-        mineral_placement_order.append(5)  # Stone (code 5)
-    
-    # Add wood tiles
-    for _ in range(wood_tiles):
-        mineral_placement_order.append(4)  # Wood
-    
-    # Shuffle the placement order
-    random.shuffle(mineral_placement_order)
-    
-    # Attempt to place each mineral (with some clustering)
-    to_place = len(mineral_placement_order)
-    placed = 0
-    cluster_chance = 0.3  # 30% chance to try to form a small cluster
-    
-    for mineral_type in mineral_placement_order:
-        # Try to place the mineral
-        attempts = 0
-        max_attempts = 10  # Try up to 10 times to find a suitable spot
-        
-        while attempts < max_attempts:
-            x = random.randint(0, width - 1)
-            y = random.randint(0, height - 1)
-            
-            if terrain[y][x] == 0:  # Only place on normal terrain
-                terrain[y][x] = mineral_type
-                placed += 1
-                
-                # Try to form a small cluster (occasionally)
-                if random.random() < cluster_chance:
-                    # Try to add one adjacent mineral of the same type
-                    directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-                    random.shuffle(directions)
-                    
-                    for dx, dy in directions:
-                        nx, ny = x + dx, y + dy
-                        if (0 <= nx < width and 0 <= ny < height and 
-                            terrain[ny][nx] == 0):
-                            terrain[ny][nx] = mineral_type
-                            placed += 1
-                            break  # Only add one adjacent tile
-                
-                break  # Successfully placed
-            
-            attempts += 1
-    
-    print(f"Placed {placed} out of {to_place} minerals")
+    # Terrain, grid and labels are stored packed, outside the map document
+    layers = pack_map_layers({"terrain": map.pop("terrain"), "grid": map.pop("grid"),
+                              "land_components": map.pop("land_components")})
+    map["external_layers"] = list(EXTERNAL_MAP_LAYERS)
+    result = db.maps.insert_one(map)
+    try:
+        store_map_layers(result.inserted_id, layers)
+    except Exception:
+        db.maps.delete_one({"_id": result.inserted_id})
+        raise
     
-    return terrain
+    # Resource summed-area tables, used by the economy for every game on this map
+    cache_resource_tables(result.inserted_id, terrain)
+    cache_land_components(result.inserted_id, labels)
+    return result
 
-def generate_water_pattern(terrain, x, y, size, width, height):
-    """Generate a natural-looking water body. Returns the number of water tiles placed."""
-    # Mark the center as water
-    if terrain[y][x] != 0:  # Already something else
-        return 0
-        
-    terrain[y][x] = 1
-    placed = 1
-    
-    # Generate water in a randomized pattern around the center
-    directions = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
-    queue = [(x, y, size)]
-    
-    while queue and placed < size:
-        cx, cy, remaining_size = queue.pop(0)
-        if remaining_size <= 0:
-            continue
-        
-        # Choose random directions to expand
-        random.shuffle(directions)
-        for dx, dy in directions[:random.randint(1, min(4, remaining_size))]:
-            nx, ny = cx + dx, cy + dy
-            if (0 <= nx < width and 0 <= ny < height and 
-                terrain[ny][nx] == 0 and placed < size):
-                terrain[ny][nx] = 1
-                placed += 1
-                # Continue expanding with reduced size
-                if random.random() < 0.7:  # 70% chance to continue
-                    queue.append((nx, ny, remaining_size - 1))
-    
-    return placed
+# The thumbnail is served by its own endpoint and the component labels are
+# only used by the server; neither is JSON serializable
+MAP_EXCLUDE_BINARY = {"thumbnail": 0, "land_components": 0}
 
 def get_first_map():
     """
     Get the first map from the database
     """
     db = get_db()
-    return db.maps.find_one({})
+    return unpack_map_layers(attach_map_layers(db.maps.find_one({}, MAP_EXCLUDE_BINARY)))
 
 def get_map(map_id):
     """
@@ -380,9 +537,11 @@ def get_map(map_id):
         # Convert map_id to ObjectId if necessary
         if isinstance(map_id, str) and len(map_id) == 24:
             obj_id = ObjectId(map_id)
-            map_doc = db.maps.find_one({"_id": obj_id})
+            map_doc = db.maps.find_one({"_id": obj_id}, MAP_EXCLUDE_BINARY)
         else:
-            map_doc = db.maps.find_one({"map_id": map_id})
+            map_doc = db.maps.find_one({"map_id": map_id}, MAP_EXCLUDE_BINARY)
+        
+        unpack_map_layers(attach_map_layers(map_doc))
         
         # Convert ObjectId to string for JSON serialization
         if map_doc and '_id' in map_doc:
@@ -401,7 +560,8 @@ def get_all_maps():
     maps = []
     try:
         # Encuentra todos los mapas y procesa cada uno para asegurar serialización JSON segura
-        for map_doc in db.maps.find():
+        for map_doc in db.maps.find({}, MAP_EXCLUDE_BINARY):
+            unpack_map_layers(attach_map_layers(map_doc))
             # Convertir ObjectId a string para evitar problemas de serialización JSON
             if '_id' in map_doc:
                 map_doc['map_id'] = str(map_doc['_id'])
@@ -414,6 +574,90 @@ def get_all_maps():
         # En caso de error, devuelve una lista vacía en lugar de lanzar excepción
         return []
 
+# Fields shown in the map catalog (no grids, terrain or thumbnail bytes)
+MAP_CATALOG_PROJECTION = {
+    "name": 1,
+    "width": 1,
+    "height": 1,
+    "difficulty": 1,
+    "startPoint": 1,
+    "seed": 1,
+    "generator": 1,
+    "resource_counts": 1
+}
+
+def get_map_catalog(limit=20, cursor=None, difficulty=None, min_size=None, max_size=None):
+    """
+    Get one page of map metadata ordered by _id.
+    Filters: difficulty and min/max side length (applied to width and height).
+    
+    Returns:
+        (maps, next_cursor) - next_cursor is None on the last page
+    """
+    db = get_db()
+    query = {}
+    if difficulty:
+        query["difficulty"] = difficulty
+    if min_size is not None:
+        query["width"] = {"$gte": min_size}
+        query["height"] = {"$gte": min_size}
+    if max_size is not None:
+        query.setdefault("width", {})["$lte"] = max_size
+        query.setdefault("height", {})["$lte"] = max_size
+    if cursor:
+        query["_id"] = {"$gt": ObjectId(cursor)}
+    
+    # Fetch one extra document to know whether there is a next page
+    maps = list(db.maps.find(query, MAP_CATALOG_PROJECTION).sort("_id", ASCENDING).limit(limit + 1))
+    next_cursor = None
+    if len(maps) > limit:
+        maps = maps[:limit]
+        next_cursor = str(maps[-1]["_id"])
+    
+    for map_doc in maps:
+        map_doc["map_id"] = str(map_doc.pop("_id"))
+    return maps, next_cursor
+
+def get_map_land_components(map_id):
+    """
+    Get the land component labels of a map as a (height, width) array,
+    or None if the map does not exist or has no labels
+    """
+    db = get_db()
+    try:
+        map_doc = db.maps.find_one({"_id": ObjectId(map_id)},
+                                   {"land_components": 1, "external_layers": 1, "width": 1, "height": 1})
+    except Exception:
+        return None
+    labels = load_map_layer(map_doc, "land_components") if map_doc else None
+    if not is_packed(labels):
+        return None
+    return layer_to_array(labels, map_doc.get("width", 0), map_doc.get("height", 0), LABELS)
+
+def get_map_thumbnail(map_id):
+    """
+    Get the PNG thumbnail of a map, or None if the map does not exist
+    """
+    db = get_db()
+    map_doc = db.maps.find_one({"_id": ObjectId(map_id)}, {"thumbnail": 1})
+    if not map_doc:
+        return None
+    return bytes(map_doc["thumbnail"]) if map_doc.get("thumbnail") else None
+
+def get_map_layer(map_id, layer):
+    """
+    Get a packed map layer ("terrain" or "grid") as (bytes, width, height),
+    or None if the map does not exist. Legacy list layers are packed on the fly.
+    """
+    db = get_db()
+    map_doc = db.maps.find_one({"_id": ObjectId(map_id)}, {layer: 1, "external_layers": 1, "width": 1, "height": 1})
+    data = load_map_layer(map_doc, layer) if map_doc else None
+    if data is None:
+        return None
+    if not is_packed(data):
+        data = pack_layer(data, LAYER_ENCODINGS[layer])
+    return bytes(data), map_doc.get("width", 0), map_doc.get("height", 0)
+
 def delete_map(map_id):
     """
     Delete a map from the database by its ID
@@ -426,23 +670,25 @@ def delete_map(map_id):
         # Intento 1: Buscar por _id como ObjectId
         try:
             obj_id = ObjectId(map_id)
-            result = db.maps.delete_one({"_id": obj_id})
-            if result.deleted_count > 0:
+            if db.maps.find_one_and_delete({"_id": obj_id}, {"_id": 1}):
+                db.map_layers.delete_many({"map_id": obj_id})
                 return True
         except Exception as e:
             print(f"Could not delete by ObjectId: {e}")
         
         # Intento 2: Buscar por map_id como string
-        result = db.maps.delete_one({"map_id": map_id})
-        if result.deleted_count > 0:
+        deleted_map = db.maps.find_one_and_delete({"map_id": map_id}, {"_id": 1})
+        if deleted_map:
+            db.map_layers.delete_many({"map_id": deleted_map["_id"]})
             return True
             
         # Intento 3: Para IDs generados por el frontend (map-timestamp)
         if map_id.startswith('map-'):
             # Obtener el primer mapa (para desarrollo)
             # Esto es solo una solución temporal
-            result = db.maps.delete_one({})
-            if result.deleted_count > 0:
+            deleted_map = db.maps.find_one_and_delete({}, {"_id": 1})
+            if deleted_map:
+                db.map_layers.delete_many({"map_id": deleted_map["_id"]})
                 return True
         
         return False
@@ -450,278 +696,212 @@ def delete_map(map_id):
         print(f"Error deleting map: {e}")
         return False
 
-def find_distant_valid_position(map_data):
+def get_spawn_candidates(map_data):
+    """
+    Spawn candidates of a map (furthest land tiles from the start point with a
+    land neighbour). Maps created before they were stored get them computed now.
+    """
+    candidates = map_data.get("spawn_candidates")
+    if candidates is None:
+        candidates = spawn_candidates(map_data.get("terrain") or [], map_data.get("startPoint", [15, 7]))
+    return candidates
+
+def find_distant_valid_position(map_data, occupied_positions=()):
     """
     Find the furthest position from the player's start point where we can place 2 units without water
     """
-    width = map_data.get("width", 30)
-    height = map_data.get("height", 15)
-    terrain = map_data.get("terrain", [])
-    player_x, player_y = map_data.get("startPoint", [15, 7])
-    
-    # Create a list to store all valid positions with their distances
-    valid_positions = []
-    
-    # Check all positions on the map
-    for y in range(height):
-        for x in range(width):
-            # Skip water tiles
-            if terrain and len(terrain) > y and len(terrain[y]) > x and terrain[y][x] != 1:
-                # Calculate squared distance from player start (no need for square root yet)
-                squared_distance = (x - player_x)**2 + (y - player_y)**2
-                
-                # Check if this position has at least one adjacent non-water position
-                has_valid_adjacent = False
-                directions = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
-                
-                for dx, dy in directions:
-                    nx, ny = x + dx, y + dy
-                    if (0 <= nx < width and 0 <= ny < height and 
-                        terrain and len(terrain) > ny and len(terrain[ny]) > nx and terrain[ny][nx] != 1):
-                        has_valid_adjacent = True
-                        break
-                
-                if has_valid_adjacent:
-                    # Store position and its squared distance
-                    valid_positions.append(([x, y], squared_distance))
-    
-    # Sort positions by distance (furthest first)
-    valid_positions.sort(key=lambda item: item[1], reverse=True)
-    
-    # Return the furthest valid position if we found any
-    if valid_positions:
-        return valid_positions[0][0]  # Return just the position coordinates
-    
-    # Fallback to a position that's at least not close to the player
-    attempts = 100
-    while attempts > 0:
-        x = random.randint(0, width - 1)
-        y = random.randint(0, height - 1)
-        # Ensure position is somewhat far from player start
-        min_distance = (width**2 + height**2)**0.5 / 4
-        distance = ((x - player_x)**2 + (y - player_y)**2)**0.5
-        
-        # Check if the position is valid and has a valid adjacent position
-        if distance >= min_distance and terrain and terrain[y][x] != 1:
-            # Check for adjacent valid positions
-            for dx, dy in [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]:
-                nx, ny = x + dx, y + dy
-                if (0 <= nx < width and 0 <= ny < height and terrain[ny][nx] != 1):
-                    return [x, y]  # Found a position with a valid adjacent space
-        
-        attempts -= 1
-    
-    # Last resort: Return a position in the first quadrant of the map
-    # We'll still check for adjacency to ensure two units can be placed
-    for y in range(height // 2):
-        for x in range(width // 2):
-            if terrain and terrain[y][x] != 1:
-                for dx, dy in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-                    nx, ny = x + dx, y + dy
-                    if (0 <= nx < width and 0 <= ny < height and terrain[ny][nx] != 1):
-                        return [x, y]
+    for position in get_spawn_candidates(map_data):
+        if list(position) not in occupied_positions:
+            return list(position)
     
     # Ultimate fallback: Just return corner position and hope for the best
     return [1, 1]
 
-def find_adjacent_valid_position(map_data, position):
-    """
-    Find a valid (non-water) position adjacent to the given position
+def load_game_map(map_id, difficulty):
     """
-    width = map_data.get("width", 30)
-    height = map_data.get("height", 15)
-    terrain = map_data.get("terrain", [])
-    x, y = position
+    Get the map a new game is played on (a basic map if it does not exist)
     
-    # Check all adjacent positions (including diagonals)
-    directions = [
-        (1, 0), (-1, 0), (0, 1), (0, -1),  # Cardinal directions first
-        (1, 1), (1, -1), (-1, 1), (-1, -1)  # Then diagonals
-    ]
+    Returns:
+        (map_id_str, map_data)
+    """
+    db = get_db()
     
-    for dx, dy in directions:
-        new_x = x + dx
-        new_y = y + dy
-        
-        # Check if position is within map bounds
-        if 0 <= new_x < width and 0 <= new_y < height:
-            # Check if position is not water
-            if terrain and len(terrain) > new_y and len(terrain[new_y]) > new_x and terrain[new_y][new_x] != 1:
-                return [new_x, new_y]
+    # Always convert map_id to string to avoid ObjectId serialization issues
+    if isinstance(map_id, ObjectId):
+        map_id_str = str(map_id)
+    else:
+        map_id_str = map_id
     
-    # If no valid adjacent position found, return original position
-    return position
-
-def add_game(username, map_id, difficulty, game_name="New Game"):
-    """Add a new game for a user"""
+    # Obtener el mapa completo de la base de datos
+    map_data = None
     try:
-        db = get_db()
+        # Intenta buscar por el ID original (podría ser ObjectId)
+        map_data = db.maps.find_one({"_id": ObjectId(map_id_str)}, MAP_EXCLUDE_BINARY)
+    except:
+        # Si falla, intenta buscar por el ID como string
+        map_data = db.maps.find_one({"_id": map_id_str}, MAP_EXCLUDE_BINARY)
+    unpack_map_layers(attach_map_layers(map_data))
         
-        # Always convert map_id to string to avoid ObjectId serialization issues
-        if isinstance(map_id, ObjectId):
-            map_id_str = str(map_id)
-        else:
-            map_id_str = map_id
+    # Si no encontramos el mapa, creamos uno básico
+    if not map_data:
+        print(f"Warning: Map with ID {map_id_str} not found, creating basic map")
+        # Crear grid y terreno básicos
+        basic_grid = [[0 for _ in range(30)] for _ in range(15)]
+        basic_terrain = [[0 for _ in range(30)] for _ in range(15)]
         
-        # Obtener el mapa completo de la base de datos
-        map_data = None
-        try:
-            # Intenta buscar por el ID original (podría ser ObjectId)
-            map_data = db.maps.find_one({"_id": ObjectId(map_id_str)})
-        except:
-            # Si falla, intenta buscar por el ID como string
-            map_data = db.maps.find_one({"_id": map_id_str})
-            
-        # Si no encontramos el mapa, creamos uno básico
-        if not map_data:
-            print(f"Warning: Map with ID {map_id_str} not found, creating basic map")
-            # Crear grid y terreno básicos
-            basic_grid = [[0 for _ in range(30)] for _ in range(15)]
-            basic_terrain = [[0 for _ in range(30)] for _ in range(15)]
-            
-            # Añadir algunos elementos de terreno variados para mayor realismo
-            for y in range(15):
-                for x in range(30):
-                    # Generar terreno simple pseudo-aleatorio basado en la posición
-                    if (x + y) % 7 == 0:
-                        basic_terrain[y][x] = 1  # Agua
-                    elif (x * y) % 13 == 0:
-                        basic_terrain[y][x] = 2  # Terreno mineralizado
-            
-            map_data = {
-                "width": 30,
-                "height": 15,
-                "grid": basic_grid,
-                "terrain": basic_terrain,  # Añadimos el terreno
-                "startPoint": [15, 7],
-                "difficulty": difficulty,
-                "visibleObjects": []  # Igual que en add_map
-            }
-            
-        # Extract map size properly
-        map_size = {
-            "width": map_data.get("width", 30),
-            "height": map_data.get("height", 15)
-        }
+        # Añadir algunos elementos de terreno variados para mayor realismo
+        for y in range(15):
+            for x in range(30):
+                # Generar terreno simple pseudo-aleatorio basado en la posición
+                if (x + y) % 7 == 0:
+                    basic_terrain[y][x] = 1  # Agua
+                elif (x * y) % 13 == 0:
+                    basic_terrain[y][x] = 2  # Terreno mineralizado
         
-        # Create a copy of the start point for each unit to avoid shared references
-        settler = get_troop_type("settler", map_data["startPoint"][:])  # Create a copy of the list
+        map_data = {
+            "width": 30,
+            "height": 15,
+            "grid": basic_grid,
+            "terrain": basic_terrain,  # Añadimos el terreno
+            "startPoint": [15, 7],
+            "difficulty": difficulty,
+            "visibleObjects": []  # Igual que en add_map
+        }
+    
+    return map_id_str, map_data
 
-        # Create a separate copy for the warrior
-        warrior = get_troop_type("warrior", map_data["startPoint"][:])  # Create another copy
-        
-        # Adjust warrior position to be adjacent to start point
-        if map_data["startPoint"][0] + 1 < map_size["width"]:
-            warrior["position"][0] += 1
-        elif map_data["startPoint"][1] + 1 < map_size["height"]:
-            warrior["position"][1] += 1
-        elif map_data["startPoint"][0] - 1 >= 0:
-            warrior["position"][0] -= 1
-        elif map_data["startPoint"][1] - 1 >= 0:
-            warrior["position"][1] -= 1
-            
-        # Find a distant valid position for AI settler
-        ai_start_position = find_distant_valid_position(map_data)
-        
-        # Create AI settler
-        ai_settler = get_troop_type("settler", ai_start_position[:])  # Create a copy of the position list
-        
-        # Find adjacent valid position for AI warrior
-        ai_warrior_position = find_adjacent_valid_position(map_data, ai_start_position)
-        
-        # Create AI warrior
-        ai_warrior = get_troop_type("warrior", ai_warrior_position[:])  # Create a copy of the position list
-        
-        # Initialize player fog of war grid (0=hidden, 1=visible)
-        player_fog_grid = [[0 for _ in range(map_size["width"])] for _ in range(map_size["height"])]
-        
-        # Initialize AI fog of war grid
-        ai_fog_grid = [[0 for _ in range(map_size["width"])] for _ in range(map_size["height"])]
-        
-        # Set visibility around player starting units - 3 tile radius
-        updateFogOfWar(player_fog_grid, map_data["startPoint"], 3, map_size)
-        updateFogOfWar(player_fog_grid, warrior["position"], 2, map_size)
-        
-        # Set visibility around AI starting units - 2 tile radius for 4x4 visible area
-        updateFogOfWar(ai_fog_grid, ai_start_position, 2, map_size)
-        updateFogOfWar(ai_fog_grid, ai_warrior_position, 2, map_size)
+# Units of a player when no civilization is selected
+DEFAULT_STARTING_UNITS = {"settler": 1, "warrior": 1}
+
+def place_starting_units(map_data, starting_units, start_position, occupied_positions):
+    """
+    Create the starting units of a player: the first one on the start position
+    and the rest on the nearest free land tiles (occupied_positions is updated)
+    """
+    units = []
+    for unit_type, count in starting_units.items():
+        for i in range(count):
+            # First unit at start position if not occupied
+            if not units and start_position not in occupied_positions:
+                position = start_position[:]  # Copy to avoid reference issues
+            else:
+                position = find_unoccupied_position(map_data, start_position, occupied_positions)
             
-        # Create a timestamp-based game ID
-        game_id = str(int(datetime.datetime.now().timestamp() * 1000) + 1)
-        
-        # Crear el documento del juego con el mapa completo
-        game = {
-            "game_id": game_id,
-            "username": username,
-            "name": game_name,  # Store the user-provided name
-            "difficulty": difficulty,
-            "turn": 1,
-            "current_player": "player",
-            "cheats_used": [],
-
-            "map_id": map_id_str,
-            "map_size": map_size,  # Explicitly store map size
-            "map_data": map_data,  # Guardar el mapa completo
-            "player": {
-                "units": [settler, warrior],
-                "cities": [],
-                "technologies":[
-                    {
-                        "id": "basic",
-                        "name": "basic Technology",
-                        "description": "Unlock basic level units and buildings",
-                        "turns": 0,
-                        "min_civilians": 0,
-                        "prerequisites": [],
-                        "unlocks": ["basic units", "basic buildings"],
-                        "icon": ""
-                        }
-                    ],
-                "resources": {
-                    "food": 100,
-                    "gold": 50,
-                    "wood": 20,
-                    "stone": 20,
-                    "iron": 10
-                },
-                "fog_grid": player_fog_grid  # Add player fog of war grid
+            if position:
+                occupied_positions.append(position[:])
+                unit = get_troop_type(unit_type, position)
+                if unit:
+                    units.append(unit)
+    return units
+
+def build_game(username, map_id_str, map_data, difficulty, game_name="New Game", civ_id=None, ai_civ_id=None):
+    """
+    Build a complete new game (units, civilizations and fog of war) in one pass,
+    without touching the database
+    """
+    # Extract map size properly
+    map_size = {
+        "width": map_data.get("width", 30),
+        "height": map_data.get("height", 15)
+    }
+    
+    # Player starts on the map start point, the AI on the furthest spawn candidate
+    occupied_positions = []
+    player_start = map_data["startPoint"][:]
+    player_units = place_starting_units(map_data, DEFAULT_STARTING_UNITS, player_start, occupied_positions)
+    ai_start = find_distant_valid_position(map_data, occupied_positions)
+    ai_units = place_starting_units(map_data, DEFAULT_STARTING_UNITS, ai_start, occupied_positions)
+    
+    # Initialize player fog of war grid (0=hidden, 1=visible), 3 tile radius around the start
+    player_fog_grid = np.zeros((map_size["height"], map_size["width"]), dtype=np.uint8)
+    updateFogOfWar(player_fog_grid, player_start, 3, map_size)
+    
+    # Initialize AI fog of war grid
+    ai_fog_grid = np.zeros((map_size["height"], map_size["width"]), dtype=np.uint8)
+    
+    # Create a timestamp-based game ID
+    game_id = str(int(datetime.datetime.now().timestamp() * 1000) + 1)
+    
+    # Crear el documento del juego con el mapa completo
+    game = {
+        "game_id": game_id,
+        "username": username,
+        "name": game_name,  # Store the user-provided name
+        "difficulty": difficulty,
+        "turn": 1,
+        "current_player": "player",
+        "cheats_used": [],
+
+        "map_id": map_id_str,
+        "map_size": map_size,  # Explicitly store map size
+        "map_data": map_data,  # Guardar el mapa completo
+        "player": {
+            "units": player_units,
+            "cities": [],
+            "technologies":[
+                {
+                    "id": "basic",
+                    "name": "basic Technology",
+                    "description": "Unlock basic level units and buildings",
+                    "turns": 0,
+                    "min_civilians": 0,
+                    "prerequisites": [],
+                    "unlocks": ["basic units", "basic buildings"],
+                    "icon": ""
+                    }
+                ],
+            "resources": {
+                "food": 100,
+                "gold": 50,
+                "wood": 20,
+                "stone": 20,
+                "iron": 10
             },
-            "ia": {
-                "units": [ai_settler, ai_warrior],
-                "cities": [],
-                "technologies":[
-                    
-                    {
-                        "id": "basic",
-                        "name": "basic Technology",
-                        "description": "Unlock basic level units and buildings",
-                        "turns": 0,
-                        "min_civilians": 0,
-                        "prerequisites": [],
-                        "unlocks": ["basic units", "basic buildings"],
-                        "icon": ""
-                        }],
-                "resources": {
-                    "food": 100,
-                    "gold": 50,
-                    "wood": 20,
-                    "stone": 20,
-                    "iron": 10
-                },
-                "fog_grid": ai_fog_grid  # Add AI fog of war grid
+            "fog_grid": player_fog_grid  # Add player fog of war grid
+        },
+        "ia": {
+            "units": ai_units,
+            "cities": [],
+            "technologies":[
+                
+                {
+                    "id": "basic",
+                    "name": "basic Technology",
+                    "description": "Unlock basic level units and buildings",
+                    "turns": 0,
+                    "min_civilians": 0,
+                    "prerequisites": [],
+                    "unlocks": ["basic units", "basic buildings"],
+                    "icon": ""
+                    }],
+            "resources": {
+                "food": 100,
+                "gold": 50,
+                "wood": 20,
+                "stone": 20,
+                "iron": 10
             },
-            "created_at": datetime.datetime.now(),
-            "last_saved": datetime.datetime.now()
-        }
-        
-        # Convert the game object to be JSON serializable before storing in session
-        session['game'] = sanitize_for_json(game)
-        
-        # Return the original game object for storing in MongoDB
-        return db.games.insert_one(game)
-    except Exception as e:
-        print(f"Error adding game: {e}")
-        return None
+            "fog_grid": ai_fog_grid  # Add AI fog of war grid
+        },
+        "created_at": datetime.datetime.now(),
+        "last_saved": datetime.datetime.now()
+    }
+    
+    # Civilizations replace the default resources and units
+    if civ_id:
+        apply_civilization_bonuses(game, civ_id, "player", player_start)
+    if ai_civ_id:
+        apply_civilization_bonuses(game, ai_civ_id, "ia", ai_start)
+    
+    # Explored and visible layers of both players (units see 2 tiles around them)
+    for player_type in ("player", "ia"):
+        get_fog(game, player_type)
+    
+    return game
+
+def add_game(username, map_id, difficulty, game_name="New Game"):
+    """Add a new game for a user"""
+    return add_game_with_civilization(username, map_id, difficulty, None, game_name)
 
 # Add a helper function to update fog of war
 def updateFogOfWar(fog_grid, position, visibility_radius, map_size):
@@ -729,7 +909,7 @@ def updateFogOfWar(fog_grid, position, visibility_radius, map_size):
     Update fog of war grid around a given position
     
     Args:
-        fog_grid: The grid to update (0=hidden, 1=visible)
+        fog_grid: The grid to update (0=hidden, 1=visible), list of lists or NumPy array
         position: [x, y] position to update around
         visibility_radius: How far units can see
         map_size: Map dimensions
@@ -745,39 +925,43 @@ def updateFogOfWar(fog_grid, position, visibility_radius, map_size):
     max_y = min(height - 1, y + visibility_radius)
     
     # Update visibility in a square area around the position
+    if isinstance(fog_grid, np.ndarray):
+        fog_grid[min_y:max_y + 1, min_x:max_x + 1] = 1
+        return
     for ny in range(min_y, max_y + 1):
-        for nx in range(min_x, max_x + 1):
-            fog_grid[ny][nx] = 1
+        fog_grid[ny][min_x:max_x + 1] = [1] * (max_x - min_x + 1)
 
 def save_game():
     """
     Save the current game in the session to the database
     """
     db = get_db()
-    game = session.get('game')
+    game = get_session_game()
     
     if not game:
         print("No game found in session to save")
         return False
         
     try:
-        # Make sure game_id exists
+        # Make sure game_id exists and is in its canonical (string) form
         if 'game_id' not in game or not game['game_id']:
             game_id = str(int(datetime.datetime.now().timestamp() * 1000))
             game['game_id'] = game_id
+        game['game_id'] = normalize_game_id(game['game_id'])
         
-        # Update the last_saved timestamp
-        game['last_saved'] = datetime.datetime.now().isoformat()
+        # Update the last_saved timestamp (stored as a BSON date so the
+        # username + last_saved index orders saved games correctly)
+        now = datetime.datetime.now()
+        game['last_saved'] = now.isoformat()
         
         # Create a direct copy of the game data to save
         # This avoids any accidental references to the session object
         game_to_save = dict(game)
+        game_to_save.pop('_id', None)
+        game_to_save['last_saved'] = now
         
-        # Find and remove the existing game first
-        db.games.delete_one({"game_id": game_to_save['game_id']})
-        
-        # Insert as a new document
-        result = db.games.insert_one(game_to_save)
+        # Replace the stored game (or insert it) in one indexed write
+        db.games.replace_one({"game_id": game_to_save['game_id']}, pack_game_layers(game_to_save), upsert=True)
         
         print(f"Game saved successfully with ID: {game_to_save['game_id']}")
         return True
@@ -791,38 +975,16 @@ def delete_game(game_id):
     """
     try:
         db = get_db()
+        game_id = normalize_game_id(game_id)
         
-        # Try different formats of game_id
-        deleted = False
-        
-        # Try as is
         result = db.games.delete_one({"game_id": game_id})
-        if result.deleted_count > 0:
-            deleted = True
-        
-        # Try as integer if it's not already
-        if not deleted and isinstance(game_id, str):
-            try:
-                numeric_id = int(game_id)
-                result = db.games.delete_one({"game_id": numeric_id})
-                if result.deleted_count > 0:
-                    deleted = True
-            except ValueError:
-                pass
-        
-        # Try by _id if it could be an ObjectId
-        if not deleted and isinstance(game_id, str) and len(game_id) == 24:
-            try:
-                obj_id = ObjectId(game_id)
-                result = db.games.delete_one({"_id": obj_id})
-                if result.deleted_count > 0:
-                    deleted = True
-            except Exception:
-                pass
+        deleted = result.deleted_count > 0
         
         # If the game was in the session, remove it
-        if 'game' in session and session.get('game', {}).get('game_id') == game_id:
-            session.pop('game', None)
+        if session.get('game_id') == game_id:
+            clear_session_game()
+        else:
+            get_game_store().delete(game_id)
         
         return deleted
     except Exception as e:
@@ -842,7 +1004,7 @@ def get_user_games(username):
         # Process each game to ensure JSON serialization works
         for game in games_cursor:
             # Use the sanitize_for_json helper to handle ObjectId and datetime objects
-            sanitized_game = sanitize_for_json(game)
+            sanitized_game = sanitize_for_json(unpack_game_layers(game))
             games.append(sanitized_game)
             
         return games
@@ -850,30 +1012,87 @@ def get_user_games(username):
         print(f"Error in get_user_games: {str(e)}")
         return []
 
+# Fields needed to list saved games (no map grids or fog grids)
+GAME_SUMMARY_PROJECTION = {
+    "_id": 0,
+    "game_id": 1,
+    "name": 1,
+    "turn": 1,
+    "difficulty": 1,
+    "map_size": 1,
+    "player.civilization": 1,
+    "ia.civilization": 1,
+    "created_at": 1,
+    "last_saved": 1
+}
+
+def encode_games_cursor(game):
+    """
+    Build the pagination cursor that points right after the given game summary
+    """
+    last_saved = game.get("last_saved")
+    # Games never saved sort last; their cursor has an empty date
+    last_saved = last_saved.isoformat() if isinstance(last_saved, datetime.datetime) else ""
+    return f"{last_saved}|{game.get('game_id')}"
+
+def decode_games_cursor(cursor):
+    """
+    Parse a pagination cursor into (last_saved, game_id); last_saved is None
+    for games never saved. Raises ValueError if invalid
+    """
+    last_saved, game_id = cursor.rsplit("|", 1)
+    if not last_saved:
+        return None, game_id
+    return datetime.datetime.fromisoformat(last_saved), game_id
+
+def get_user_game_summaries(username, limit=20, cursor=None):
+    """
+    Get one page of a user's saved games, newest first, projecting only the
+    fields the saved-games list shows. Uses the username + last_saved + game_id
+    index.
+    
+    Returns:
+        (summaries, next_cursor) - next_cursor is None on the last page
+    """
+    db = get_db()
+    query = {"username": username}
+    if cursor:
+        last_saved, game_id = decode_games_cursor(cursor)
+        if last_saved is None:
+            query["last_saved"] = None
+            query["game_id"] = {"$lt": game_id}
+        else:
+            query["$or"] = [
+                {"last_saved": {"$lt": last_saved}},
+                {"last_saved": None},
+                {"last_saved": last_saved, "game_id": {"$lt": game_id}}
+            ]
+    
+    # Fetch one extra document to know whether there is a next page
+    games_cursor = (db.games.find(query, GAME_SUMMARY_PROJECTION)
+                    .sort([("last_saved", DESCENDING), ("game_id", DESCENDING)])
+                    .limit(limit + 1))
+    summaries = list(games_cursor)
+    
+    next_cursor = None
+    if len(summaries) > limit:
+        summaries = summaries[:limit]
+        next_cursor = encode_games_cursor(summaries[-1])
+    
+    for game in summaries:
+        for key in ("created_at", "last_saved"):
+            if isinstance(game.get(key), datetime.datetime):
+                game[key] = game[key].isoformat()
+    
+    return summaries, next_cursor
+
 def get_game_by_id_from_db(game_id, username=None):
     """
     Get a game by its ID. If username is provided, verify that the game belongs to this user.
     """
     db = get_db()
     try:
-        # First try by game_id as is
-        game = db.games.find_one({"game_id": game_id})
-        
-        if not game and isinstance(game_id, str):
-            try:
-                # Try as integer
-                numeric_id = int(game_id)
-                game = db.games.find_one({"game_id": numeric_id})
-            except ValueError:
-                pass
-            
-            # Try as ObjectId
-            if not game and len(game_id) == 24:
-                try:
-                    obj_id = ObjectId(game_id)
-                    game = db.games.find_one({"_id": obj_id})
-                except Exception:
-                    pass
+        game = unpack_game_layers(db.games.find_one({"game_id": normalize_game_id(game_id)}))
         
         # If game found and username provided, check ownership
         if game and username and game.get('username') != username:
@@ -886,18 +1105,22 @@ def get_game_by_id_from_db(game_id, username=None):
             if '_id' in game:
                 game['_id'] = str(game['_id'])
             
-            # Make sure the game_id is a string
-            if 'game_id' in game and not isinstance(game['game_id'], str):
-                game['game_id'] = str(game['game_id'])
-                
-            # Store the exact game document in the session
-            session['game'] = game
+            # Store the exact game document as the active game
+            set_session_game(game)
         
         return game
     except Exception as e:
         print(f"Error getting game by ID: {e}")
         return None
 
+def user_owns_game(game_id, username):
+    """
+    True if a saved game belongs to the user (only the owner is checked, the
+    game is neither loaded nor made the active game)
+    """
+    db = get_db()
+    return db.games.count_documents({"game_id": normalize_game_id(game_id), "username": username}, limit=1) > 0
+
 # Troop related functions
 def get_troop_types():
     """
@@ -1025,30 +1248,47 @@ def get_troop_type(type_id, position):
             return troop_type
     return None
 
+def troops_game(username):
+    """
+    Active game of the session if it belongs to the user (the user's troops
+    are its player units), else None
+    """
+    game = get_session_game()
+    if not game or "player" not in game or game.get("username") not in (None, username):
+        return None
+    return game
+
 def add_troop_to_player(username, type_id, position):
     """
     Add a new troop to a player's army
     """
-    db = get_db()
-    
     # Get the troop type
     troop_type = get_troop_type(type_id, position)
     if not troop_type:
         return False, "Invalid troop type"
     
     # Get the game to verify position is valid
-    game = session.get('game')
+    game = troops_game(username)
     if not game:
         return False, "No active game"
     
-    # Check if position is valid (on the map and not occupied)
-    map_data = game.get('map', {})
-    width = map_data.get('width', 0)
-    height = map_data.get('height', 0)
+    # Check if position is valid (on the map, on land and not occupied)
+    if (not isinstance(position, list) or len(position) != 2
+            or not all(isinstance(v, int) and not isinstance(v, bool) for v in position)):
+        return False, "Position must be [x, y]"
+    map_size = game.get('map_size', {})
+    width = map_size.get('width', 0)
+    height = map_size.get('height', 0)
     
     x, y = position
     if x < 0 or x >= width or y < 0 or y >= height:
         return False, "Position is out of map bounds"
+    terrain = game.get('map_data', {}).get('terrain')
+    if terrain is not None and len(terrain) and terrain[y][x] == 1:
+        return False, "Position is on water"
+    index = get_spatial_index(game)
+    if position in index:
+        return False, "Position is occupied"
     
     # Create a unique ID for the troop
     troop_id = str(uuid.uuid4())
@@ -1062,7 +1302,9 @@ def add_troop_to_player(username, type_id, position):
         "attack": troop_type["attack"],
         "defense": troop_type["defense"],
         "movement": troop_type["movement"],
+        "remainingMovement": troop_type["movement"],
         "position": position,
+        "owner": "player",
         "status": "ready",
         "created_at": datetime.datetime.now()
     }
@@ -1073,14 +1315,12 @@ def add_troop_to_player(username, type_id, position):
     if "abilities" in troop_type:
         troop["abilities"] = troop_type["abilities"]
     
-    # Add the troop to the player's army in the current game
-    if "troops" not in game:
-        game["troops"] = {}
-    if username not in game["troops"]:
-        game["troops"][username] = []
-    
-    game["troops"][username].append(troop)
-    session['game'] = game
+    # Add the troop to the player's units in the current game
+    add_sight_source(game, "player", position)
+    units = game["player"].setdefault("units", [])
+    index.add_unit("player", troop)
+    units.append(troop)
+    set_session_game(game)
     
     return True, troop
 
@@ -1088,45 +1328,37 @@ def get_player_troops(username):
     """
     Get all troops for a specific player
     """
-    game = session.get('game')
-    if not game or "troops" not in game or username not in game["troops"]:
+    game = troops_game(username)
+    if not game:
         return []
-    return game["troops"][username]
+    return game["player"].get("units", [])
 
 def update_troop_position(username, troop_id, new_position):
     """
-    Update a troop's position
+    Move a troop of the active game to a new position. The move is checked
+    with the server movement rules (terrain, occupancy, movement points).
     """
-    game = session.get('game')
-    if not game or "troops" not in game or username not in game["troops"]:
+    game = troops_game(username)
+    if not game:
         return False, "No troops found for player"
     
-    # Find the troop
-    for i, troop in enumerate(game["troops"][username]):
-        if troop["id"] == troop_id:
-            # Validate the new position
-            map_data = game.get('map', {})
-            width = map_data.get('width', 0)
-            height = map_data.get('height', 0)
-            
-            x, y = new_position
-            if x < 0 or x >= width or y < 0 or y >= height:
-                return False, "Position is out of map bounds"
-            
-            # Update the troop's position
-            game["troops"][username][i]["position"] = new_position
-            game["troops"][username][i]["status"] = "moved"
-            session['game'] = game
-            return True, "Troop position updated"
+    unit = find_unit(game, "player", unit_id=troop_id)
+    if unit is None:
+        return False, "Troop not found"
     
-    return False, "Troop not found"
+    result, error = move_unit(game, "player", unit, new_position)
+    if error:
+        return False, error
+    
+    set_session_game(game)
+    return True, "Troop position updated"
 
 def update_troop_status(username, troop_id, status):
     """
     Update a troop's status
     """
-    game = session.get('game')
-    if not game or "troops" not in game or username not in game["troops"]:
+    game = troops_game(username)
+    if not game:
         return False, "No troops found for player"
     
     valid_statuses = ["ready", "moved", "attacked", "exhausted"]
@@ -1134,27 +1366,26 @@ def update_troop_status(username, troop_id, status):
         return False, "Invalid status"
     
     # Find the troop
-    for i, troop in enumerate(game["troops"][username]):
-        if troop["id"] == troop_id:
-            # Update the troop's status
-            game["troops"][username][i]["status"] = status
-            session['game'] = game
-            return True, "Troop status updated"
-    
-    return False, "Troop not found"
+    troop = find_unit(game, "player", unit_id=troop_id)
+    if troop is None:
+        return False, "Troop not found"
+    troop["status"] = status
+    set_session_game(game)
+    return True, "Troop status updated"
 
 def reset_troops_status(username):
     """
     Reset all troops status to ready at the start of a new turn
     """
-    game = session.get('game')
-    if not game or "troops" not in game or username not in game["troops"]:
+    game = troops_game(username)
+    if not game:
         return False, "No troops found for player"
     
-    for i, troop in enumerate(game["troops"][username]):
-        game["troops"][username][i]["status"] = "ready"
+    for troop in game["player"].get("units", []):
+        troop["status"] = "ready"
+        troop["remainingMovement"] = troop.get("movement") or 2
     
-    session['game'] = game
+    set_session_game(game)
     return True, "All troops reset to ready status"
 
 
@@ -1279,7 +1510,7 @@ def add_building_to_city(city_id, type_id):
     """
     Add a new building to a city
     """
-    game = session.get('game')
+    game = get_session_game()
     if not game or "cities" not in game:
         return False, "No cities found"
 
@@ -1307,7 +1538,7 @@ def add_building_to_city(city_id, type_id):
     }
 
     city["buildings"].append(new_building)
-    session['game'] = game
+    set_session_game(game)
     return True, "Building added to city"
 
 def get_civilization_types():
@@ -1403,7 +1634,7 @@ def get_civilization_by_id(civ_id):
             return civ
     return None
 
-def apply_civilization_bonuses(game, civ_id, player_type="player"):
+def apply_civilization_bonuses(game, civ_id, player_type="player", start_position=None):
     """
     Apply civilization-specific resources and units to a game
     
@@ -1411,6 +1642,8 @@ def apply_civilization_bonuses(game, civ_id, player_type="player"):
         game: The game dictionary to modify
         civ_id: The ID of the civilization to apply
         player_type: Either "player" or "ia"
+        start_position: Where the units are placed (default: the map start
+                        point for the player, the furthest spawn candidate for the AI)
         
     Returns:
         The modified game dictionary
@@ -1426,43 +1659,21 @@ def apply_civilization_bonuses(game, civ_id, player_type="player"):
     
     # Adjust starting units based on civilization
     if "starting_units" in civilization:
-        # Clear existing units - we'll replace them completely
-        game[player_type]["units"] = []
-        
-        # Track occupied positions to avoid placing units in the same place
-        occupied_positions = []
+        # Positions taken by the other side's units
+        other_type = "ia" if player_type == "player" else "player"
+        occupied_positions = [unit["position"][:] for unit in game.get(other_type, {}).get("units", [])]
         
         # Find starting position from the map data
-        if player_type == "player":
-            start_position = game["map_data"]["startPoint"] if "map_data" in game and "startPoint" in game["map_data"] else [15, 7]
-        else:
-            # For AI, use a distant valid position
-            start_position = find_distant_valid_position(game["map_data"])
+        if start_position is None:
+            if player_type == "player":
+                start_position = game["map_data"]["startPoint"] if "map_data" in game and "startPoint" in game["map_data"] else [15, 7]
+            else:
+                start_position = find_distant_valid_position(game["map_data"], occupied_positions)
         
-        # Add the specified starting units
-        for unit_type, count in civilization["starting_units"].items():
-            for i in range(count):
-                position = None
-                
-                # First unit at start position if not occupied
-                if len(game[player_type]["units"]) == 0 and start_position not in occupied_positions:
-                    position = start_position[:]  # Copy to avoid reference issues
-                else:
-                    # Find an unoccupied adjacent position
-                    position = find_unoccupied_position(
-                        game["map_data"], 
-                        start_position, 
-                        occupied_positions
-                    )
-                
-                if position:
-                    # Mark the position as occupied
-                    occupied_positions.append(position[:])
-                    
-                    # Create the unit and add to player's units
-                    unit = get_troop_type(unit_type, position)
-                    if unit:
-                        game[player_type]["units"].append(unit)
+        # Replace the existing units completely
+        game[player_type]["units"] = place_starting_units(
+            game["map_data"], civilization["starting_units"], start_position, occupied_positions
+        )
         
     # Add the civilization info to the game
     game[player_type]["civilization"] = {
@@ -1479,7 +1690,9 @@ def find_unoccupied_position(map_data, start_position, occupied_positions):
     Args:
         map_data: The map data containing terrain information
         start_position: The reference position to search near
-        occupied_positions: List of positions that are already occupied
+        occupied_positions: List of positions that are already occupied, or a
+            container answering (x, y) in occupied_positions (a set or the
+            game's SpatialIndex)
         
     Returns:
         A valid [x, y] position or None if no valid position could be found
@@ -1489,6 +1702,10 @@ def find_unoccupied_position(map_data, start_position, occupied_positions):
     terrain = map_data.get("terrain", [])
     x, y = start_position
     
+    # Lista de posiciones -> conjunto, para comprobar cada candidato en O(1)
+    if isinstance(occupied_positions, (list, tuple)):
+        occupied_positions = {(pos[0], pos[1]) for pos in occupied_positions}
+    
     # Try positions with increasing distance from the start
     for distance in range(1, 10):  # Try up to 10 tiles away if needed
         # Check all positions at the current Manhattan distance
@@ -1504,7 +1721,7 @@ def find_unoccupied_position(map_data, start_position, occupied_positions):
                     # Check if position is not water
                     if terrain and len(terrain) > new_y and len(terrain[new_y]) > new_x and terrain[new_y][new_x] != 1:
                         # Check if position is not occupied
-                        if not any(pos[0] == new_x and pos[1] == new_y for pos in occupied_positions):
+                        if (new_x, new_y) not in occupied_positions:
                             return new_pos
     
     # If we couldn't find a position with our algorithm, try a more brute-force approach
@@ -1512,10 +1729,9 @@ def find_unoccupied_position(map_data, start_position, occupied_positions):
         for x in range(width):
             # Skip water tiles
             if terrain and len(terrain) > y and len(terrain[y]) > x and terrain[y][x] != 1:
-                new_pos = [x, y]
                 # Check if position is not occupied
-                if not any(pos[0] == x and pos[1] == y for pos in occupied_positions):
-                    return new_pos
+                if (x, y) not in occupied_positions:
+                    return [x, y]
     
     # If all else fails, return None
     return None
@@ -1523,43 +1739,17 @@ def find_unoccupied_position(map_data, start_position, occupied_positions):
 def add_game_with_civilization(username, map_id, difficulty, civ_id=None, game_name="New Game", ai_civ_id=None):
     """Add a new game for a user with optional civilization selection for player and AI"""
     try:
-        # First create a base game
-        result = add_game(username, map_id, difficulty, game_name)
-        
-        # If no game was created or no civilization was specified, return
-        if not result:
-            return result
-            
-        # Get the created game
-        game = session.get('game')
-        if not game:
-            return result
-            
-        # Apply player civilization bonuses
-        if civ_id:
-            modified_game = apply_civilization_bonuses(game, civ_id, "player")
-            
-            # Update the game in the session
-            game = modified_game
-            session['game'] = modified_game
-        
-        # Apply AI civilization bonuses if specified
-        if ai_civ_id:
-            modified_game = apply_civilization_bonuses(game, ai_civ_id, "ia")
-            
-            # Update the game in the session
-            session['game'] = modified_game
-        
-        # Update the game in the database
         db = get_db()
-        db.games.update_one(
-            {"game_id": modified_game["game_id"]},
-            {"$set": modified_game}
-        )
+        map_id_str, map_data = load_game_map(map_id, difficulty)
+        game = build_game(username, map_id_str, map_data, difficulty, game_name, civ_id, ai_civ_id)
         
-        return result
+        # Convert the game object to be JSON serializable before storing it
+        set_session_game(sanitize_for_json(game))
+        
+        # Store the finished game in MongoDB once, with its layers packed
+        return db.games.insert_one(pack_game_layers(game))
     except Exception as e:
-        print(f"Error adding game with civilization: {e}")
+        print(f"Error adding game: {e}")
         return None
     
 def get_technology_type(type_id):
@@ -1614,7 +1804,7 @@ def add_technology_to_city(city_id, tech_id):
     """
     Add a new technology to a city for research
     """
-    game = session.get('game')
+    game = get_session_game()
     if not game or "player" not in game or "cities" not in game["player"]:
         return False, "No cities found"
 
@@ -1666,6 +1856,7 @@ def add_technology_to_city(city_id, tech_id):
     # Set the new research
     city["research"]["current_technology"] = tech_id
     city["research"]["turns_remaining"] = tech_type["turns"]
+    schedule_timer(game, "player", city, RESEARCH)
     
-    session['game'] = game
+    set_session_game(game)
     return True, "Technology research started"
\ No newline at end of file
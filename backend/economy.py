@@ -0,0 +1,188 @@
+"""
+Server-side economy: resource tiles around cities and per-turn income.
+
+A city works the square of side ``city["area"]`` around its position (same
+convention as countResourcesInCityArea in Map.svelte, where a city without
+area works no tile). Resource tiles are
+counted with one summed-area table per resource type, so the counts of any
+city come from four lookups whatever its area, and all the cities of both
+players are answered with one batched array expression.
+
+The tables are built with cumulative sums when a map is created and kept in
+a per-process cache keyed by map id (they are 4 bytes per tile and resource,
+too large to store in the map document for big maps). A process that has not
+seen the map rebuilds them from the terrain on first use.
+"""
+import os
+import numpy as np
+from game_store import LRUGameStore
+
+# Terrain code of each resource (see terrain_generator.py)
+RESOURCE_TERRAIN = {
+    "gold": 2,
+    "iron": 3,
+    "wood": 4,
+    "stone": 5,
+}
+RESOURCES = tuple(RESOURCE_TERRAIN)
+
+# Side of the square worked by a new city (newCity in Map.svelte)
+DEFAULT_CITY_AREA = 5
+
+# Base food of every city per turn
+CITY_BASE_FOOD = 1
+
+# Output of buildings that do not define one (getDefaultBuildingOutcome in Map.svelte)
+DEFAULT_BUILDING_OUTPUT = {
+    "farm": {"food": 2},
+    "granary": {"food": 3},
+    "mine": {"gold": 2},
+    "gold_mine": {"gold": 2},
+    "sawmill": {"wood": 2},
+    "lumber_mill": {"wood": 2},
+    "forge": {"iron": 2},
+    "iron_mine": {"iron": 2},
+    "quarry": {"stone": 2},
+    "stone_mine": {"stone": 2},
+}
+
+# Resource multiplied by the number of matching tiles for each producing building
+BUILDING_RESOURCE = {
+    "gold mine": "gold",
+    "sawmill": "wood",
+    "iron mine": "iron",
+    "quarry": "stone",
+}
+
+ECONOMY_CACHE_MAPS = int(os.environ.get('ECONOMY_CACHE_MAPS', '8'))
+
+_tables_cache = LRUGameStore(ECONOMY_CACHE_MAPS)
+
+
+def build_resource_tables(terrain):
+    """
+    Summed-area tables of the resource tiles: array of shape
+    (len(RESOURCES), height + 1, width + 1) where [r, y, x] is the number of
+    tiles of resource r in terrain[:y, :x]
+    """
+    terrain = np.asarray(terrain, dtype=np.uint8)
+    height, width = terrain.shape
+    tables = np.zeros((len(RESOURCES), height + 1, width + 1), dtype=np.int32)
+    for index, resource in enumerate(RESOURCES):
+        table = tables[index, 1:, 1:]
+        np.cumsum(terrain == RESOURCE_TERRAIN[resource], axis=0, dtype=np.int32, out=table)
+        np.cumsum(table, axis=1, out=table)
+    return tables
+
+
+def cache_resource_tables(map_id, terrain):
+    """Build the tables of a new map and keep them in the cache"""
+    tables = build_resource_tables(terrain)
+    _tables_cache.put(str(map_id), tables)
+    return tables
+
+
+def get_resource_tables(game):
+    """Summed-area tables of the map of a game (cached by map id)"""
+    map_id = str(game.get("map_id"))
+    tables = _tables_cache.get(map_id)
+    if tables is None:
+        tables = cache_resource_tables(map_id, game["map_data"]["terrain"])
+    return tables
+
+
+def city_position(city):
+    """City position as (x, y), whether stored as [x, y] or {"x", "y"}"""
+    position = city.get("position")
+    if isinstance(position, dict):
+        return position.get("x", 0), position.get("y", 0)
+    return position[0], position[1]
+
+
+def count_city_resources(tables, cities):
+    """
+    Resource tiles in the area of each city (batched).
+    Returns an int array of shape (len(cities), len(RESOURCES)).
+    """
+    if not cities:
+        return np.zeros((0, len(RESOURCES)), dtype=np.int64)
+    height, width = tables.shape[1] - 1, tables.shape[2] - 1
+    positions = np.array([city_position(city) for city in cities], dtype=np.int64).reshape(-1, 2)
+    areas = np.array([city.get("area") or 0 for city in cities], dtype=np.int64)
+
+    # Square of side `area` starting `area // 2` tiles before the city, clipped to the map
+    x0 = np.clip(positions[:, 0] - areas // 2, 0, width)
+    y0 = np.clip(positions[:, 1] - areas // 2, 0, height)
+    x1 = np.clip(positions[:, 0] - areas // 2 + areas, 0, width)
+    y1 = np.clip(positions[:, 1] - areas // 2 + areas, 0, height)
+
+    counts = tables[:, y1, x1] - tables[:, y0, x1] - tables[:, y1, x0] + tables[:, y0, x0]
+    return counts.T.astype(np.int64)
+
+
+def counts_to_dict(counts):
+    """One row of count_city_resources as {"gold": ..., ...}"""
+    return {resource: int(count) for resource, count in zip(RESOURCES, counts)}
+
+
+def city_resource_counts(game, player_types=("player", "ia")):
+    """
+    Resource tiles around every city of the given players in one batched query.
+    Returns {player_type: [counts dict per city]}
+    """
+    tables = get_resource_tables(game)
+    cities = {player_type: game.get(player_type, {}).get("cities", []) for player_type in player_types}
+    all_cities = [city for player_type in player_types for city in cities[player_type]]
+    counts = count_city_resources(tables, all_cities)
+
+    result = {}
+    start = 0
+    for player_type in player_types:
+        end = start + len(cities[player_type])
+        result[player_type] = [counts_to_dict(row) for row in counts[start:end]]
+        start = end
+    return result
+
+
+def calculate_resource_generation(city, resource_counts):
+    """
+    Resources generated by a city in one turn (calculateResourceGeneration in Map.svelte):
+    base food plus building outputs, mines multiplied by the matching tiles
+    """
+    generated = {"food": CITY_BASE_FOOD, "gold": 0, "wood": 0, "iron": 0, "stone": 0}
+    for building in city.get("buildings") or []:
+        if isinstance(building, str):
+            continue
+        type_id = building.get("type_id")
+        output = building.get("output") or DEFAULT_BUILDING_OUTPUT.get(type_id, {})
+        if type_id == "farm":
+            generated["food"] += output.get("food", 0)
+        elif type_id in BUILDING_RESOURCE:
+            resource = BUILDING_RESOURCE[type_id]
+            if output.get(resource) and resource_counts.get(resource, 0) > 0:
+                generated[resource] += output[resource] * resource_counts[resource]
+    return generated
+
+
+def resource_income(game, player_types=("player", "ia")):
+    """
+    Per-city and total income of each player for one turn.
+    Returns {player_type: {"cities": [...], "total": {...}}}
+    """
+    counts = city_resource_counts(game, player_types)
+    income = {}
+    for player_type in player_types:
+        total = {"food": 0, "gold": 0, "wood": 0, "iron": 0, "stone": 0}
+        cities = []
+        for city, city_counts in zip(game.get(player_type, {}).get("cities", []), counts[player_type]):
+            generated = calculate_resource_generation(city, city_counts)
+            for resource, amount in generated.items():
+                total[resource] += amount
+            cities.append({
+                "id": city.get("id"),
+                "name": city.get("name"),
+                "resource_tiles": city_counts,
+                "generated": generated
+            })
+        income[player_type] = {"cities": cities, "total": total}
+    return income
@@ -0,0 +1,254 @@
+"""
+Incremental fog-of-war engine.
+
+Each player has two layers:
+- explored (``fog_grid``): tiles the player has ever seen (0=hidden, 1=visible)
+- visible (``visible_grid``): tiles currently seen by a unit or a city
+
+Visibility is tracked with a per-tile counter of the sight sources (units and
+cities) that cover it, so moving a unit only touches the tiles around its old
+and new positions: the cost grows with the number of moved units, not with the
+map area. Sight areas are squares, like updateFogOfWar in database.py.
+
+Engines are cached per (game_id, player_type) while the game keeps the same
+fog lists, so a sequence of moves on the active game never rescans the map.
+Only the changed tiles are written back into the game's list-of-lists layers.
+"""
+import numpy as np
+from game_store import LRUGameStore, GAME_STORE_MAX_GAMES
+from map_codec import layer_to_array, BITS
+from spatial_index import get_spatial_index
+
+# Sight radius of units and cities
+UNIT_SIGHT_RADIUS = 2
+CITY_SIGHT_RADIUS = 3
+
+
+class FogOfWar:
+    """Explored bitset plus visibility counters for one player"""
+
+    def __init__(self, width, height, explored=None):
+        self.width = width
+        self.height = height
+        if explored is None:
+            explored = np.zeros((height, width), dtype=bool)
+        self.explored = np.asarray(explored, dtype=bool).reshape(height, width).copy()
+        self.visible_count = np.zeros((height, width), dtype=np.uint16)
+        # Game lists this engine is in sync with (see get_fog)
+        self.fog_grid = None
+        self.visible_grid = None
+
+    @property
+    def visible(self):
+        """Currently visible tiles as a boolean array"""
+        return self.visible_count > 0
+
+    def _windows(self, positions, radii):
+        """
+        Flat indices of all the tiles covered by the sight squares of the
+        given positions (one row per source, computed with broadcasting)
+        """
+        positions = np.asarray(positions, dtype=np.intp).reshape(-1, 2)
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.intp)
+        radii = np.broadcast_to(np.asarray(radii, dtype=np.intp), len(positions))
+        radius = int(radii.max())
+        offsets = np.arange(-radius, radius + 1)
+
+        xs = positions[:, 0, None, None] + offsets[None, None, :]
+        ys = positions[:, 1, None, None] + offsets[None, :, None]
+        inside = (np.abs(offsets)[None, None, :] <= radii[:, None, None]) & \
+                 (np.abs(offsets)[None, :, None] <= radii[:, None, None])
+        inside &= (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        return (ys * self.width + xs)[inside]
+
+    def _apply(self, removed, added):
+        """
+        Remove and add sight windows, returning the changed tiles as flat index arrays:
+        (newly_visible, newly_hidden, newly_revealed)
+        """
+        counts = self.visible_count.ravel()
+        touched, removed_counts = np.unique(removed, return_counts=True)
+        added_tiles, added_counts = np.unique(added, return_counts=True)
+        touched_all = np.union1d(touched, added_tiles)
+        was_visible = counts[touched_all] > 0
+
+        counts[touched] -= removed_counts.astype(np.uint16)
+        counts[added_tiles] += added_counts.astype(np.uint16)
+
+        is_visible = counts[touched_all] > 0
+        newly_visible = touched_all[is_visible & ~was_visible]
+        newly_hidden = touched_all[was_visible & ~is_visible]
+
+        explored = self.explored.ravel()
+        newly_revealed = newly_visible[~explored[newly_visible]]
+        explored[newly_revealed] = True
+        return newly_visible, newly_hidden, newly_revealed
+
+    def add_sources(self, positions, radii=UNIT_SIGHT_RADIUS):
+        """Add sight sources (spawned units, founded cities)"""
+        return self._apply(np.empty(0, dtype=np.intp), self._windows(positions, radii))
+
+    def remove_sources(self, positions, radii=UNIT_SIGHT_RADIUS):
+        """Remove sight sources (dead units, lost cities)"""
+        return self._apply(self._windows(positions, radii), np.empty(0, dtype=np.intp))
+
+    def move_sources(self, old_positions, new_positions, radii=UNIT_SIGHT_RADIUS):
+        """Move many sight sources at once"""
+        return self._apply(self._windows(old_positions, radii), self._windows(new_positions, radii))
+
+    def to_xy(self, flat_indices):
+        """Flat tile indices as a list of [x, y] pairs"""
+        flat_indices = np.asarray(flat_indices, dtype=np.intp)
+        return np.stack([flat_indices % self.width, flat_indices // self.width], axis=1).tolist()
+
+
+def sight_sources(side):
+    """
+    Positions and sight radii of the units and cities of a player
+    """
+    positions = []
+    radii = []
+    for unit in side.get("units", []):
+        position = unit.get("position")
+        if position and len(position) >= 2:
+            positions.append(position[:2])
+            radii.append(UNIT_SIGHT_RADIUS)
+    for city in side.get("cities", []):
+        position = city.get("position")
+        if position and len(position) >= 2:
+            positions.append(position[:2])
+            radii.append(CITY_SIGHT_RADIUS)
+    return positions, radii
+
+
+def build_fog(side, width, height):
+    """
+    Build a fog engine from a player's explored layer and current sight sources
+    """
+    explored = side.get("fog_grid")
+    if explored is not None:
+        explored = layer_to_array(explored, width, height, BITS) != 0
+    fog = FogOfWar(width, height, explored)
+    positions, radii = sight_sources(side)
+    fog.add_sources(positions, radii)
+    return fog
+
+
+_fog_cache = LRUGameStore(GAME_STORE_MAX_GAMES * 2)
+
+
+def _write_tiles(layer, fog, flat_indices, value):
+    """Write a value into the changed tiles of a list-of-lists layer"""
+    for x, y in fog.to_xy(flat_indices):
+        layer[y][x] = value
+
+
+def get_fog(game, player_type):
+    """
+    Get the fog engine of a player, reusing the cached one while the game
+    still holds the same fog lists. The game's fog_grid and visible_grid are
+    created (as lists) if missing or stale.
+    """
+    side = game[player_type]
+    map_size = game.get("map_size", {})
+    width, height = map_size.get("width", 0), map_size.get("height", 0)
+    key = f"{game.get('game_id')}:{player_type}"
+
+    fog = _fog_cache.get(key)
+    if fog is not None and fog.fog_grid is side.get("fog_grid") and fog.visible_grid is side.get("visible_grid"):
+        return fog
+
+    fog = build_fog(side, width, height)
+    # Lists in sync with the engine; later changes are written tile by tile
+    side["fog_grid"] = fog.explored.astype(np.uint8).tolist()
+    side["visible_grid"] = fog.visible.astype(np.uint8).tolist()
+    fog.fog_grid = side["fog_grid"]
+    fog.visible_grid = side["visible_grid"]
+    _fog_cache.put(key, fog)
+    return fog
+
+
+def apply_fog_changes(fog, changes):
+    """
+    Write the tiles changed by a fog update into the game lists and return
+    them as [x, y] lists: {"revealed", "visible", "hidden"}
+    """
+    newly_visible, newly_hidden, newly_revealed = changes
+    _write_tiles(fog.fog_grid, fog, newly_revealed, 1)
+    _write_tiles(fog.visible_grid, fog, newly_visible, 1)
+    _write_tiles(fog.visible_grid, fog, newly_hidden, 0)
+    return {
+        "revealed": fog.to_xy(newly_revealed),
+        "visible": fog.to_xy(newly_visible),
+        "hidden": fog.to_xy(newly_hidden),
+    }
+
+
+def move_units(game, player_type, moves):
+    """
+    Move units and update the player's fog incrementally.
+
+    Args:
+        game: Active game (modified in place)
+        player_type: "player" or "ia"
+        moves: list of {"unit_id": ..., "position": [x, y]}; units without an
+               id can be selected by their current position with "from": [x, y]
+
+    Returns:
+        (changes, errors) - changes holds the revealed/visible/hidden tiles,
+        errors lists the moves that could not be applied
+    """
+    fog = get_fog(game, player_type)
+    units = game[player_type].get("units", [])
+    by_id = {unit["id"]: unit for unit in units if unit.get("id") is not None}
+    by_position = {tuple(unit["position"][:2]): unit for unit in units if unit.get("position")}
+
+    moved = []
+    old_positions = []
+    new_positions = []
+    errors = []
+    for move in moves:
+        if move.get("unit_id") is not None:
+            unit = by_id.get(move["unit_id"])
+        else:
+            unit = by_position.get(tuple(move.get("from") or ()))
+        position = move.get("position")
+        if unit is None:
+            errors.append({"unit_id": move.get("unit_id"), "error": "Unit not found"})
+            continue
+        if any(unit is other for other in moved):
+            errors.append({"unit_id": move.get("unit_id"), "error": "Unit moved twice"})
+            continue
+        if not isinstance(position, list) or len(position) != 2 or \
+                not (0 <= position[0] < fog.width and 0 <= position[1] < fog.height):
+            errors.append({"unit_id": move.get("unit_id"), "error": "Position out of the map"})
+            continue
+        old_positions.append(unit["position"][:2])
+        new_positions.append(position)
+        moved.append(unit)
+
+    changes = apply_fog_changes(fog, fog.move_sources(old_positions, new_positions))
+    index = get_spatial_index(game)
+    for unit, old_position, position in zip(moved, old_positions, new_positions):
+        index.move_unit(player_type, unit, old_position, position)
+        unit["position"] = list(position)
+    return changes, errors
+
+
+def add_sight_source(game, player_type, position, radius=UNIT_SIGHT_RADIUS):
+    """
+    Reveal around a new unit or city. Call it before the unit or city is
+    added to the game, so a rebuilt engine does not count it twice.
+    """
+    fog = get_fog(game, player_type)
+    return apply_fog_changes(fog, fog.add_sources([position], radius))
+
+
+def remove_sight_source(game, player_type, position, radius=UNIT_SIGHT_RADIUS):
+    """
+    Stop seeing around a dead unit or a lost city. Call it before the unit or
+    city is removed from the game.
+    """
+    fog = get_fog(game, player_type)
+    return apply_fog_changes(fog, fog.remove_sources([position], radius))
@@ -0,0 +1,178 @@
+"""
+Server-side storage for the active game state.
+
+The Flask session is a signed cookie, so it must not carry the full game
+document (map grids and fog grids grow with the map size). The session only
+keeps the ``game_id`` and the game itself lives in one of these stores:
+
+- ``memory``: in-process LRU cache (default)
+- ``mongo``: ``game_states`` collection in MongoDB, shared by every worker
+
+The backend is selected with the ``GAME_STORE`` environment variable.
+
+Requests that change a game on the server (ending a turn, applying an AI
+turn) hold the game's lock (``game_lock``): a thread lock per game id and,
+with the ``mongo`` store, a lock document in ``game_locks`` so workers are
+serialized too.
+"""
+import datetime
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from pymongo.errors import DuplicateKeyError
+from map_codec import pack_game_layers, unpack_game_layers
+
+GAME_STORE_BACKEND = os.environ.get('GAME_STORE', 'memory')
+GAME_STORE_MAX_GAMES = int(os.environ.get('GAME_STORE_MAX_GAMES', '256'))
+# Seconds a request waits for the lock of a game
+GAME_LOCK_TIMEOUT = float(os.environ.get('GAME_LOCK_TIMEOUT', '10'))
+# A lock document older than this belongs to a worker that died holding it
+GAME_LOCK_TTL = 60
+
+
+class LRUGameStore:
+    """In-process game store with least-recently-used eviction"""
+
+    def __init__(self, max_games=GAME_STORE_MAX_GAMES):
+        self.max_games = max_games
+        self._games = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, game_id):
+        """Return the stored game or None if it is not cached"""
+        with self._lock:
+            game = self._games.get(game_id)
+            if game is not None:
+                self._games.move_to_end(game_id)
+            return game
+
+    def put(self, game_id, game):
+        """Store (or replace) a game, evicting the oldest one if needed"""
+        with self._lock:
+            self._games[game_id] = game
+            self._games.move_to_end(game_id)
+            while len(self._games) > self.max_games:
+                self._games.popitem(last=False)
+
+    def delete(self, game_id):
+        """Remove a game from the store"""
+        with self._lock:
+            self._games.pop(game_id, None)
+
+    def acquire(self, game_id, timeout):
+        """Lock a game for the other processes (one process: the thread lock is enough)"""
+        return True
+
+    def release(self, game_id):
+        pass
+
+
+class MongoGameStore:
+    """Game store backed by the ``game_states`` MongoDB collection"""
+
+    collection_name = 'game_states'
+
+    def _collection(self):
+        # Imported here to avoid a circular import with database.py
+        from database import get_db
+        return get_db()[self.collection_name]
+
+    def get(self, game_id):
+        """Return the stored game or None if it does not exist"""
+        doc = self._collection().find_one({"_id": game_id})
+        return unpack_game_layers(doc["game"]) if doc else None
+
+    def put(self, game_id, game):
+        """Store (or replace) a game"""
+        self._collection().replace_one(
+            {"_id": game_id},
+            {"_id": game_id, "game": pack_game_layers(game), "updated_at": datetime.datetime.now()},
+            upsert=True
+        )
+
+    def delete(self, game_id):
+        """Remove a game from the store"""
+        self._collection().delete_one({"_id": game_id})
+
+    def _locks(self):
+        from database import get_db
+        return get_db().game_locks
+
+    def acquire(self, game_id, timeout):
+        """
+        Lock a game for every worker with a lock document. Returns False if
+        another worker still holds it after timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            now = datetime.datetime.now()
+            try:
+                self._locks().insert_one({"_id": game_id,
+                                          "expires_at": now + datetime.timedelta(seconds=GAME_LOCK_TTL)})
+                return True
+            except DuplicateKeyError:
+                self._locks().delete_one({"_id": game_id, "expires_at": {"$lt": now}})
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def release(self, game_id):
+        self._locks().delete_one({"_id": game_id})
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_game_store():
+    """
+    Get the process-wide game store, creating it on first use
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if GAME_STORE_BACKEND == 'mongo':
+                    _store = MongoGameStore()
+                else:
+                    _store = LRUGameStore()
+                print(f"Game store initialized: {GAME_STORE_BACKEND}")
+    return _store
+
+
+# Thread lock of every game in use (dropped when no request holds it)
+_game_locks = weakref.WeakValueDictionary()
+_game_locks_lock = threading.Lock()
+
+
+@contextmanager
+def game_lock(game_id, timeout=GAME_LOCK_TIMEOUT):
+    """
+    Hold the lock of a game, so requests that change it run one at a time:
+
+        with game_lock(game_id) as locked:
+            if not locked:
+                ...  # another request kept the game for timeout seconds
+    """
+    game_id = str(game_id)
+    with _game_locks_lock:
+        lock = _game_locks.get(game_id)
+        if lock is None:
+            lock = threading.Lock()
+            _game_locks[game_id] = lock
+    if not lock.acquire(timeout=timeout):
+        yield False
+        return
+    try:
+        store = get_game_store()
+        locked = store.acquire(game_id, timeout)
+        try:
+            yield locked
+        finally:
+            if locked:
+                store.release(game_id)
+    finally:
+        lock.release()
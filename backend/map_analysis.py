@@ -0,0 +1,149 @@
+"""
+Per-map precomputed data, built once with array operations in add_map and
+stored with the map document.
+
+- spawn_candidates: land tiles with at least one land neighbour (so a second
+  unit can be placed next to the first), furthest from the start point first
+- land_components: connected-component label of every land tile (4-neighbour,
+  water splits the map into islands), so "can a unit on A ever reach B" is
+  one lookup instead of a search
+"""
+import numpy as np
+from game_store import LRUGameStore
+
+WATER = 1
+
+# Number of spawn candidates stored with each map
+SPAWN_CANDIDATES = 64
+
+# Label of water tiles in the component layer
+NO_COMPONENT = 0
+
+_components_cache = LRUGameStore(16)
+
+
+def land_neighbour_count(land):
+    """Number of land tiles among the 8 neighbours of each tile"""
+    padded = np.pad(land, 1).astype(np.uint8)
+    height, width = land.shape
+    count = np.zeros(land.shape, dtype=np.uint8)
+    for dy in (0, 1, 2):
+        for dx in (0, 1, 2):
+            if dy != 1 or dx != 1:
+                count += padded[dy:dy + height, dx:dx + width]
+    return count
+
+
+def spawn_candidates(terrain, start_point, limit=SPAWN_CANDIDATES):
+    """
+    Land tiles with a land neighbour, ranked by distance to the start point
+    (furthest first, ties in row-major order). Returns a list of [x, y].
+    """
+    terrain = np.asarray(terrain, dtype=np.uint8)
+    if terrain.ndim != 2 or terrain.size == 0:
+        return []
+    land = terrain != WATER
+    valid = np.flatnonzero(land & (land_neighbour_count(land) > 0))
+    if len(valid) == 0:
+        return []
+
+    width = terrain.shape[1]
+    xs, ys = valid % width, valid // width
+    start_x, start_y = start_point
+    distance = (xs - start_x) ** 2 + (ys - start_y) ** 2
+
+    # Keep the `limit` furthest tiles, then order them
+    if len(valid) > limit:
+        furthest = np.argpartition(-distance, limit - 1)[:limit]
+        valid, xs, ys, distance = valid[furthest], xs[furthest], ys[furthest], distance[furthest]
+    order = np.lexsort((valid, -distance))
+    return np.stack([xs[order], ys[order]], axis=1).tolist()
+
+
+def land_components(terrain):
+    """
+    Label the connected land areas of a map (4-neighbour moves, water is
+    impassable). Horizontal runs of land are the nodes of a vectorized
+    union-find over the vertical edges: every round hooks the larger root of
+    each edge between different trees onto the smaller one, then pointer
+    jumping flattens the trees.
+
+    Returns (labels, count): uint32 array with 1..count on land and
+    NO_COMPONENT on water, labels numbered in row-major order of first tile.
+    """
+    terrain = np.asarray(terrain, dtype=np.uint8)
+    if terrain.ndim != 2 or terrain.size == 0:
+        return np.zeros(terrain.shape if terrain.ndim == 2 else (0, 0), dtype=np.uint32), 0
+    land = terrain != WATER
+    height, width = land.shape
+
+    # Horizontal runs of land are connected already: they are the nodes
+    starts = land.copy()
+    starts[:, 1:] &= ~land[:, :-1]
+    run = np.cumsum(starts.ravel(), dtype=np.int32).reshape(height, width) - 1
+    runs = int(run[-1, -1]) + 1
+
+    # Vertical edges between runs, one per overlapping pair of runs
+    vertical = land[:-1, :] & land[1:, :]
+    repeated = np.zeros_like(vertical)
+    repeated[:, 1:] = vertical[:, :-1] & ~starts[:-1, 1:] & ~starts[1:, 1:]
+    edges = vertical & ~repeated
+    a, b = run[:-1, :][edges], run[1:, :][edges]
+
+    parent = np.arange(runs, dtype=np.int32)
+    while len(a):
+        root_a, root_b = parent[a], parent[b]
+        pending = root_a != root_b
+        if not pending.any():
+            break
+        # Edges inside one tree stay inside it: drop them for good
+        a, b = a[pending], b[pending]
+        root_a, root_b = root_a[pending], root_b[pending]
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+    # Roots numbered 1..count in row-major order
+    root_label = np.cumsum(parent == np.arange(runs), dtype=np.uint32)
+    labels = np.zeros((height, width), dtype=np.uint32)
+    labels[land] = root_label[parent[run[land]]]
+    count = int(root_label[-1]) if runs else 0
+    return labels, count
+
+
+def cache_land_components(map_id, labels):
+    """Keep the component labels of a map in the per-process cache"""
+    _components_cache.put(str(map_id), labels)
+    return labels
+
+
+def get_land_components(game):
+    """
+    Component labels of the map of a game: from the cache, else from the map
+    document, else computed from the game terrain
+    """
+    if not game.get("map_id"):
+        return land_components(game["map_data"]["terrain"])[0]
+    map_id = str(game["map_id"])
+    labels = _components_cache.get(map_id)
+    if labels is None:
+        # Import here: database imports this module
+        from database import get_map_land_components
+        labels = get_map_land_components(map_id)
+        if labels is None:
+            labels, _ = land_components(game["map_data"]["terrain"])
+        cache_land_components(map_id, labels)
+    return labels
+
+
+def same_component(labels, a, b):
+    """True if a land path may join tiles a and b ([x, y]); O(1)"""
+    height, width = labels.shape
+    (ax, ay), (bx, by) = a[:2], b[:2]
+    if not (0 <= ax < width and 0 <= ay < height and 0 <= bx < width and 0 <= by < height):
+        return False
+    label = labels[ay, ax]
+    return label != NO_COMPONENT and label == labels[by, bx]
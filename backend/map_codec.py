@@ -0,0 +1,151 @@
+"""
+Packed binary codec for the map layers.
+
+Terrain and the map grid are stored as one uint8 per tile (row-major), the
+fog-of-war grids as a bitset (one bit per tile) and the land component labels
+as zlib-compressed uint32 (they are long runs of the same value). Packed layers are saved in
+MongoDB as Binary fields and decode into NumPy arrays without copying the
+tile data. The legacy list-of-lists form is still produced for the existing
+JSON API and the frontend.
+"""
+import base64
+import zlib
+import numpy as np
+from bson import Binary
+
+# Layer encodings
+U8 = "u8"
+BITS = "bits"
+LABELS = "u32z"
+
+# Encoding used for each layer field
+LAYER_ENCODINGS = {
+    "terrain": U8,
+    "grid": U8,
+    "fog_grid": BITS,
+    "visible_grid": BITS,
+    "land_components": LABELS,
+}
+
+# Per-player fog layers (explored and currently visible tiles)
+FOG_LAYERS = ("fog_grid", "visible_grid")
+
+
+def is_packed(value):
+    """True if a layer value is already in its packed binary form"""
+    return isinstance(value, (bytes, bytearray, memoryview))
+
+
+def pack_layer(layer, encoding=U8):
+    """
+    Pack a layer (list of lists or 2D array) into bytes
+    """
+    if encoding == LABELS:
+        return zlib.compress(np.asarray(layer, dtype="<u4").tobytes())
+    array = np.asarray(layer, dtype=np.uint8)
+    if encoding == BITS:
+        return np.packbits(array != 0, axis=None).tobytes()
+    return array.tobytes()
+
+
+def unpack_layer(data, width, height, encoding=U8):
+    """
+    Decode a packed layer into a (height, width) uint8 array (uint32 for labels).
+    u8 layers are a read-only view over the buffer (zero copy); bitsets are expanded.
+    """
+    if encoding == LABELS:
+        return np.frombuffer(zlib.decompress(data), dtype="<u4")[:width * height].reshape(height, width)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if encoding == BITS:
+        return np.unpackbits(buffer, count=width * height).reshape(height, width)
+    return buffer[:width * height].reshape(height, width)
+
+
+def layer_to_array(value, width, height, encoding=U8):
+    """
+    Get a layer as a NumPy array whatever its stored form (packed or legacy lists)
+    """
+    if is_packed(value):
+        return unpack_layer(value, width, height, encoding)
+    return np.asarray(value, dtype=np.uint8)
+
+
+def layer_to_list(value, width, height, encoding=U8):
+    """
+    Get a layer in the legacy list-of-lists form
+    """
+    if is_packed(value):
+        return unpack_layer(value, width, height, encoding).tolist()
+    return value
+
+
+def encode_base64(data):
+    """Base64 transport for clients that cannot receive raw binary"""
+    return base64.b64encode(bytes(data)).decode("ascii")
+
+
+def pack_map_layers(map_doc):
+    """
+    Return a copy of a map document with its terrain and grid packed for storage
+    """
+    packed = dict(map_doc)
+    for field in ("terrain", "grid"):
+        if field in packed and packed[field] is not None and not is_packed(packed[field]):
+            packed[field] = Binary(pack_layer(packed[field], LAYER_ENCODINGS[field]))
+    return packed
+
+
+def unpack_map_layers(map_doc):
+    """
+    Convert the packed layers of a map document back to lists (in place)
+    """
+    if not map_doc:
+        return map_doc
+    width = map_doc.get("width", 0)
+    height = map_doc.get("height", 0)
+    for field in ("terrain", "grid"):
+        if is_packed(map_doc.get(field)):
+            map_doc[field] = layer_to_list(map_doc[field], width, height, LAYER_ENCODINGS[field])
+    return map_doc
+
+
+def pack_game_layers(game):
+    """
+    Return a copy of a game with its map layers and fog grids packed for storage.
+    The original game (used by the session and the JSON API) is not modified.
+    """
+    packed = dict(game)
+    if isinstance(packed.get("map_data"), dict):
+        packed["map_data"] = pack_map_layers(packed["map_data"])
+    for player_type in ("player", "ia"):
+        side = packed.get(player_type)
+        if not isinstance(side, dict):
+            continue
+        for field in FOG_LAYERS:
+            if side.get(field) is not None and not is_packed(side[field]):
+                if side is packed[player_type]:
+                    side = dict(side)
+                    packed[player_type] = side
+                side[field] = Binary(pack_layer(side[field], BITS))
+    return packed
+
+
+def unpack_game_layers(game):
+    """
+    Convert the packed layers of a stored game back to lists (in place)
+    """
+    if not game:
+        return game
+    if isinstance(game.get("map_data"), dict):
+        unpack_map_layers(game["map_data"])
+    map_size = game.get("map_size") or {}
+    width = map_size.get("width", 0)
+    height = map_size.get("height", 0)
+    for player_type in ("player", "ia"):
+        side = game.get(player_type)
+        if not isinstance(side, dict):
+            continue
+        for field in FOG_LAYERS:
+            if is_packed(side.get(field)):
+                side[field] = layer_to_list(side[field], width, height, BITS)
+    return game
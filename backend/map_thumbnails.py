@@ -0,0 +1,86 @@
+"""
+Downsampled terrain thumbnails for the map catalog.
+
+Thumbnails are small palette PNGs (one pixel per sampled tile) encoded with
+zlib, so they can be generated once in add_map and served as static,
+cacheable images.
+"""
+import struct
+import zlib
+import numpy as np
+
+# Maximum thumbnail side in pixels
+THUMBNAIL_MAX_SIZE = 64
+
+# RGB color of each terrain code (0=land, 1=water, 2=gold, 3=iron, 4=wood, 5=stone)
+TERRAIN_COLORS = [
+    (120, 170, 80),
+    (60, 120, 200),
+    (230, 190, 40),
+    (140, 140, 150),
+    (40, 100, 40),
+    (170, 160, 140),
+]
+
+# Terrain codes counted as resources in the catalog
+RESOURCE_TERRAIN = {
+    2: "gold",
+    3: "iron",
+    4: "wood",
+    5: "stone",
+}
+
+
+def count_resources(terrain):
+    """
+    Count the tiles of each resource type (plus water) in a terrain grid
+    """
+    tiles = np.asarray(terrain, dtype=np.uint8).ravel()
+    totals = np.bincount(tiles, minlength=len(TERRAIN_COLORS))
+    counts = {name: int(totals[code]) for code, name in RESOURCE_TERRAIN.items()}
+    counts["water"] = int(totals[1])
+    return counts
+
+
+def downsample_terrain(terrain, max_size=THUMBNAIL_MAX_SIZE):
+    """
+    Nearest-neighbour downsample of a terrain grid so that neither side is
+    larger than max_size. Returns a uint8 array (small maps keep their size).
+    """
+    tiles = np.asarray(terrain, dtype=np.uint8)
+    if tiles.ndim != 2 or tiles.size == 0:
+        return np.zeros((1, 1), dtype=np.uint8)
+    height, width = tiles.shape
+    if width <= max_size and height <= max_size:
+        return tiles
+
+    scale = max(width, height) / max_size
+    rows = np.minimum((np.arange(max(1, int(height / scale))) * scale).astype(int), height - 1)
+    cols = np.minimum((np.arange(max(1, int(width / scale))) * scale).astype(int), width - 1)
+    return tiles[np.ix_(rows, cols)]
+
+
+def _png_chunk(tag, data):
+    chunk = tag + data
+    return struct.pack(">I", len(data)) + chunk + struct.pack(">I", zlib.crc32(chunk) & 0xffffffff)
+
+
+def render_terrain_thumbnail(terrain, max_size=THUMBNAIL_MAX_SIZE):
+    """
+    Render a terrain grid as an 8-bit palette PNG. Returns the PNG bytes.
+    """
+    pixels = downsample_terrain(terrain, max_size)
+    height, width = pixels.shape
+
+    # Unknown codes fall back to land; each scanline starts with filter type 0 (None)
+    pixels = np.where(pixels < len(TERRAIN_COLORS), pixels, 0).astype(np.uint8)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels]).tobytes()
+
+    palette = b"".join(bytes(color) for color in TERRAIN_COLORS)
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)),
+        _png_chunk(b"PLTE", palette),
+        _png_chunk(b"IDAT", zlib.compress(raw, 9)),
+        _png_chunk(b"IEND", b""),
+    ])
@@ -0,0 +1,301 @@
+"""
+Server-side movement and pathfinding.
+
+Rules (same as the client):
+- units move between 4-neighbour tiles, one movement point per step
+- water (terrain 1) is impassable
+- a unit cannot stop on a tile with another unit or a city
+
+Units can also not walk through enemy units or enemy cities; own units and
+cities can be crossed. Reachable tiles are found with a breadth-first search
+bounded by the unit's remaining movement points, and long paths (AI goals,
+click-to-move) with A* and a Manhattan heuristic. Goals on another island
+(different land component, see map_analysis.py) are rejected before any
+search.
+
+Occupancy comes from the game's spatial index (spatial_index.py). Reachability
+results are cached per (game, unit, turn) and dropped as soon as the index
+version changes (a unit or city was added, moved or removed).
+"""
+import heapq
+from collections import deque
+from game_store import LRUGameStore, GAME_STORE_MAX_GAMES
+from fog_of_war import move_units, get_fog
+from map_analysis import get_land_components, same_component
+from spatial_index import get_spatial_index, build_spatial_index, enemy_of, UNIT_BIT, CITY_BIT
+
+WATER = 1
+
+# Attack range of every unit in steps (checkForAttackTargets in Map.svelte)
+ATTACK_RANGE = 3
+
+# 4-neighbour steps
+STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+# A* gives up after expanding this many tiles
+MAX_PATH_NODES = 200000
+
+_reach_cache = LRUGameStore(GAME_STORE_MAX_GAMES)
+
+
+def position_of(entity):
+    """Position of a unit or city as an (x, y) tuple"""
+    position = entity.get("position")
+    if isinstance(position, dict):
+        return position.get("x", 0), position.get("y", 0)
+    return position[0], position[1]
+
+
+class MovementMap:
+    """
+    Terrain and occupancy of one game from the point of view of one player
+    (index: a spatial index to use instead of the game's cached one, e.g. for
+    planning moves on a copy of the game)
+    """
+
+    def __init__(self, game, player_type, index=None):
+        map_size = game.get("map_size", {})
+        self.width = map_size.get("width", 0)
+        self.height = map_size.get("height", 0)
+        terrain = game.get("map_data", {}).get("terrain")
+        self.terrain = terrain if terrain is not None else []
+        self.index = index if index is not None else get_spatial_index(game)
+        enemy = enemy_of(player_type)
+        self.blocking = UNIT_BIT[enemy] | CITY_BIT[enemy]
+        self.components = get_land_components(game) if len(self.terrain) else None
+
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def passable(self, x, y):
+        """A unit can walk through (x, y)"""
+        if not self.inside(x, y) or self.terrain[y][x] == WATER:
+            return False
+        return not self.index.grid[y, x] & self.blocking
+
+    def can_stop(self, x, y):
+        """A unit can end its move on (x, y)"""
+        return self.passable(x, y) and self.index.grid[y, x] == 0
+
+
+def search_reachable(movement_map, start, movement_points):
+    """
+    Breadth-first search from start bounded by movement_points.
+    Returns {(x, y): (cost, previous)} for every tile walked through,
+    start included.
+    """
+    start = tuple(start)
+    visited = {start: (0, None)}
+    queue = deque([start])
+    while queue:
+        x, y = queue.popleft()
+        cost = visited[(x, y)][0]
+        if cost >= movement_points:
+            continue
+        for dx, dy in STEPS:
+            nxt = (x + dx, y + dy)
+            if nxt not in visited and movement_map.passable(*nxt):
+                visited[nxt] = (cost + 1, (x, y))
+                queue.append(nxt)
+    return visited
+
+
+def trace_path(previous, tile):
+    """Path from the search start to tile (both included) as [x, y] lists"""
+    path = []
+    while tile is not None:
+        path.append(list(tile))
+        tile = previous[tile]
+    return path[::-1]
+
+
+def find_path(movement_map, start, goal, max_nodes=MAX_PATH_NODES):
+    """
+    A* from start to goal. Returns the path as a list of [x, y] (start and goal
+    included) or None if the goal cannot be reached.
+    """
+    start, goal = tuple(start), tuple(goal)
+    if start == goal:
+        return [list(start)]
+    if not movement_map.can_stop(*goal):
+        return None
+    if movement_map.components is not None and not same_component(movement_map.components, start, goal):
+        return None
+
+    def heuristic(tile):
+        return abs(tile[0] - goal[0]) + abs(tile[1] - goal[1])
+
+    previous = {start: None}
+    costs = {start: 0}
+    frontier = [(heuristic(start), 0, start)]
+    expanded = 0
+    while frontier and expanded < max_nodes:
+        _, cost, tile = heapq.heappop(frontier)
+        if tile == goal:
+            return trace_path(previous, tile)
+        if cost > costs[tile]:
+            continue
+        expanded += 1
+        for dx, dy in STEPS:
+            nxt = (tile[0] + dx, tile[1] + dy)
+            if movement_map.passable(*nxt) and cost + 1 < costs.get(nxt, cost + 2):
+                costs[nxt] = cost + 1
+                previous[nxt] = tile
+                heapq.heappush(frontier, (cost + 1 + heuristic(nxt), cost + 1, nxt))
+    return None
+
+
+def remaining_movement(unit):
+    """Movement points a unit has left this turn"""
+    if unit.get("status") == "exhausted":
+        return 0
+    remaining = unit.get("remainingMovement")
+    return unit.get("movement", 2) if remaining is None else remaining
+
+
+def find_unit(game, player_type, unit_id=None, position=None):
+    """A unit of a player by id or, for units without id, by position"""
+    if unit_id is None:
+        if position is None:
+            return None
+        entries = get_spatial_index(game).units.get((position[0], position[1]), ())
+        return next((unit for owner, unit in entries if owner == player_type), None)
+    for unit in game.get(player_type, {}).get("units", []):
+        if unit.get("id") == unit_id:
+            return unit
+    return None
+
+
+def unit_key(unit):
+    """Cache key of a unit (units without id are keyed by position)"""
+    if unit.get("id") is not None:
+        return str(unit["id"])
+    x, y = position_of(unit)
+    return f"{x},{y}"
+
+
+def get_reachable(game, player_type, unit):
+    """
+    Tiles a unit can move to this turn, cached per (unit, turn) until the
+    occupancy of the game changes.
+    Returns {(x, y): {"x", "y", "cost", "remainingMovement", "path"}}.
+    """
+    movement_map = MovementMap(game, player_type)
+    signature = (movement_map.index.token, movement_map.index.version)
+    start = position_of(unit)
+    points = remaining_movement(unit)
+    key = (player_type, unit_key(unit), game.get("turn"), start, points)
+
+    game_key = str(game.get("game_id"))
+    cached = _reach_cache.get(game_key)
+    if cached is None or cached["signature"] != signature:
+        cached = {"signature": signature, "units": {}}
+        _reach_cache.put(game_key, cached)
+    if key in cached["units"]:
+        return cached["units"][key]
+
+    visited = search_reachable(movement_map, start, points)
+    previous = {tile: step[1] for tile, step in visited.items()}
+    reachable = {}
+    for tile, (cost, _) in visited.items():
+        if tile != start and movement_map.can_stop(*tile):
+            reachable[tile] = {
+                "x": tile[0],
+                "y": tile[1],
+                "cost": cost,
+                "remainingMovement": points - cost,
+                "path": trace_path(previous, tile),
+            }
+    cached["units"][key] = reachable
+    return reachable
+
+
+def move_unit(game, player_type, unit, target):
+    """
+    Move a unit to a reachable tile: spends its movement points and updates
+    the fog of war of its owner.
+    Returns (result, error) - result holds the path, the remaining movement
+    and the fog changes.
+    """
+    if not isinstance(target, (list, tuple)) or len(target) != 2:
+        return None, "Position must be [x, y]"
+    step = get_reachable(game, player_type, unit).get(tuple(target))
+    if step is None:
+        return None, "Position is not reachable"
+
+    changes, errors = move_units(game, player_type, [fog_move(unit, target)])
+    if errors:
+        return None, errors[0]["error"]
+
+    unit["remainingMovement"] = step["remainingMovement"]
+    unit["status"] = "exhausted" if step["remainingMovement"] <= 0 else "moved"
+    return {
+        "path": step["path"],
+        "remainingMovement": unit["remainingMovement"],
+        "status": unit["status"],
+        "fog": changes,
+    }, None
+
+
+def fog_move(unit, target):
+    """Move for fog_of_war.move_units (units without id are selected by position)"""
+    move = {"position": list(target)}
+    if unit.get("id") is not None:
+        move["unit_id"] = unit["id"]
+    else:
+        move["from"] = list(position_of(unit))
+    return move
+
+
+def move_units_batch(game, player_type, moves):
+    """
+    Move several units of a player at once. Each move is checked against the
+    occupancy left by the previous ones (on a copy of the spatial index), then
+    the fog of war is updated once for all of them.
+    moves: list of (unit, target) pairs.
+    Returns (results, changes, errors) - results holds the unit, path, remaining
+    movement and status of every applied move, changes the net fog change and
+    errors the (move number, error) of the refused moves.
+    """
+    movement_map = MovementMap(game, player_type, index=build_spatial_index(game))
+    planned, errors = [], []
+    for number, (unit, target) in enumerate(moves):
+        if not isinstance(target, (list, tuple)) or len(target) != 2:
+            errors.append((number, "Position must be [x, y]"))
+            continue
+        if any(unit is other for other, _, _ in planned):
+            errors.append((number, "Unit moved twice"))
+            continue
+        start, target = position_of(unit), tuple(target)
+        visited = search_reachable(movement_map, start, remaining_movement(unit))
+        if target == start or target not in visited or not movement_map.can_stop(*target):
+            errors.append((number, "Position is not reachable"))
+            continue
+        path = trace_path({tile: step[1] for tile, step in visited.items()}, target)
+        movement_map.index.move_unit(player_type, unit, list(start), list(target))
+        planned.append((unit, target, path))
+
+    # Every planned move is inside the map and moves a unit once: the fog update cannot refuse any
+    changes, _ = move_units(game, player_type, [fog_move(unit, target) for unit, target, _ in planned])
+
+    results = []
+    for unit, target, path in planned:
+        unit["remainingMovement"] = remaining_movement(unit) - (len(path) - 1)
+        unit["status"] = "exhausted" if unit["remainingMovement"] <= 0 else "moved"
+        results.append({"unit": unit, "path": path,
+                        "remainingMovement": unit["remainingMovement"], "status": unit["status"]})
+    return results, changes, errors
+
+
+def attack_targets(game, player_type, unit):
+    """
+    Visible enemy units within attack range of a unit, nearest first
+    (none during a ceasefire or once the unit has no movement left)
+    """
+    if game.get("ceasefire_active") and game.get("ceasefire_turns", 0) > 0:
+        return []
+    if remaining_movement(unit) <= 0:
+        return []
+    visible = get_fog(game, player_type).visible
+    enemies = get_spatial_index(game).units_within(enemy_of(player_type), position_of(unit), ATTACK_RANGE)
+    return [enemy for enemy in enemies if visible[position_of(enemy)[1], position_of(enemy)[0]]]
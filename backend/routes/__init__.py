@@ -10,6 +10,7 @@ from .iaRoute import ia_blueprint
 from .troopRoute import troop_blueprint
 from .buildingRoute import building_blueprint
 from .civilizationRoute import civilization_blueprint
+from .combatRoute import combat_blueprint
 
 # Make the blueprints available when importing from the package
 __all__ = [
@@ -19,5 +20,6 @@ __all__ = [
     'ia_blueprint',
     'troop_blueprint',
     'building_blueprint',
-    'civilization_blueprint'
+    'civilization_blueprint',
+    'combat_blueprint'
 ]
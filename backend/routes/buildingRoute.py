@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, session
-from database import (get_building_types, get_building_type, add_building_to_city)
+from database import (get_building_types, get_building_type, add_building_to_city,
+                      get_session_game, set_session_game)
 
 # Create blueprint for building routes
 building_blueprint = Blueprint('building', __name__)
@@ -44,7 +45,7 @@ def add_building_endpoint():
 @building_blueprint.route('/api/cities/<city_id>/buildings', methods=['GET'])
 def get_city_buildings_endpoint(city_id):
     """Get all buildings for a specific city"""
-    game = session.get('game')
+    game = get_session_game()
     if not game:
         return jsonify({"error": "No active game"}), 404
     
@@ -66,7 +67,7 @@ def get_city_buildings_endpoint(city_id):
 @building_blueprint.route('/api/cities/<city_id>/buildings/<building_id>', methods=['DELETE'])
 def remove_building_endpoint(city_id, building_id):
     """Remove a building from a city"""
-    game = session.get('game')
+    game = get_session_game()
     if not game:
         return jsonify({"error": "No active game"}), 404
     
@@ -90,7 +91,7 @@ def remove_building_endpoint(city_id, building_id):
     
     # Remove the building
     removed_building = buildings.pop(building_index)
-    session.modified = True
+    set_session_game(game)
     
     return jsonify({
         "message": "Building removed successfully",
@@ -71,7 +71,7 @@ def create_game_with_civilization():
         
         if result:
             # Get the game ID for the response
-            game_id = session.get('game', {}).get('game_id', 'unknown')
+            game_id = session.get('game_id', 'unknown')
             
             response_data = {
                 "success": True,
@@ -0,0 +1,91 @@
+from flask import Blueprint, request, jsonify, session
+from database import get_session_game, set_session_game, get_troop_type
+from combat import fight, battle_odds, catalog_odds, ODDS_SAMPLES, MAX_ODDS_SAMPLES
+from routes.gameRoute import request_unit
+
+# Create blueprint for combat routes
+combat_blueprint = Blueprint('combat', __name__)
+
+def odds_unit(data):
+    """
+    Unit stats for an odds request: {"type_id"} (catalog stats at full health)
+    optionally overridden by "health", "attack" and "defense"
+    """
+    if not isinstance(data, dict):
+        return None
+    unit = {}
+    if data.get("type_id"):
+        unit = get_troop_type(data["type_id"], [0, 0]) or {}
+    for field in ("type_id", "health", "attack", "defense"):
+        if data.get(field) is not None:
+            unit[field] = data[field]
+    if not all(isinstance(unit.get(field), (int, float)) for field in ("health", "attack", "defense")):
+        return None
+    return unit
+
+@combat_blueprint.route('/api/game/battle', methods=['POST'])
+def battle_endpoint():
+    """
+    Resolve an attack of the active game on the server.
+    Body: {"player_type", "attacker": {"unit_id"} or {"x", "y"}, "defender": {"unit_id"} or {"x", "y"}}
+    Returns the winner, the remaining health and the blows (for the animation).
+    """
+    try:
+        if 'user' not in session or session['user'] is None:
+            return jsonify({"error": "User not logged in"}), 401
+
+        game = get_session_game()
+        if not game:
+            return jsonify({"error": "No active game"}), 404
+
+        data = request.get_json() or {}
+        player_type = data.get("player_type", "player")
+        if player_type not in ("player", "ia"):
+            return jsonify({"error": "player_type must be 'player' or 'ia'"}), 400
+        enemy = "ia" if player_type == "player" else "player"
+
+        _, attacker = request_unit(game, {**(data.get("attacker") or {}), "player_type": player_type})
+        _, defender = request_unit(game, {**(data.get("defender") or {}), "player_type": enemy})
+        if attacker is None or defender is None:
+            return jsonify({"error": "Unit not found"}), 404
+
+        result, error = fight(game, player_type, attacker, defender)
+        if error:
+            return jsonify({"error": error}), 400
+
+        set_session_game(game)
+        return jsonify(result), 200
+    except Exception as e:
+        print(f"Error resolving battle: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@combat_blueprint.route('/api/combat/odds', methods=['POST'])
+def odds_endpoint():
+    """
+    Estimated outcome of a fight (Monte Carlo).
+    Body: {"attacker": {"type_id", "health"?, "attack"?, "defense"?}, "defender": {...}, "samples"?}
+    """
+    try:
+        data = request.get_json() or {}
+        attacker = odds_unit(data.get("attacker"))
+        defender = odds_unit(data.get("defender"))
+        if attacker is None or defender is None:
+            return jsonify({"error": "attacker and defender need a type_id or health, attack and defense"}), 400
+
+        samples = data.get("samples", ODDS_SAMPLES)
+        if not isinstance(samples, int) or not 1 <= samples <= MAX_ODDS_SAMPLES:
+            return jsonify({"error": f"samples must be between 1 and {MAX_ODDS_SAMPLES}"}), 400
+
+        return jsonify(battle_odds(attacker, defender, samples)), 200
+    except Exception as e:
+        print(f"Error estimating battle odds: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@combat_blueprint.route('/api/combat/odds/catalog', methods=['GET'])
+def odds_catalog_endpoint():
+    """Precomputed odds of every pair of troop types at full health"""
+    try:
+        return jsonify(catalog_odds()), 200
+    except Exception as e:
+        print(f"Error getting catalog odds: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
@@ -1,6 +1,16 @@
 from flask import Blueprint, request, jsonify, session
-from database import (add_game, delete_game, save_game, get_game_by_id_from_db)
+from database import (add_game, delete_game, save_game, get_game_by_id_from_db,
+                      get_session_game, set_session_game)
 from bson import ObjectId
+from map_codec import pack_layer, LAYER_ENCODINGS, BITS
+from routes.mapRoute import layer_response
+from movement import (MovementMap, find_unit, get_reachable, move_unit, move_units_batch, find_path,
+                      position_of, attack_targets)
+from economy import resource_income
+from turns import end_turn
+from ai_turn import apply_ai_turn, AITurnError
+from game_store import game_lock
+from scheduler import schedule_timers, refresh_turns_remaining
 import datetime
 import traceback
 
@@ -19,95 +29,6 @@ def convert_bson_types(obj):
         return obj.isoformat()
     return obj
 
-def process_research(game):
-    """Process technology research for both player and AI"""
-    players = ['player', 'ia']
-    
-    for player_type in players:
-        if player_type not in game:
-            continue
-            
-        # Check each city for research in progress
-        for city in game[player_type].get('cities', []):
-            research_completed = False
-            tech_id = None
-            tech_name = None
-            
-            # Check city's research field (for backwards compatibility)
-            if 'research' in city and city['research'].get('current_technology'):
-                city['research']['turns_remaining'] -= 1
-                
-                # Check if research is complete
-                if city['research']['turns_remaining'] <= 0:
-                    tech_id = city['research']['current_technology']
-                    research_completed = True
-                    
-                    # Reset the research
-                    city['research']['current_technology'] = None
-                    city['research']['turns_remaining'] = 0
-            
-            # Check library building for research
-            if 'buildings' in city:
-                for building in city['buildings']:
-                    # Skip string-type buildings
-                    if isinstance(building, str):
-                        continue
-                        
-                    # Check if it's a library with research
-                    if (building.get('type_id') == 'library' or building.get('name', '').lower() == 'library') and \
-                       'production' in building and building['production'] and building['production'].get('current_technology'):
-                        
-                        # Decrease turns remaining
-                        building['production']['turns_remaining'] -= 1
-                        
-                        # Check if research is complete
-                        if building['production']['turns_remaining'] <= 0:
-                            tech_id = building['production']['current_technology']
-                            tech_name = building['production'].get('technology_name', tech_id)
-                            research_completed = True
-                            
-                            # Reset the production
-                            building['production'] = None
-                            
-                            # Also reset city research for backwards compatibility
-                            if 'research' in city:
-                                city['research']['current_technology'] = None
-                                city['research']['turns_remaining'] = 0
-            
-            # If research was completed, add the technology to the player's technologies
-            if research_completed and tech_id:
-                # Initialize technologies array if it doesn't exist
-                if 'technologies' not in game[player_type]:
-                    game[player_type]['technologies'] = []
-                
-                # Check if the technology is already researched
-                already_researched = False
-                for tech in game[player_type]['technologies']:
-                    if (isinstance(tech, str) and tech == tech_id) or \
-                       (isinstance(tech, dict) and tech.get('id') == tech_id):
-                        already_researched = True
-                        break
-                
-                # Add the technology if not already researched
-                if not already_researched:
-                    # Get the full technology type from the database
-                    from database import get_technology_type
-                    tech_data = get_technology_type(tech_id)
-                    
-                    if tech_data:
-                        game[player_type]['technologies'].append(tech_data)
-                    else:
-                        # Fallback to just the ID if tech data not found
-                        game[player_type]['technologies'].append(tech_id)
-    
-    return game
-
-def end_turn(game):
-    # Process research progress
-    game = process_research(game)
-    
-    return game
-
 @game_blueprint.route('/api/game', methods=['POST'])
 def create_game():
     try:
@@ -137,10 +58,10 @@ def create_game():
 
 @game_blueprint.route('/api/game', methods=['GET'])
 def get_game():
-    game = session.get('game')
+    game = get_session_game()
     if not game:
         return jsonify({"error": "No game found"}), 404
-    return jsonify(game), 200
+    return jsonify(refresh_turns_remaining(game)), 200
 
 @game_blueprint.route('/api/current-game', methods=['GET'])
 def get_current_game():
@@ -151,11 +72,12 @@ def get_current_game():
         if 'username' not in session or not session['username']:
             return jsonify({"error": "User not logged in"}), 401
             
-        if 'game' not in session or not session['game']:
+        game = get_session_game()
+        if not game:
             return jsonify({"error": "No active game in session"}), 404
             
-        # Return the game from the session directly
-        return jsonify(session['game'])
+        # Return the active game from the game store
+        return jsonify(refresh_turns_remaining(game))
     except Exception as e:
         print(f"Error in get_current_game: {e}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
@@ -173,7 +95,7 @@ def save_current_game_session():
         if 'username' not in session:
             return jsonify({"success": False, "message": "User not logged in"}), 401
             
-        if 'game' not in session:
+        if not session.get('game_id'):
             return jsonify({"success": False, "message": "No active game in session"}), 400
         
         # Save the game from session to database
@@ -185,7 +107,7 @@ def save_current_game_session():
             return jsonify({
                 "success": True, 
                 "message": "Game saved successfully", 
-                "game_id": session['game'].get('game_id')
+                "game_id": session.get('game_id')
             })
         else:
             return jsonify({"success": False, "message": "Failed to save game"}), 500
@@ -195,7 +117,7 @@ def save_current_game_session():
 
 @game_blueprint.route('/api/update-game-session', methods=['POST'])
 def update_game_session():
-    """Update the game data in the session"""
+    """Update the active game in the game store"""
     try:
         if 'user' not in session or session['user'] is None:
             return jsonify({"error": "User not logged in"}), 401
@@ -205,12 +127,12 @@ def update_game_session():
         if not updated_game:
             return jsonify({"error": "No game data provided"}), 400
         
-        # Ensure the data stored in session is clean
+        # Ensure the data stored in the game store is clean
         processed_game_data = convert_bson_types(updated_game)
-        session['game'] = processed_game_data
         
-        # Mark session as modified if necessary, Flask usually does this automatically
-        session.modified = True 
+        # Production and research started by the client get their completion events
+        schedule_timers(processed_game_data)
+        set_session_game(processed_game_data)
         
         return jsonify({"message": "Game session updated successfully"}), 200
     except Exception as e:
@@ -219,8 +141,8 @@ def update_game_session():
 
 @game_blueprint.route('/api/game/delete', methods=['DELETE'])
 def delete_game_endpoint():
-    if session.get('game'):
-        delete_game(session['game'].get('game_id'))
+    if session.get('game_id'):
+        delete_game(session['game_id'])
         return jsonify({"message": "Game deleted successfully"}), 200
     return jsonify({"error": "No game found"}), 404
 
@@ -240,11 +162,10 @@ def get_game_by_id(game_id):
 
         if game_doc:
             # Ensure the game document is fully processed for BSON types
-            processed_game = convert_bson_types(game_doc)
+            processed_game = refresh_turns_remaining(convert_bson_types(game_doc))
             
-            # Update the session with the loaded game
-            session['game'] = processed_game 
-            session.modified = True # Explicitly mark session as modified
+            # Make the loaded game the active game of the session
+            set_session_game(processed_game)
             
             return jsonify(processed_game)
         else:
@@ -255,3 +176,333 @@ def get_game_by_id(game_id):
         print(f"Error in get_game_by_id for game_id {game_id}: {e}")
         print(traceback.format_exc())
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@game_blueprint.route('/api/game/layers/<layer>', methods=['GET'])
+def get_game_layer(layer):
+    """
+    Get a layer of the active game in packed form.
+    Layers: terrain, grid, player_fog, ia_fog, player_visible, ia_visible
+    """
+    try:
+        game = get_session_game()
+        if not game:
+            return jsonify({"error": "No active game"}), 404
+        
+        map_size = game.get("map_size", {})
+        width = map_size.get("width", 0)
+        height = map_size.get("height", 0)
+        
+        if layer in ("terrain", "grid"):
+            values = game.get("map_data", {}).get(layer)
+            encoding = LAYER_ENCODINGS[layer]
+        elif layer in ("player_fog", "ia_fog"):
+            player_type = "player" if layer == "player_fog" else "ia"
+            values = game.get(player_type, {}).get("fog_grid")
+            encoding = BITS
+        elif layer in ("player_visible", "ia_visible"):
+            player_type = "player" if layer == "player_visible" else "ia"
+            values = game.get(player_type, {}).get("visible_grid")
+            encoding = BITS
+        else:
+            return jsonify({"error": "Layer must be terrain, grid, player_fog, ia_fog, player_visible or ia_visible"}), 400
+        
+        if values is None:
+            return jsonify({"error": f"Layer {layer} not found in game"}), 404
+        
+        return layer_response(pack_layer(values, encoding), width, height, encoding)
+    except Exception as e:
+        print(f"Error getting game layer {layer}: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@game_blueprint.route('/api/game/fog/move', methods=['POST'])
+def move_units_fog():
+    """
+    Move units of the active game with the movement rules and update that
+    player's fog of war once for all the moves (movement.move_units_batch).
+    Body: {"player_type": "player" | "ia", "moves": [{"unit_id": ..., "position": [x, y]}]}
+    (units without id are selected with "from": [x, y])
+    Returns only the tiles whose fog changed over the whole batch (revealed,
+    visible, hidden), the result of every applied move and the moves that
+    were refused.
+    """
+    try:
+        if 'user' not in session or session['user'] is None:
+            return jsonify({"error": "User not logged in"}), 401
+        
+        data = request.get_json() or {}
+        player_type = data.get("player_type", "player")
+        moves = data.get("moves")
+        if player_type not in ("player", "ia"):
+            return jsonify({"error": "player_type must be 'player' or 'ia'"}), 400
+        if not isinstance(moves, list):
+            return jsonify({"error": "moves must be a list"}), 400
+        
+        game = get_session_game()
+        if not game:
+            return jsonify({"error": "No active game"}), 404
+        
+        requested, errors = [], []
+        for move in moves:
+            if not isinstance(move, dict):
+                errors.append({"unit_id": None, "error": "Move must be an object"})
+                continue
+            if move.get("unit_id") is not None:
+                unit = find_unit(game, player_type, unit_id=move["unit_id"])
+            elif isinstance(move.get("from"), list) and len(move["from"]) == 2:
+                unit = find_unit(game, player_type, position=move["from"])
+            else:
+                unit = None
+            if unit is None:
+                errors.append({"unit_id": move.get("unit_id"), "error": "Unit not found"})
+                continue
+            requested.append((move, unit))
+        
+        applied, changes, refused = move_units_batch(
+            game, player_type, [(unit, move.get("position")) for move, unit in requested])
+        errors.extend({"unit_id": requested[number][0].get("unit_id"), "error": error} for number, error in refused)
+        results = []
+        for result in applied:
+            unit = result.pop("unit")
+            results.append({"unit_id": unit.get("id"), "position": list(position_of(unit)), **result})
+        
+        if results:
+            set_session_game(game)
+        
+        return jsonify({
+            **changes,
+            "moves": results,
+            "errors": errors
+        }), 200
+    except Exception as e:
+        print(f"Error moving units: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+def request_unit(game, data):
+    """Unit selected by a request: {"player_type", "unit_id"} or {"player_type", "x", "y"}"""
+    player_type = data.get("player_type", "player")
+    if player_type not in ("player", "ia"):
+        return player_type, None
+    if data.get("unit_id") is not None:
+        return player_type, find_unit(game, player_type, unit_id=data["unit_id"])
+    try:
+        position = [int(data.get("x")), int(data.get("y"))]
+    except (TypeError, ValueError):
+        return player_type, None
+    return player_type, find_unit(game, player_type, position=position)
+
+@game_blueprint.route('/api/game/units/moves', methods=['GET'])
+def get_unit_moves():
+    """
+    Tiles a unit can move to this turn, with the cost and path of each one.
+    Query: player_type, and unit_id or x and y (units without id)
+    """
+    try:
+        game = get_session_game()
+        if not game:
+            return jsonify({"error": "No active game"}), 404
+        
+        player_type, unit = request_unit(game, request.args)
+        if unit is None:
+            return jsonify({"error": "Unit not found"}), 404
+        
+        moves = list(get_reachable(game, player_type, unit).values())
+        return jsonify({"position": list(position_of(unit)), "moves": moves}), 200
+    except Exception as e:
+        print(f"Error computing unit moves: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@game_blueprint.route('/api/game/units/targets', methods=['GET'])
+def get_unit_targets():
+    """
+    Visible enemy units a unit can attack (within 3 steps), nearest first.
+    Query: player_type, and unit_id or x and y (units without id)
+    """
+    try:
+        game = get_session_game()
+        if not game:
+            return jsonify({"error": "No active game"}), 404
+        
+        player_type, unit = request_unit(game, request.args)
+        if unit is None:
+            return jsonify({"error": "Unit not found"}), 404
+        
+        targets = [{
+            "id": enemy.get("id"),
+            "type_id": enemy.get("type_id"),
+            "position": list(position_of(enemy)),
+            "health": enemy.get("health")
+        } for enemy in attack_targets(game, player_type, unit)]
+        return jsonify({"targets": targets}), 200
+    except Exception as e:
+        print(f"Error computing attack targets: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@game_blueprint.route('/api/game/units/move', methods=['POST'])
+def move_unit_endpoint():
+    """
+    Move a unit to a reachable tile, spending its movement points.
+    Body: {"player_type", "unit_id" or "x"/"y", "position": [x, y]}
+    Returns the path, the remaining movement and the fog changes.
+    """
+    try:
+        if 'user' not in session or session['user'] is None:
+            return jsonify({"error": "User not logged in"}), 401
+        
+        game = get_session_game()
+        if not game:
+            return jsonify({"error": "No active game"}), 404
+        
+        data = request.get_json() or {}
+        player_type, unit = request_unit(game, data)
+        if unit is None:
+            return jsonify({"error": "Unit not found"}), 404
+        
+        result, error = move_unit(game, player_type, unit, data.get("position"))
+        if error:
+            return jsonify({"error": error}), 400
+        
+        set_session_game(game)
+        return jsonify(result), 200
+    except Exception as e:
+        print(f"Error moving unit: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@game_blueprint.route('/api/game/path', methods=['POST'])
+def find_path_endpoint():
+    """
+    Shortest land path between two tiles for a player (A*), ignoring movement points.
+    Body: {"player_type", "start": [x, y], "goal": [x, y]}
+    """
+    try:
+        game = get_session_game()
+        if not game:
+            return jsonify({"error": "No active game"}), 404
+        
+        data = request.get_json() or {}
+        player_type = data.get("player_type", "player")
+        start, goal = data.get("start"), data.get("goal")
+        if player_type not in ("player", "ia"):
+            return jsonify({"error": "player_type must be 'player' or 'ia'"}), 400
+        if not isinstance(start, list) or len(start) != 2 or not isinstance(goal, list) or len(goal) != 2:
+            return jsonify({"error": "start and goal must be [x, y]"}), 400
+        
+        path = find_path(MovementMap(game, player_type), start, goal)
+        if path is None:
+            return jsonify({"path": None, "cost": None}), 200
+        return jsonify({"path": path, "cost": len(path) - 1}), 200
+    except Exception as e:
+        print(f"Error finding path: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@game_blueprint.route('/api/game/economy', methods=['GET'])
+def get_game_economy():
+    """
+    Resource tiles and income of every city of both players for one turn
+    (computed in one batched query, see economy.py)
+    """
+    try:
+        game = get_session_game()
+        if not game:
+            return jsonify({"error": "No active game"}), 404
+        
+        return jsonify(resource_income(game)), 200
+    except Exception as e:
+        print(f"Error computing economy: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+def owned_game(game_id):
+    """
+    Game of the logged-in user: the active game, or loaded from the database
+    (this also makes it the active game). None if it is not the user's or
+    nobody is logged in.
+    """
+    username = session.get('username')
+    if not username:
+        return None
+    game = get_session_game()
+    if not game or str(game.get("game_id")) != str(game_id):
+        return get_game_by_id_from_db(game_id, username=username)
+    if game.get("username") and game["username"] != username:
+        return None
+    return game
+
+@game_blueprint.route('/api/game/<game_id>/end-turn', methods=['POST'])
+def end_turn_endpoint(game_id):
+    """
+    End the current turn of a game on the server: production, research,
+    resource income, population growth and unit resets for both players.
+    Body: {"turn": <the turn the client is ending>}; a repeated or stale call
+    gets 409 with the game's current turn, so a turn is never ended twice
+    (calls for the same game are serialized by its lock).
+    Returns a compact summary of the changes instead of the whole game.
+    """
+    try:
+        if not session.get('username'):
+            return jsonify({"error": "Unauthorized - User not logged in"}), 401
+        
+        data = request.get_json(silent=True) or {}
+        turn = data.get("turn")
+        if not isinstance(turn, int) or isinstance(turn, bool):
+            return jsonify({"error": "turn must be an integer"}), 400
+        
+        with game_lock(game_id) as locked:
+            if not locked:
+                return jsonify({"error": "The game is busy, try again"}), 409
+            
+            game = owned_game(game_id)
+            if not game:
+                return jsonify({"error": "Game not found or access denied"}), 404
+            
+            current_turn = game.get("turn") or 0
+            if turn != current_turn:
+                return jsonify({"error": f"Turn {turn} is not the current turn", "turn": current_turn}), 409
+            
+            summary = end_turn(game)
+            set_session_game(game)
+        
+        return jsonify(summary), 200
+    except Exception as e:
+        print(f"Error ending turn for game {game_id}: {e}")
+        print(traceback.format_exc())
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@game_blueprint.route('/api/game/<game_id>/ai-turn', methods=['POST'])
+def ai_turn_endpoint(game_id):
+    """
+    Apply the actions of an AI turn to the game on the server (movement and
+    fog, attacks, new cities, productions and research) and store it once.
+    Body: {"actions": [...]} (the actions of /api/ai/action)
+    Returns {"events", "rejected", "repaired", "resources"}: the events in
+    order, for the client to animate, and the actions that were skipped or
+    repaired with their reason. Nothing is applied if the turn fails.
+    The client may send the actions of one turn in several calls, as they
+    arrive; calls for the same game are serialized by its lock.
+    """
+    try:
+        if not session.get('username'):
+            return jsonify({"error": "Unauthorized - User not logged in"}), 401
+        
+        data = request.get_json(silent=True) or {}
+        actions = data.get("actions")
+        if not isinstance(actions, list):
+            return jsonify({"error": "actions must be a list"}), 400
+        
+        with game_lock(game_id) as locked:
+            if not locked:
+                return jsonify({"error": "The game is busy, try again"}), 409
+            
+            game = owned_game(game_id)
+            if not game:
+                return jsonify({"error": "Game not found or access denied"}), 404
+            
+            try:
+                game, result = apply_ai_turn(game, actions)
+            except AITurnError as e:
+                return jsonify({"error": str(e)}), 409
+            set_session_game(game)
+        
+        return jsonify(result), 200
+    except Exception as e:
+        print(f"Error applying the AI turn for game {game_id}: {e}")
+        print(traceback.format_exc())
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
@@ -1,11 +1,189 @@
-from flask import Blueprint, request, jsonify, session, current_app
+from flask import Blueprint, request, jsonify, session, current_app, Response
 import json
-from IAProba import iaDeitu
+import threading
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeout
+from IAProba import iaDeitu, iaDeituStream, ai_conversations
+from database import get_session_game, set_session_game, user_owns_game
+from ai_jobs import ai_jobs, start_call, JobQueueFull, DONE
+from ai_planner import plan_turn, uses_local_planner, has_actions, AI_LLM_DEADLINE
+from ai_validator import ActionValidator, validate_plan
+
+# Seconds between status events of an AI job stream
+SSE_KEEPALIVE_SECONDS = 5
+
+def sse_event(event, data):
+    """One server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
 # Create blueprint for IA routes
 ia_blueprint = Blueprint('ia', __name__)
 
+def conversation_id():
+    """
+    Key of the LLM conversation of a request: the active game of the session
+    (never a game_id sent by the client, it could be another user's game)
+    """
+    return session.get('game_id') or f"user:{session.get('username')}"
+
+def simplify_game_state(game_state):
+    """Fields of the game state the AI needs, including its fog of war"""
+    return {
+        "ia": game_state.get("ia", {}),
+        "player": {
+            "units": game_state.get("player", {}).get("units", []),
+            "cities": game_state.get("player", {}).get("cities", [])
+        },
+        "difficulty": game_state.get("difficulty", ""),
+        "map_data": game_state.get("map_data", {}),
+        "map_size": game_state.get("map_size", {}),
+        "turn": game_state.get("turn", 1),
+        "ceasefire_turns": game_state.get("ceasefire_turns", 0),
+        "map_id": game_state.get("map_id")
+    }
+
+def parse_ai_response(result):
+    """
+    Extract the JSON object from an LLM response (text between the first { and the last })
+    """
+    if not isinstance(result, str):
+        return result
+    
+    first_brace_index = result.find('{')
+    last_brace_index = result.rfind('}')
+    if first_brace_index != -1 and last_brace_index != -1 and first_brace_index < last_brace_index:
+        # Extract only the JSON part
+        cleaned_result = result[first_brace_index:last_brace_index + 1]
+        try:
+            return json.loads(cleaned_result)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing extracted JSON: {e}")
+            return {"error": "Invalid JSON format", "extracted_content": cleaned_result}
+    
+    # If no JSON structure found, try original response
+    print("No JSON structure found in response, trying original")
+    try:
+        return json.loads(result)
+    except json.JSONDecodeError:
+        print("Could not parse response as JSON")
+        return {"result": result}
+
+def fallback_plan(game_state, reason, publish=None):
+    """Local plan of the AI turn (ai_planner.py), published action by action if streaming"""
+    plan = plan_turn(game_state)
+    if reason:
+        print(f"Using the local AI plan: {reason}")
+        plan["fallback"] = reason
+    if publish:
+        for action in plan["actions"]:
+            publish(action)
+    return plan
+
+def cancel_call(call, cancelled):
+    """
+    Give up an LLM call past its deadline: a call still queued never runs,
+    one waiting for the game's conversation or streaming stops, so it does
+    not hold a worker the next turns need
+    """
+    cancelled.set()
+    call.cancel()
+
+def remember_turn(game_id, game_state, result):
+    """Tell the game's conversation which actions the AI plays this turn (see TurnMemory.played)"""
+    context = ai_conversations.peek(str(game_id))
+    if context is not None:
+        context.memory.played(game_state.get("turn", 1), result.get("actions"))
+    return result
+
+def run_ai_action(prompt, game_state, game_id):
+    """
+    Ask the AI for its actions and parse the response (runs outside the request in jobs).
+    AI turns are planned locally for the easy difficulty, and when the LLM does
+    not answer with valid actions within AI_LLM_DEADLINE seconds. The actions
+    of the LLM are validated (ai_validator.py): only valid ones are returned.
+    """
+    # El contexto de la conversación se maneja dentro de iaDeitu ahora
+    if len(prompt) >= 10:
+        return parse_ai_response(iaDeitu(prompt, game_state, game_id=game_id))
+    
+    if uses_local_planner(game_state):
+        return fallback_plan(game_state, None)
+    
+    cancelled = threading.Event()
+    call = start_call(iaDeitu, game_state=game_state, game_id=game_id, cancelled=cancelled)
+    try:
+        result = parse_ai_response(call.result(timeout=AI_LLM_DEADLINE))
+    except FutureTimeout:
+        cancel_call(call, cancelled)
+        return remember_turn(game_id, game_state, fallback_plan(game_state, f"no answer in {AI_LLM_DEADLINE:g} s"))
+    if not has_actions(result):
+        return remember_turn(game_id, game_state, fallback_plan(game_state, "invalid response"))
+    result = validate_plan(game_state, result)
+    if not result["actions"] and result["rejected"]:
+        result = fallback_plan(game_state, "no valid action")
+    return remember_turn(game_id, game_state, result)
+
+def run_ai_stream(game_state, game_id, publish):
+    """
+    AI turn with the LLM in streaming mode: every action is published to the
+    job as soon as it is generated and validated. The result has all the
+    valid actions and the rejected ones.
+    The local plan is used instead if no valid action arrives within AI_LLM_DEADLINE.
+    """
+    if uses_local_planner(game_state):
+        return fallback_plan(game_state, None, publish)
+    
+    validator = ActionValidator(game_state)
+    checked = {"actions": [], "rejected": [], "repaired": []}
+    received = 0
+    lock = threading.Lock()
+    first_action = threading.Event()
+    abandoned = False
+    
+    def on_action(action):
+        nonlocal received
+        with lock:
+            if abandoned:
+                return
+            index, received = received, received + 1
+            valid, reason = validator.check(action)
+            kind = action.get("type") if isinstance(action, dict) else None
+            if valid is None:
+                checked["rejected"].append({"index": index, "type": kind, "reason": reason, "action": action})
+                return
+            if reason:
+                checked["repaired"].append({"index": index, "type": kind, "reason": reason})
+            checked["actions"].append(valid)
+            publish(valid)
+        first_action.set()
+    
+    cancelled = threading.Event()
+    call = start_call(iaDeituStream, game_state, game_id, on_action, cancelled)
+    call.add_done_callback(lambda _: first_action.set())
+    first_action.wait(AI_LLM_DEADLINE)
+    with lock:
+        if not checked["actions"] and not call.done():
+            abandoned = True
+    if abandoned:
+        cancel_call(call, cancelled)
+        plan = fallback_plan(game_state, f"no valid action in {AI_LLM_DEADLINE:g} s", publish)
+        return remember_turn(game_id, game_state, plan)
+    
+    result = parse_ai_response(call.result())
+    if not received:
+        # Nothing was parsed while streaming: validate the whole response
+        if not has_actions(result):
+            return remember_turn(game_id, game_state, fallback_plan(game_state, "invalid response", publish))
+        for action in result["actions"]:
+            on_action(action)
+    if not checked["actions"]:
+        return remember_turn(game_id, game_state, fallback_plan(game_state, "no valid action", publish))
+    # Keep the other fields of the response (reasoning...) if it was complete
+    if not isinstance(result, dict) or "error" in result:
+        result = {}
+    return remember_turn(game_id, game_state, {**result, **checked})
+
 @ia_blueprint.route('/api/ai/action', methods=['POST'])
 def ai_action():
     """
@@ -22,68 +200,126 @@ def ai_action():
     if not data:
         return jsonify({"error": "Request body is required"}), 400
     
-    # Extraer los parámetros para la función iaDeitu
-    prompt = data.get('prompt', '')
-    game_state = data.get('game_state')
+    prompt = data.get('prompt', '') or ''
+    game_state = data.get('game_state') or {}
     
-    # Extraer los campos necesarios para la IA incluyendo fog of war
-    simplified_game_state = {
-        "ia": game_state.get("ia", {}),
-        "player": {
-            "units": game_state.get("player", {}).get("units", [])
-        },
-        "difficulty": game_state.get("difficulty", ""),
-        "map_data": game_state.get("map_data", {}),
-        "map_size": game_state.get("map_size", {}),
-        "turn": game_state.get("turn", 1),
-        "ceasefire_turns": game_state.get("ceasefire_turns", 0)
-    }
-    
-    # Opcional: añadir identificador de juego para manejar múltiples conversaciones
-    game_id = game_state.get("id", "default_game")
+    # Cada partida tiene su propia conversación con el LLM
+    game_id = conversation_id()
     
-    # Llamar a la función iaDeitu
     try:
-        # El contexto de la conversación se maneja dentro de iaDeitu ahora
-        if len(prompt) < 10:
-            result = iaDeitu( game_state=simplified_game_state)
-        else:
-            result = iaDeitu(prompt, simplified_game_state)
-        current_app.logger.info(f"IA response raw: {result}")
-        
-        if isinstance(result, str):
-            # Extract JSON content by finding the first { and last }
-            first_brace_index = result.find('{')
-            last_brace_index = result.rfind('}')
-            
-            if first_brace_index != -1 and last_brace_index != -1 and first_brace_index < last_brace_index:
-                # Extract only the JSON part
-                cleaned_result = result[first_brace_index:last_brace_index + 1]
-                current_app.logger.info(f"Extracted JSON: {cleaned_result[:100]}...")
-                
-                try:
-                    # Parse the extracted JSON
-                    parsed_result = json.loads(cleaned_result)
-                    return jsonify(parsed_result)
-                except json.JSONDecodeError as e:
-                    current_app.logger.error(f"Error parsing extracted JSON: {e}")
-                    return jsonify({"error": "Invalid JSON format", "extracted_content": cleaned_result})
-            else:
-                # If no JSON structure found, try original response
-                current_app.logger.warning("No JSON structure found in response, trying original")
-                try:
-                    parsed_result = json.loads(result)
-                    return jsonify(parsed_result)
-                except json.JSONDecodeError:
-                    current_app.logger.error("Could not parse response as JSON")
-                    return jsonify({"result": result})
-        
-        # If result is not a string, return directly
+        result = run_ai_action(prompt, simplify_game_state(game_state), game_id)
+        current_app.logger.info(f"IA response: {str(result)[:100]}...")
         return jsonify(result)
     except Exception as e:
         current_app.logger.error(f"AI processing error: {str(e)}")
         return jsonify({"error": f"AI processing error: {str(e)}"}), 500
 
+@ia_blueprint.route('/api/ai/jobs', methods=['POST'])
+def submit_ai_job():
+    """
+    Start an AI turn in the background (same body as /api/ai/action, plus
+    "stream": true to publish the actions while the model generates them).
+    Returns the job id at once; a turn already requested for the same game
+    and turn returns the existing job.
+    """
+    user = session.get('user')
+    if not user:
+        return jsonify({"error": "User not logged in"}), 401
+    
+    data = request.json
+    if not data:
+        return jsonify({"error": "Request body is required"}), 400
+    
+    prompt = data.get('prompt', '') or ''
+    game_state = data.get('game_state') or {}
+    game_id = conversation_id()
+    
+    # Free prompts are never deduplicated, AI turns once per game and turn
+    if len(prompt) < 10:
+        key = (game_id, game_state.get("turn", 1))
+    else:
+        key = (game_id, "prompt", uuid.uuid4().hex)
+    
+    try:
+        if data.get('stream') and len(prompt) < 10:
+            job, created = ai_jobs.submit(key, session.get('username'), run_ai_stream,
+                                          simplify_game_state(game_state), game_id, progress=True)
+        else:
+            job, created = ai_jobs.submit(key, session.get('username'), run_ai_action,
+                                          prompt, simplify_game_state(game_state), game_id)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    
+    return jsonify({**job.to_dict(), "created": created}), 202
+
+def owned_job(job_id):
+    """Job of the logged-in user, or None"""
+    job = ai_jobs.get(job_id)
+    if job is None or job.owner != session.get('username'):
+        return None
+    return job
+
+@ia_blueprint.route('/api/ai/jobs/<job_id>', methods=['GET'])
+def get_ai_job(job_id):
+    """Status of an AI job, with its result once done"""
+    if not session.get('user'):
+        return jsonify({"error": "User not logged in"}), 401
+    
+    job = owned_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@ia_blueprint.route('/api/ai/jobs/<job_id>/events', methods=['GET'])
+def ai_job_events(job_id):
+    """
+    Server-sent events of an AI job: one "action" event per streamed action
+    as soon as it is generated, "status" events while it runs (also used as
+    keep-alive) and one "result" or "error" event at the end
+    """
+    if not session.get('user'):
+        return jsonify({"error": "User not logged in"}), 401
+    
+    job = owned_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    def events():
+        seen = 0
+        while True:
+            actions = job.wait_progress(seen, SSE_KEEPALIVE_SECONDS)
+            for action in actions:
+                yield sse_event("action", {"index": seen, "action": action})
+                seen += 1
+            if not actions:
+                if job.done.is_set():
+                    break
+                yield sse_event("status", {"job_id": job.id, "status": job.status})
+        final = job.to_dict()
+        yield sse_event("result" if job.status == DONE else "error", final)
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@ia_blueprint.route('/api/ai/usage', methods=['GET'])
+def ai_usage():
+    """
+    Token counts of the last AI turns of the active game, or of another game
+    of the user with ?game_id=: estimated size of the state sent (changes or
+    full), of the whole prompt and the counts reported by the API
+    """
+    if not session.get('user'):
+        return jsonify({"error": "User not logged in"}), 401
+    
+    game_id = request.args.get('game_id')
+    if not game_id or game_id == session.get('game_id'):
+        game_id = conversation_id()
+    elif not user_owns_game(game_id, session.get('username')):
+        return jsonify({"error": "Game not found or access denied"}), 404
+    context = ai_conversations.peek(str(game_id))
+    turns = list(context.memory.usage) if context else []
+    return jsonify({"game_id": game_id, "turns": turns}), 200
+
 @ia_blueprint.route('/api/ai/negotiate', methods=['POST'])
 def ai_negotiate():
     """
@@ -119,8 +355,7 @@ NO EXPLIQUES NADA, SOLO EL JSON.
 """
 
     try:
-        from IAProba import iaDeitu
-        result = iaDeitu(negotiation_prompt, game_state)
+        result = iaDeitu(negotiation_prompt, game_state, game_id=conversation_id())
         # Extraer solo el JSON de la respuesta
         if isinstance(result, str):
             first_brace = result.find('{')
@@ -147,8 +382,8 @@ NO EXPLIQUES NADA, SOLO EL JSON.
                             ia["resources"][res] = max(0, ia["resources"][res] - ia_amt + player_amt)
 
                         # Guardar los cambios en la sesión
-                        if "game" in session and session["game"]:
-                            session_game = session["game"]
+                        session_game = get_session_game()
+                        if session_game:
                             # Actualiza recursos en la sesión
                             if "player" in session_game:
                                 session_game["player"]["resources"] = player["resources"]
@@ -158,7 +393,7 @@ NO EXPLIQUES NADA, SOLO EL JSON.
                             ceasefire_turns = parsed.get("ceasefire_turns") or offer.get("ceasefireTurns") or offer.get("ceasefire_turns") or 0
                             session_game["ceasefire_turns"] = int(ceasefire_turns)
                             session_game["ceasefire_active"] = True
-                            session["game"] = session_game
+                            set_session_game(session_game)
 
                         parsed["resources_updated"] = True
                         parsed["ceasefire_turns"] = int(parsed.get("ceasefire_turns") or offer.get("ceasefireTurns") or 0)
@@ -1,10 +1,43 @@
-from flask import Blueprint, request, jsonify, session
-from database import (add_map, get_first_map, get_all_maps, delete_map, get_map)
+from flask import Blueprint, request, jsonify, session, make_response
+from database import (add_map, get_first_map, get_all_maps, delete_map, get_map,
+                      get_map_catalog, get_map_thumbnail, get_map_layer, MAX_MAP_SIDE)
+from map_codec import LAYER_ENCODINGS, unpack_layer, encode_base64
+from terrain_generator import GENERATORS, DEFAULT_GENERATOR, MAX_SEED
 from bson import ObjectId
+from bson.errors import InvalidId
 
 # Create blueprint for map routes
 map_blueprint = Blueprint('map', __name__)
 
+def layer_response(data, width, height, encoding):
+    """
+    Build the response for a packed layer in the format the client asked for:
+    - ?format=binary or Accept: application/octet-stream -> raw bytes
+    - ?format=base64 (default) -> JSON with the base64 encoded bytes
+    - ?format=json -> legacy list of lists
+    """
+    fmt = request.args.get('format')
+    if not fmt:
+        best = request.accept_mimetypes.best_match(['application/json', 'application/octet-stream'])
+        fmt = 'binary' if best == 'application/octet-stream' else 'base64'
+    
+    if fmt == 'binary':
+        response = make_response(data)
+        response.headers["Content-Type"] = "application/octet-stream"
+        response.headers["X-Layer-Width"] = str(width)
+        response.headers["X-Layer-Height"] = str(height)
+        response.headers["X-Layer-Encoding"] = encoding
+        return response
+    
+    payload = {"width": width, "height": height, "encoding": encoding}
+    if fmt == 'json':
+        payload["data"] = unpack_layer(data, width, height, encoding).tolist()
+    elif fmt == 'base64':
+        payload["data"] = encode_base64(data)
+    else:
+        return jsonify({"error": "format must be 'binary', 'base64' or 'json'"}), 400
+    return jsonify(payload), 200
+
 # Create a new map
 @map_blueprint.route('/api/maps', methods=['POST'])
 def create_map():
@@ -14,6 +47,8 @@ def create_map():
     startPoint = data.get('startPoint')
     difficulty = data.get('difficulty')
     name = data.get('name')  # Nuevo campo para el nombre del mapa
+    seed = data.get('seed')  # Optional: regenerate a map exactly from its seed
+    generator = data.get('generator', DEFAULT_GENERATOR)  # Optional: "scatter" or "noise"
     
     # Validate required fields
     if not width or not height or not startPoint or not difficulty:
@@ -23,14 +58,27 @@ def create_map():
     if not isinstance(width, int) or not isinstance(height, int):
         return jsonify({"error": "Width and height must be integers"}), 400
     
-    if not isinstance(startPoint, list) or len(startPoint) != 2:
+    if not 1 <= width <= MAX_MAP_SIDE or not 1 <= height <= MAX_MAP_SIDE:
+        return jsonify({"error": f"Width and height must be between 1 and {MAX_MAP_SIDE}"}), 400
+    
+    if (not isinstance(startPoint, list) or len(startPoint) != 2
+            or not all(isinstance(v, int) and not isinstance(v, bool) for v in startPoint)):
         return jsonify({"error": "StartPoint must be a list of two integers"}), 400
     
+    if not 0 <= startPoint[0] < width or not 0 <= startPoint[1] < height:
+        return jsonify({"error": "StartPoint must be inside the map"}), 400
+    
     if difficulty not in ["easy", "medium", "hard"]:
         return jsonify({"error": "Difficulty must be 'easy', 'medium', or 'hard'"}), 400
     
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or not 0 <= seed <= MAX_SEED):
+        return jsonify({"error": f"Seed must be an integer between 0 and {MAX_SEED}"}), 400
+    
+    if not isinstance(generator, str) or generator not in GENERATORS:
+        return jsonify({"error": f"Generator must be one of: {', '.join(GENERATORS)}"}), 400
+    
     # Create map in database
-    result = add_map(width, height, startPoint, difficulty, name)
+    result = add_map(width, height, startPoint, difficulty, name, seed, generator)
     
     return jsonify({
         "message": "Map created successfully",
@@ -81,6 +129,82 @@ def get_maps():
         print(f"Error getting maps: {e}")
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+@map_blueprint.route('/api/maps/catalog', methods=['GET'])
+def get_map_catalog_endpoint():
+    """
+    List map metadata without grids.
+    Query params: limit (1-100, default 20), cursor, difficulty, min_size, max_size
+    """
+    try:
+        sizes = {}
+        for name, default in (('limit', 20), ('min_size', None), ('max_size', None)):
+            value = request.args.get(name, default)
+            try:
+                sizes[name] = int(value) if value is not None else None
+            except ValueError:
+                return jsonify({"error": f"{name} must be an integer"}), 400
+        limit = min(max(sizes['limit'], 1), 100)
+        min_size, max_size = sizes['min_size'], sizes['max_size']
+        
+        difficulty = request.args.get('difficulty')
+        if difficulty and difficulty not in ["easy", "medium", "hard"]:
+            return jsonify({"error": "Difficulty must be 'easy', 'medium', or 'hard'"}), 400
+        
+        try:
+            maps, next_cursor = get_map_catalog(limit, request.args.get('cursor'), difficulty, min_size, max_size)
+        except InvalidId:
+            return jsonify({"error": "Invalid cursor"}), 400
+        
+        for map_doc in maps:
+            map_doc["thumbnail_url"] = f"/api/maps/{map_doc['map_id']}/thumbnail.png"
+        
+        return jsonify({"maps": maps, "next_cursor": next_cursor}), 200
+    except Exception as e:
+        print(f"Error getting map catalog: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@map_blueprint.route('/api/maps/<map_id>/thumbnail.png', methods=['GET'])
+def get_map_thumbnail_endpoint(map_id):
+    """Serve the precomputed terrain thumbnail of a map"""
+    try:
+        # Maps are immutable once created, so the thumbnail can be cached forever
+        etag = f'"{map_id}"'
+        if request.if_none_match.contains(map_id):
+            response = make_response("", 304)
+        else:
+            thumbnail = get_map_thumbnail(map_id)
+            if thumbnail is None:
+                return jsonify({"error": "Map not found"}), 404
+            response = make_response(thumbnail)
+            response.headers["Content-Type"] = "image/png"
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        response.headers["ETag"] = etag
+        return response
+    except InvalidId:
+        return jsonify({"error": "Map not found"}), 404
+    except Exception as e:
+        print(f"Error getting map thumbnail: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@map_blueprint.route('/api/maps/<map_id>/layers/<layer>', methods=['GET'])
+def get_map_layer_endpoint(map_id, layer):
+    """Get the terrain or grid layer of a map in packed form"""
+    try:
+        if layer not in ("terrain", "grid"):
+            return jsonify({"error": "Layer must be 'terrain' or 'grid'"}), 400
+        
+        result = get_map_layer(map_id, layer)
+        if not result:
+            return jsonify({"error": "Map not found"}), 404
+        
+        data, width, height = result
+        return layer_response(data, width, height, LAYER_ENCODINGS[layer])
+    except InvalidId:
+        return jsonify({"error": "Map not found"}), 404
+    except Exception as e:
+        print(f"Error getting map layer: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
 @map_blueprint.route('/api/maps/<map_id>', methods=['DELETE'])
 def delete_map_endpoint(map_id):
     """Delete a map by its ID"""
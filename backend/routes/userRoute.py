@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, session
-from database import (add_user, find_user, get_all_users, update_user_login, get_user_games, get_db)
+from database import (add_user, find_user, get_all_users, update_user_login, get_user_games, get_db,
+                      delete_game, normalize_game_id, get_user_game_summaries)
 import hashlib
 from bson import ObjectId
 import datetime
@@ -164,6 +165,32 @@ def get_user_games_endpoint():
     except Exception as e:
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+@user_blueprint.route('/api/user/games/summary', methods=['GET'])
+def get_user_game_summaries_endpoint():
+    """
+    Get a page of the current user's saved games without the map and fog grids.
+    Query params: limit (1-100, default 20) and cursor (next_cursor of the previous page)
+    """
+    try:
+        # Check if user is logged in
+        if 'username' not in session or not session['username']:
+            return jsonify({"error": "User not logged in"}), 401
+        
+        try:
+            limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        
+        cursor = request.args.get('cursor')
+        try:
+            games, next_cursor = get_user_game_summaries(session['username'], limit, cursor)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        
+        return jsonify({"games": games, "next_cursor": next_cursor}), 200
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
 @user_blueprint.route('/api/user/games/<game_id>', methods=['DELETE'])
 def delete_user_game_endpoint(game_id):
     """Delete a specific game for the current user"""
@@ -173,71 +200,28 @@ def delete_user_game_endpoint(game_id):
             return jsonify({"error": "User not logged in"}), 401
         
         username = session['username']
+        game_id = normalize_game_id(game_id)
         print(f"Attempting to delete game {game_id} for user {username}")
         
         # Get the database connection
         db = get_db()
         
-        # Get the game to verify ownership
-        game = db.games.find_one({"game_id": game_id})
-        print(f"Found game: {game is not None}")
-        
+        # Get the game owner to verify ownership (single indexed lookup)
+        game = db.games.find_one({"game_id": game_id}, {"username": 1})
         if not game:
-            # Try to find with different ID formats
-            try:
-                # Try as string first
-                print(f"Trying to find game with string ID: {game_id}")
-                game = db.games.find_one({"game_id": str(game_id)})
-                
-                # Then try as integer
-                if not game:
-                    print(f"Trying to find game with numeric ID")
-                    numeric_id = int(game_id)
-                    game = db.games.find_one({"game_id": numeric_id})
-                    if game:
-                        game_id = numeric_id  # Update game_id for deletion
-                        print(f"Found game with numeric ID: {numeric_id}")
-            except (ValueError, TypeError) as e:
-                print(f"Error converting game_id: {str(e)}")
-                
-            # If still not found, return 404
-            if not game:
-                print("Game not found after all attempts")
-                return jsonify({"error": "Game not found"}), 404
-        
-        # Print game details for debugging
-        print(f"Game details: ID={game.get('game_id')}, Owner={game.get('username')}")
+            return jsonify({"error": "Game not found"}), 404
         
         # Verify that the game belongs to the current user
         if game.get("username") != username:
             return jsonify({"error": "Not authorized to delete this game"}), 403
         
-        # Delete the game directly from database to avoid any issues
         try:
-            print(f"Attempting direct deletion of game_id: {game_id}")
-            result = db.games.delete_one({"game_id": game_id})
-            if result.deleted_count > 0:
-                print(f"Game successfully deleted with direct DB call")
+            # delete_game also drops the game from the game store
+            if delete_game(game_id):
                 return jsonify({"message": "Game deleted successfully"}), 200
-            
-            # Try different format just in case
-            print(f"Trying deletion with alternate formats")
-            if isinstance(game_id, str):
-                try:
-                    numeric_id = int(game_id)
-                    result = db.games.delete_one({"game_id": numeric_id})
-                    if result.deleted_count > 0:
-                        print(f"Game deleted with numeric ID")
-                        return jsonify({"message": "Game deleted successfully (numeric ID)"}), 200
-                except ValueError:
-                    pass
-            
-            # If we get here, deletion failed
-            print("Failed to delete game after multiple attempts")
             return jsonify({"error": "Failed to delete game"}), 500
-            
         except Exception as delete_error:
-            print(f"Exception during direct deletion: {str(delete_error)}")
+            print(f"Exception during deletion: {str(delete_error)}")
             return jsonify({"error": f"Database error: {str(delete_error)}"}), 500
     except Exception as e:
         print(f"Exception in delete_user_game_endpoint: {str(e)}")
@@ -0,0 +1,181 @@
+"""
+Completion-turn scheduler for research and production.
+
+Starting a timer (city production, city research or research in a library
+building) pushes one event on a per-game priority queue keyed by the turn in
+which it completes. The end of turn only pops the events that are due, so
+its cost depends on the number of completions, not on the number of cities
+and buildings.
+
+The queue is stored in the game as ``schedule``: a heap of
+``[due_turn, seq, player_type, city_id, kind, item_id, building_id]`` lists
+(plain JSON, persisted with the rest of the state). The timer slot itself
+keeps ``completes_at``; an event whose slot was cancelled or replaced no
+longer matches it and is dropped when popped.
+
+A timer has at most one event: scheduling it again replaces its event, and
+a game uploaded by the client gets its queue rebuilt from its timers, so the
+queue never holds more than the running timers. ``turns_remaining`` is the
+client's view of a timer: an upload that changed it reschedules the timer,
+and the server writes it back (``refresh_turns_remaining``) only once per
+turn or queue change.
+"""
+import heapq
+
+SCHEDULE_FIELD = "schedule"
+SEQUENCE_FIELD = "schedule_seq"
+# [turn, seq] of the last refresh_turns_remaining
+REFRESHED_FIELD = "schedule_refreshed"
+
+# Timer kinds
+PRODUCTION = "production"
+RESEARCH = "research"
+LIBRARY = "library"
+
+PLAYER_TYPES = ("player", "ia")
+
+
+def city_key(city):
+    """Identifier of a city in scheduled events"""
+    return city.get("id") or city.get("name")
+
+
+def is_library(building):
+    """True for library buildings (they run research in their production slot)"""
+    return isinstance(building, dict) and \
+        (building.get("type_id") == "library" or building.get("name", "").lower() == "library")
+
+
+def timer_slot(city, kind, building_id=None):
+    """The dict holding a timer of a city, or None"""
+    if kind == PRODUCTION:
+        return city.get("production")
+    if kind == RESEARCH:
+        return city.get("research")
+    for building in city.get("buildings") or []:
+        if is_library(building) and (building.get("id") or building.get("type_id")) == building_id:
+            return building.get("production")
+    return None
+
+
+def timer_item(slot, kind):
+    """Item produced or researched by an active timer slot (None if idle)"""
+    if not slot:
+        return None
+    if kind == PRODUCTION:
+        return slot.get("current_item") if slot.get("turns_remaining", 0) > 0 else None
+    return slot.get("current_technology")
+
+
+def due_turn(game, slot):
+    """Turn at the end of which a timer with its turns_remaining completes"""
+    return (game.get("turn") or 1) + max(slot.get("turns_remaining") or 0, 1) - 1
+
+
+def _event(game, player_type, city, kind, item_id, building_id, due):
+    game[SEQUENCE_FIELD] = game.get(SEQUENCE_FIELD, 0) + 1
+    return [due, game[SEQUENCE_FIELD], player_type, city_key(city), kind, item_id, building_id]
+
+
+def schedule_timer(game, player_type, city, kind, building_id=None):
+    """
+    Enqueue the completion of a timer that was just started, replacing the
+    event of the timer it replaced. A timer with n turns remaining completes
+    at the end of turn (current turn + n - 1).
+    """
+    slot = timer_slot(city, kind, building_id)
+    item_id = timer_item(slot, kind)
+    if item_id is None:
+        return None
+
+    due = due_turn(game, slot)
+    slot["completes_at"] = due
+
+    key = (player_type, city_key(city), kind, building_id)
+    schedule = [event for event in game.get(SCHEDULE_FIELD) or []
+                if (event[2], event[3], event[4], event[6]) != key]
+    schedule.append(_event(game, player_type, city, kind, item_id, building_id, due))
+    heapq.heapify(schedule)
+    game[SCHEDULE_FIELD] = schedule
+    return due
+
+
+def schedule_timers(game):
+    """
+    Rebuild the queue from the running timers of a game replaced by the
+    client (or saved before the scheduler existed): timers that were
+    cancelled or completed lose their event, timers started or whose
+    turns_remaining was changed by the client are (re)scheduled. Called when
+    a whole game is replaced, not at the end of every turn.
+    Returns the number of timers (re)scheduled.
+    """
+    schedule = []
+    scheduled = 0
+    for player_type in PLAYER_TYPES:
+        for city in game.get(player_type, {}).get("cities", []):
+            timers = [(PRODUCTION, None), (RESEARCH, None)]
+            timers += [(LIBRARY, building.get("id") or building.get("type_id"))
+                       for building in city.get("buildings") or [] if is_library(building)]
+            for kind, building_id in timers:
+                slot = timer_slot(city, kind, building_id)
+                item_id = timer_item(slot, kind)
+                if item_id is None:
+                    continue
+                due = due_turn(game, slot)
+                if slot.get("completes_at") != due:
+                    slot["completes_at"] = due
+                    scheduled += 1
+                schedule.append(_event(game, player_type, city, kind, item_id, building_id, due))
+    heapq.heapify(schedule)
+    game[SCHEDULE_FIELD] = schedule
+    game.pop(REFRESHED_FIELD, None)
+    return scheduled
+
+
+def pop_due_events(game):
+    """
+    Pop the events due at the end of the current turn whose timer is still
+    running. Returns a list of (player_type, city, kind, item_id, slot).
+    """
+    schedule = game.get(SCHEDULE_FIELD) or []
+    turn = game.get("turn") or 1
+    due_events = []
+    while schedule and schedule[0][0] <= turn:
+        due_events.append(heapq.heappop(schedule))
+    if not due_events:
+        return []
+
+    # City lookup only when something completes
+    cities = {player_type: {city_key(city): city for city in game.get(player_type, {}).get("cities", [])}
+              for player_type in PLAYER_TYPES}
+    completed = []
+    for due, _, player_type, city_id, kind, item_id, building_id in due_events:
+        city = cities.get(player_type, {}).get(city_id)
+        slot = timer_slot(city, kind, building_id) if city else None
+        if timer_item(slot, kind) == item_id and slot.get("completes_at") == due:
+            completed.append((player_type, city, kind, item_id, slot))
+    return completed
+
+
+def refresh_turns_remaining(game):
+    """
+    Set turns_remaining of the scheduled timers from their completion turn
+    (for clients that display it). Only runs when the turn or the queue
+    changed since the last refresh; its cost grows with the pending events.
+    """
+    schedule = game.get(SCHEDULE_FIELD) or []
+    turn = game.get("turn") or 1
+    marker = [turn, game.get(SEQUENCE_FIELD, 0)]
+    if not schedule or game.get(REFRESHED_FIELD) == marker:
+        return game
+    game[REFRESHED_FIELD] = marker
+    city_ids = {(event[2], event[3]) for event in schedule}
+    cities = {(player_type, city_key(city)): city
+              for player_type in PLAYER_TYPES for city in game.get(player_type, {}).get("cities", [])
+              if (player_type, city_key(city)) in city_ids}
+    for due, _, player_type, city_id, kind, item_id, building_id in schedule:
+        city = cities.get((player_type, city_id))
+        slot = timer_slot(city, kind, building_id) if city else None
+        if timer_item(slot, kind) == item_id and slot.get("completes_at") == due:
+            slot["turns_remaining"] = due - turn + 1
+    return game
@@ -0,0 +1,198 @@
+"""
+Game-scoped spatial index of units and cities.
+
+A dense uint8 grid holds one bit per (owner, kind) on every tile, and a hash
+maps each occupied coordinate to the entities on it, so "who is on (x, y)" is
+one lookup and "enemy units within r tiles" only looks at the tiles within r
+steps of the unit, whatever the number of units in the game. The grid answers
+the per-tile occupancy tests of the movement searches.
+
+Like the fog engines, indexes are cached per game while the game keeps the
+same unit and city lists, and the server code that moves, creates or removes
+units updates them incrementally (move_units in fog_of_war.py, complete_troop
+in turns.py). Every change bumps ``version`` so caches that depend on the
+occupancy (reachable tiles in movement.py) know when to drop their results.
+"""
+import functools
+import itertools
+import numpy as np
+from game_store import LRUGameStore, GAME_STORE_MAX_GAMES
+
+PLAYER_TYPES = ("player", "ia")
+
+# Grid bits of each owner and kind
+UNIT_BIT = {"player": 1, "ia": 2}
+CITY_BIT = {"player": 4, "ia": 8}
+
+_index_tokens = itertools.count(1)
+_index_cache = LRUGameStore(GAME_STORE_MAX_GAMES)
+
+
+def entity_position(entity):
+    """Position of a unit or city as an (x, y) tuple (None if it has none)"""
+    position = entity.get("position")
+    if position is None:
+        return None
+    if isinstance(position, dict):
+        return position.get("x", 0), position.get("y", 0)
+    return position[0], position[1]
+
+
+@functools.lru_cache(maxsize=16)
+def diamond_offsets(radius):
+    """(dx, dy) offsets within `radius` steps, nearest first"""
+    offsets = [(dx, dy) for dy in range(-radius, radius + 1) for dx in range(-radius, radius + 1)
+               if abs(dx) + abs(dy) <= radius]
+    return tuple(sorted(offsets, key=lambda offset: abs(offset[0]) + abs(offset[1])))
+
+
+def enemy_of(player_type):
+    """The other player"""
+    return "ia" if player_type == "player" else "player"
+
+
+class SpatialIndex:
+    """Occupancy grid plus coordinate hash of the units and cities of a game"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.grid = np.zeros((height, width), dtype=np.uint8)
+        # (x, y) -> [(player_type, unit), ...] (normally a single unit)
+        self.units = {}
+        # (x, y) -> (player_type, city)
+        self.cities = {}
+        # Unique per index, so a rebuilt index never matches an old cache key
+        self.token = next(_index_tokens)
+        self.version = 0
+        # Game lists this index is in sync with (see get_spatial_index)
+        self.lists = {}
+        self.counts = {}
+
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def __contains__(self, position):
+        """True if a unit or a city is on the tile"""
+        x, y = position[0], position[1]
+        return self.inside(x, y) and self.grid[y, x] != 0
+
+    def _refresh_tile(self, tile):
+        """Recompute the grid bits of one tile from the hash"""
+        bits = 0
+        for player_type, _ in self.units.get(tile, ()):
+            bits |= UNIT_BIT[player_type]
+        if tile in self.cities:
+            bits |= CITY_BIT[self.cities[tile][0]]
+        if self.inside(*tile):
+            self.grid[tile[1], tile[0]] = bits
+        self.version += 1
+
+    def add_unit(self, player_type, unit, position=None):
+        tile = tuple(position[:2]) if position is not None else entity_position(unit)
+        self.counts[("units", player_type)] = self.counts.get(("units", player_type), 0) + 1
+        if tile is None:
+            return
+        self.units.setdefault(tile, []).append((player_type, unit))
+        self._refresh_tile(tile)
+
+    def remove_unit(self, player_type, unit, position=None):
+        tile = tuple(position[:2]) if position is not None else entity_position(unit)
+        if tile is None:
+            self.counts[("units", player_type)] -= 1
+            return
+        entries = self.units.get(tile, [])
+        for index, (_, other) in enumerate(entries):
+            if other is unit:
+                del entries[index]
+                self.counts[("units", player_type)] -= 1
+                break
+        if not entries:
+            self.units.pop(tile, None)
+        self._refresh_tile(tile)
+
+    def move_unit(self, player_type, unit, old_position, new_position):
+        self.remove_unit(player_type, unit, old_position)
+        self.add_unit(player_type, unit, new_position)
+
+    def add_city(self, player_type, city, position=None):
+        tile = tuple(position[:2]) if position is not None else entity_position(city)
+        self.counts[("cities", player_type)] = self.counts.get(("cities", player_type), 0) + 1
+        if tile is None:
+            return
+        self.cities[tile] = (player_type, city)
+        self._refresh_tile(tile)
+
+    def remove_city(self, player_type, city, position=None):
+        tile = tuple(position[:2]) if position is not None else entity_position(city)
+        if tile in self.cities and self.cities[tile][1] is city:
+            del self.cities[tile]
+            self.counts[("cities", player_type)] -= 1
+        self._refresh_tile(tile)
+
+    def unit_at(self, x, y):
+        """(player_type, unit) on a tile, or None"""
+        entries = self.units.get((x, y))
+        return entries[0] if entries else None
+
+    def city_at(self, x, y):
+        """(player_type, city) on a tile, or None"""
+        return self.cities.get((x, y))
+
+    def units_within(self, player_type, position, radius):
+        """
+        Units of a player within `radius` steps (Manhattan distance) of a
+        position, nearest first. Only the tiles of that diamond are looked up.
+        """
+        x, y = position[0], position[1]
+        found = []
+        for dx, dy in diamond_offsets(radius):
+            entries = self.units.get((x + dx, y + dy))
+            if entries:
+                found.extend(unit for owner, unit in entries if owner == player_type)
+        return found
+
+
+def build_spatial_index(game):
+    """Index every unit and city of both players"""
+    map_size = game.get("map_size", {})
+    index = SpatialIndex(map_size.get("width", 0), map_size.get("height", 0))
+    for player_type in PLAYER_TYPES:
+        side = game.get(player_type)
+        if not isinstance(side, dict):
+            continue
+        for city in side.get("cities", []):
+            index.add_city(player_type, city)
+        for unit in side.get("units", []):
+            index.add_unit(player_type, unit)
+        index.lists[player_type] = (side.get("units"), side.get("cities"))
+    return index
+
+
+def _in_sync(index, game):
+    """The index was built from these lists and saw every append and removal"""
+    for player_type in PLAYER_TYPES:
+        side = game.get(player_type)
+        if not isinstance(side, dict):
+            continue
+        units, cities = index.lists.get(player_type, (None, None))
+        if units is not side.get("units") or cities is not side.get("cities"):
+            return False
+        if len(units or ()) != index.counts.get(("units", player_type), 0) or \
+                len(cities or ()) != index.counts.get(("cities", player_type), 0):
+            return False
+    return True
+
+
+def get_spatial_index(game):
+    """
+    Get the spatial index of a game, reusing the cached one while the game
+    still holds the same unit and city lists
+    """
+    key = str(game.get("game_id"))
+    index = _index_cache.get(key)
+    if index is not None and _in_sync(index, game):
+        return index
+    index = build_spatial_index(game)
+    _index_cache.put(key, index)
+    return index
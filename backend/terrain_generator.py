@@ -0,0 +1,366 @@
+"""
+Vectorized, seeded terrain generation.
+
+Terrain codes (same as the rest of the game):
+- 0: Normal terrain
+- 1: Water
+- 2: Gold (7% of minerals)
+- 3: Iron (13% of minerals)
+- 4: Wood (60% of minerals)
+- 5: Stone (20% of minerals)
+
+Two generators are available, selected per map:
+- "scatter": clustered lakes and scattered minerals (the original layout)
+- "noise": multi-octave gradient noise with thresholds, giving coherent
+  lakes, rivers and resource belts
+
+Every generator takes an explicit seed, so a map can be regenerated exactly
+from (generator, width, height, difficulty, seed, start point).
+"""
+import secrets
+import numpy as np
+
+LAND = 0
+WATER = 1
+GOLD = 2
+IRON = 3
+WOOD = 4
+STONE = 5
+
+# Fixed water percentage regardless of difficulty
+WATER_PERCENT = 15
+
+# Mineral percentage per difficulty (unknown difficulties use easy)
+MINERAL_PERCENT = {
+    "easy": 20,
+    "medium": 15,
+    "hard": 10,
+}
+
+# Average lake size used to decide how many lake seeds to place
+LAKE_SIZE = 10
+# Chance that a land tile next to a lake becomes water in each growth step
+LAKE_GROWTH_CHANCE = 0.35
+# Chance that a mineral tile gets one adjacent tile of the same type
+MINERAL_CLUSTER_CHANCE = 0.3
+
+# Noise generator settings
+# Low-resolution samples per period of the finest octave (noise is computed at
+# low resolution and bilinearly upsampled, the finest octaves stay smooth)
+NOISE_SAMPLES_PER_PERIOD = 4
+NOISE_OCTAVES = 5
+# Width of the river channels (as a fraction of the ridge noise amplitude)
+RIVER_WIDTH = 0.08
+# How much a river channel lowers the water score compared to elevation
+RIVER_STRENGTH = 0.6
+# No water within this Manhattan distance of the start point
+START_CLEAR_RADIUS = 4
+# Seeds are stored in the map document: they must fit in a BSON int64
+MAX_SEED = 2 ** 63 - 1
+
+
+def new_seed():
+    """Random seed to store with a map (fits in a BSON int64)"""
+    return secrets.randbits(31)
+
+
+def tile_counts(width, height, difficulty):
+    """
+    Exact number of tiles of each type for a map, using the same rounding as
+    the original generator
+    """
+    total_tiles = width * height
+    mineral_tiles = int(total_tiles * MINERAL_PERCENT.get(difficulty, 20) / 100)
+    gold_tiles = int(mineral_tiles * 0.07)
+    iron_tiles = int(mineral_tiles * 0.13)
+    stone_tiles = int(mineral_tiles * 0.20)
+    return {
+        WATER: int(total_tiles * WATER_PERCENT / 100),
+        GOLD: gold_tiles,
+        IRON: iron_tiles,
+        STONE: stone_tiles,
+        WOOD: mineral_tiles - gold_tiles - iron_tiles - stone_tiles,
+    }
+
+
+def dilate(mask):
+    """4-neighbour dilation of a boolean mask (without wrapping at the edges)"""
+    grown = mask.copy()
+    grown[1:, :] |= mask[:-1, :]
+    grown[:-1, :] |= mask[1:, :]
+    grown[:, 1:] |= mask[:, :-1]
+    grown[:, :-1] |= mask[:, 1:]
+    return grown
+
+
+def adjust_count(mask, allowed, target, rng, removable=None):
+    """
+    Add or remove random tiles so that exactly `target` tiles of mask are set.
+    Tiles are added only where `allowed` is set and removed preferably from `removable`.
+    """
+    flat = mask.ravel()
+    count = int(flat.sum())
+    if count > target:
+        pool = np.flatnonzero((removable if removable is not None else mask).ravel() & flat)
+        if len(pool) < count - target:
+            pool = np.flatnonzero(flat)
+        flat[rng.choice(pool, count - target, replace=False)] = False
+    elif count < target:
+        pool = np.flatnonzero(allowed.ravel() & ~flat)
+        flat[rng.choice(pool, min(target - count, len(pool)), replace=False)] = True
+    return mask
+
+
+def place_water(shape, water_tiles, rng):
+    """
+    Grow lakes from random seeds by repeated random dilation.
+    Returns a boolean mask with exactly water_tiles tiles set.
+    """
+    height, width = shape
+    water = np.zeros(shape, dtype=bool)
+    if water_tiles <= 0:
+        return water
+
+    seeds = max(3, water_tiles // LAKE_SIZE)
+    water.ravel()[rng.choice(width * height, min(seeds, width * height), replace=False)] = True
+
+    last_added = water.copy()
+    while water.sum() < water_tiles:
+        border = dilate(water) & ~water
+        last_added = border & (rng.random(shape) < LAKE_GROWTH_CHANCE)
+        if not border.any():
+            break
+        water |= last_added
+
+    # Trim the overshoot from the last growth ring (or fill the gap with single tiles)
+    return adjust_count(water, ~water, water_tiles, rng, removable=last_added)
+
+
+def place_mineral(terrain, mineral, count, rng):
+    """
+    Place `count` tiles of a mineral on free land, ~30% of them with an
+    adjacent tile of the same type
+    """
+    if count <= 0:
+        return
+    height, width = terrain.shape
+    free = np.flatnonzero(terrain.ravel() == LAND)
+    if len(free) == 0:
+        return
+
+    # Seeds plus one cluster partner for some of them add up to roughly count
+    seeds = rng.choice(free, min(len(free), max(1, int(count / (1 + MINERAL_CLUSTER_CHANCE)))), replace=False)
+    mask = np.zeros(terrain.shape, dtype=bool)
+    mask.ravel()[seeds] = True
+
+    partners = seeds[rng.random(len(seeds)) < MINERAL_CLUSTER_CHANCE]
+    px, py = partners % width, partners // width
+    direction = rng.integers(0, 4, len(partners))
+    px = px + np.array([-1, 1, 0, 0])[direction]
+    py = py + np.array([0, 0, -1, 1])[direction]
+    inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+    mask[py[inside], px[inside]] = True
+
+    mask &= terrain == LAND
+    adjust_count(mask, terrain == LAND, count, rng)
+    terrain[mask] = mineral
+
+
+def generate_scatter_terrain(width, height, difficulty, seed):
+    """
+    NumPy version of the original scatter generator: clustered lakes plus
+    scattered (lightly clustered) minerals, with the same percentages.
+    Returns a (height, width) uint8 array.
+    """
+    rng = np.random.default_rng(seed)
+    counts = tile_counts(width, height, difficulty)
+
+    terrain = np.zeros((height, width), dtype=np.uint8)
+    terrain[place_water(terrain.shape, counts[WATER], rng)] = WATER
+
+    for mineral in (GOLD, IRON, STONE, WOOD):
+        place_mineral(terrain, mineral, counts[mineral], rng)
+
+    return terrain
+
+
+def clear_water_around(terrain, start_point, radius=4):
+    """
+    Turn water into normal terrain within a Manhattan radius of the start point
+    """
+    height, width = terrain.shape
+    x_start, y_start = start_point
+    ys, xs = np.ogrid[:height, :width]
+    near = (np.abs(xs - x_start) + np.abs(ys - y_start)) <= radius
+    terrain[near & (terrain == WATER)] = LAND
+    return terrain
+
+
+def gradient_noise(shape, period, rng):
+    """
+    2D gradient (Perlin) noise with the given period in pixels.
+    The grid is regular, so the x interpolation is done once per lattice row
+    and only the y interpolation runs over the whole (height, width) array.
+    """
+    height, width = shape
+    period = np.float32(period)
+    angles = rng.random((int(height / period) + 2, int(width / period) + 2), dtype=np.float32)
+    angles *= np.float32(2 * np.pi)
+    grad_x, grad_y = np.cos(angles), np.sin(angles)
+
+    xs = np.arange(width, dtype=np.float32) / period
+    x_floor = np.floor(xs)
+    xi, xf = x_floor.astype(np.intp), xs - x_floor
+    ys = np.arange(height, dtype=np.float32) / period
+    y_floor = np.floor(ys)
+    yi, yf = y_floor.astype(np.intp), (ys - y_floor)[:, None]
+
+    # Quintic fade curves
+    sx = xf * xf * xf * (xf * (xf * 6 - 15) + 10)
+    sy = yf * yf * yf * (yf * (yf * 6 - 15) + 10)
+
+    # Per lattice row: x-interpolated x-gradient term and y-gradient weight
+    row_x = grad_x[:, xi] * (xf * (1 - sx)) + grad_x[:, xi + 1] * ((xf - 1) * sx)
+    row_y = grad_y[:, xi] * (1 - sx) + grad_y[:, xi + 1] * sx
+
+    top = row_x[yi]
+    top += yf * row_y[yi]
+    bottom = row_x[yi + 1]
+    bottom += (yf - 1) * row_y[yi + 1]
+    bottom -= top
+    bottom *= sy
+    top += bottom
+    return top
+
+
+def fractal_noise(shape, period, octaves, rng, ridged=False):
+    """
+    Sum of octaves of gradient noise (each one half the period and amplitude
+    of the previous). Ridged noise uses 1 - |noise|, which peaks along lines.
+    Octaves with a period below 2 pixels are skipped.
+    """
+    total = np.zeros(shape, dtype=np.float32)
+    amplitude = 1.0
+    for _ in range(octaves):
+        if period < 2:
+            break
+        octave = gradient_noise(shape, period, rng)
+        if ridged:
+            octave = 1 - np.abs(octave)
+        total += np.float32(amplitude) * octave
+        period /= 2
+        amplitude /= 2
+    return total
+
+
+def upsample(low, shape, factor):
+    """
+    Bilinear upsample of a low-resolution field by an integer factor
+    """
+    height, width = shape
+    if factor == 1:
+        return np.ascontiguousarray(low[:height, :width])
+
+    xs = np.arange(width, dtype=np.float32) / np.float32(factor)
+    x_floor = np.floor(xs)
+    xi, xf = x_floor.astype(np.intp), xs - x_floor
+    ys = np.arange(height, dtype=np.float32) / np.float32(factor)
+    y_floor = np.floor(ys)
+    yi, yf = y_floor.astype(np.intp), (ys - y_floor)[:, None]
+
+    rows = low[:, xi]
+    rows += (low[:, xi + 1] - rows) * xf
+    field = rows[yi]
+    below = rows[yi + 1]
+    below -= field
+    below *= yf
+    field += below
+    return field
+
+
+def lowest(score, count):
+    """Flat indices of the `count` lowest values of a field (exact count)"""
+    flat = score.ravel()
+    count = min(count, flat.size)
+    if count <= 0:
+        return np.empty(0, dtype=np.intp)
+    if count == flat.size:
+        return np.arange(flat.size)
+    return np.argpartition(flat, count - 1)[:count]
+
+
+def generate_noise_terrain(width, height, difficulty, seed, start_point=None):
+    """
+    Noise-based biome terrain:
+    - water: lowest tiles of an elevation field, carved by ridged-noise rivers
+    - minerals: belts along the ridges of a second noise field
+    - mineral type: decided by a low-frequency "geology" field
+    Tile counts match the difficulty percentages exactly, and no water is
+    placed within START_CLEAR_RADIUS (Manhattan) of the start point.
+    Returns a (height, width) uint8 array.
+    """
+    rng = np.random.default_rng(seed)
+    counts = tile_counts(width, height, difficulty)
+    shape = (height, width)
+
+    # Noise is computed at low resolution and upsampled
+    base_period = max(width, height) / 4
+    finest_period = base_period / 2 ** (NOISE_OCTAVES - 1)
+    factor = max(1, int(finest_period / NOISE_SAMPLES_PER_PERIOD))
+    low_shape = (-(-height // factor) + 1, -(-width // factor) + 1)
+    low_period = base_period / factor
+
+    # Water score: elevation minus river channels (lower = wetter)
+    elevation = fractal_noise(low_shape, low_period, NOISE_OCTAVES, rng)
+    ridges = fractal_noise(low_shape, low_period, 2, rng, ridged=True) / np.float32(1.5)
+    elevation -= RIVER_STRENGTH * np.clip((ridges - (1 - RIVER_WIDTH)) / RIVER_WIDTH, 0, 1)
+    water_score = upsample(elevation, shape, factor)
+
+    if start_point is not None:
+        x_start, y_start = start_point
+        r = START_CLEAR_RADIUS
+        y0, x0 = max(0, y_start - r), max(0, x_start - r)
+        ys, xs = np.ogrid[y0:min(height, y_start + r + 1), x0:min(width, x_start + r + 1)]
+        near = (np.abs(xs - x_start) + np.abs(ys - y_start)) <= r
+        water_score[y0:y0 + near.shape[0], x0:x0 + near.shape[1]][near] = np.inf
+
+    terrain = np.zeros(shape, dtype=np.uint8)
+    flat = terrain.ravel()
+    water = lowest(water_score, counts[WATER])
+    flat[water] = WATER
+
+    # Mineral belts: highest ridged values on land
+    mineral_score = upsample(fractal_noise(low_shape, low_period / 2, 3, rng, ridged=True), shape, factor)
+    np.negative(mineral_score, out=mineral_score)
+    mineral_score.ravel()[water] = np.inf
+    mineral_total = counts[GOLD] + counts[IRON] + counts[STONE] + counts[WOOD]
+    minerals = lowest(mineral_score, mineral_total)
+
+    # Mineral type bands along a low-frequency geology field (nearest sample is enough)
+    geology = fractal_noise(low_shape, low_period, 2, rng)
+    geology = geology[(minerals // width) // factor, (minerals % width) // factor]
+    bounds = np.cumsum([counts[GOLD], counts[IRON], counts[STONE]])
+    order = np.argpartition(geology, bounds[bounds < len(geology)]) if len(geology) else geology.astype(np.intp)
+    start = 0
+    for mineral in (GOLD, IRON, STONE, WOOD):
+        flat[minerals[order[start:start + counts[mineral]]]] = mineral
+        start += counts[mineral]
+
+    return terrain
+
+
+# Terrain generators selectable per map
+GENERATORS = {
+    "scatter": lambda width, height, difficulty, seed, start_point: generate_scatter_terrain(width, height, difficulty, seed),
+    "noise": generate_noise_terrain,
+}
+DEFAULT_GENERATOR = "scatter"
+
+
+def generate_terrain(generator, width, height, difficulty, seed, start_point=None):
+    """
+    Generate terrain with the named generator. Raises ValueError for unknown generators.
+    """
+    if generator not in GENERATORS:
+        raise ValueError(f"Unknown terrain generator: {generator}")
+    return GENERATORS[generator](width, height, difficulty, seed, start_point)
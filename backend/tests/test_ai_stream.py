@@ -0,0 +1,85 @@
+"""
+ai_stream.ActionStreamParser: actions are returned as soon as they are
+complete, whatever the chunk boundaries, and only from the top-level
+"actions" array.
+"""
+import json
+
+import pytest
+
+from ai_stream import ActionStreamParser
+
+ACTIONS = [
+    {"type": "movement", "unit_id": "u1", "position": [1, 2], "target_position": [2, 2]},
+    {"type": "city_production", "city_id": "c1", "action": "train", "item_id": "warrior"},
+    {"type": "construction", "building": "city", "city_name": "Hiria \"Berria\" {1} [2] \\"},
+]
+
+RESPONSE = ("Here is my plan for this turn.\n"
+            + json.dumps({"reasoning": "move \"first\", then [train]", "actions": ACTIONS, "summary": "ok"}))
+
+
+def feed_all(chunks, parser=None):
+    parser = parser or ActionStreamParser()
+    actions = []
+    for chunk in chunks:
+        actions.extend(parser.feed(chunk))
+    return actions
+
+
+def test_whole_response_in_one_chunk():
+    parser = ActionStreamParser()
+    assert parser.feed(RESPONSE) == ACTIONS
+    assert parser.actions_count == len(ACTIONS)
+    assert parser.text == RESPONSE
+
+
+def test_one_character_at_a_time():
+    assert feed_all(RESPONSE) == ACTIONS
+
+
+@pytest.mark.parametrize("split", range(0, len(RESPONSE) + 1, 7))
+def test_split_in_two_chunks_anywhere(split):
+    assert feed_all([RESPONSE[:split], RESPONSE[split:]]) == ACTIONS
+
+
+def test_each_action_is_returned_when_its_bracket_closes():
+    parser = ActionStreamParser()
+    first_end = RESPONSE.index("}", RESPONSE.index('"actions"')) + 1
+    assert parser.feed(RESPONSE[:first_end - 1]) == []
+    assert parser.feed(RESPONSE[first_end - 1:first_end]) == [ACTIONS[0]]
+
+
+def test_escaped_quotes_and_backslashes_in_strings():
+    action = {"type": "movement", "note": "a \\\" b \\\\", "tricky": "\"}],[{\\"}
+    text = json.dumps({"actions": [action, {"type": "attack"}]})
+    assert feed_all(text) == [action, {"type": "attack"}]
+
+
+def test_nested_actions_keys_are_ignored():
+    nested = {"type": "movement", "plan": {"actions": [{"type": "fake"}]}, "actions": [1, 2]}
+    text = json.dumps({"context": {"actions": [{"type": "ignored"}]}, "actions": [nested, {"type": "attack"}]})
+    assert feed_all(text) == [nested, {"type": "attack"}]
+
+
+def test_actions_string_value_is_not_a_key():
+    text = json.dumps({"note": "actions", "list": [{"type": "ignored"}], "actions": [{"type": "attack"}]})
+    assert feed_all(text) == [{"type": "attack"}]
+
+
+def test_other_key_can_be_streamed():
+    text = json.dumps({"actions": [{"type": "ignored"}], "moves": [{"type": "movement"}]})
+    assert feed_all(text, ActionStreamParser(key="moves")) == [{"type": "movement"}]
+
+
+def test_text_after_the_object_is_ignored():
+    text = json.dumps({"actions": [{"type": "attack"}]}) + ' and {"actions": [{"type": "again"}]}'
+    assert feed_all(text) == [{"type": "attack"}]
+
+
+def test_non_object_elements_and_malformed_actions():
+    parser = ActionStreamParser()
+    actions = feed_all('{"actions": [1, {"type": "attack", "x": 1 2}, ["a"], {"type": "movement"}]}', parser)
+    # Scalars are not elements the parser emits; the malformed object is skipped
+    assert actions == [["a"], {"type": "movement"}]
+    assert parser.actions_count == 2
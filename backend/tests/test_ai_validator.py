@@ -0,0 +1,243 @@
+"""
+ai_validator.ActionValidator on a small hand-built map: moves clamped to
+reachable tiles, occupancy and positions followed through the replay, health
+clamping after attacks and resources spent in order.
+"""
+import copy
+
+import pytest
+
+from ai_validator import ActionValidator, validate_plan
+
+# 8x5 map, water at x == 4 except on the last row
+#
+#   y=0  .  W1 .  .  ~  .  .  C1
+#   y=1  .  .  .  .  ~  .  .  .
+#   y=2  .  W2 .  .  ~  .  .  .
+#   y=3  .  .  .  P1 ~  .  S2 .
+#   y=4  S1 .  .  .  .  .  .  .
+WIDTH, HEIGHT = 8, 5
+
+
+def game_state(**overrides):
+    state = {
+        "map_size": {"width": WIDTH, "height": HEIGHT},
+        "map_data": {"terrain": [[1 if x == 4 and y < 4 else 0 for x in range(WIDTH)] for y in range(HEIGHT)]},
+        "ia": {
+            "fog_grid": [[1] * WIDTH for _ in range(HEIGHT)],
+            "units": [
+                {"id": "w1", "type_id": "warrior", "position": [1, 0], "movement": 2, "health": 100},
+                {"id": "w2", "type_id": "warrior", "position": [1, 2], "movement": 2, "health": 80},
+                {"id": "s1", "type_id": "settler", "position": [0, 4], "movement": 2, "health": 50},
+                {"id": "s2", "type_id": "settler", "position": [6, 3], "movement": 2, "health": 50},
+            ],
+            "cities": [{"id": "c1", "name": "Hiria", "position": [7, 0], "buildings": []}],
+            # One city (20 wood, 15 stone) and one warrior (110 food)
+            "resources": {"wood": 30, "stone": 20, "food": 150},
+        },
+        "player": {"units": [{"id": "p1", "type_id": "warrior", "position": [3, 3], "health": 60}]},
+        "ceasefire_turns": 0,
+    }
+    state.update(overrides)
+    return state
+
+
+def move(unit_id, position, target):
+    return {"type": "movement", "unit_id": unit_id, "position": position, "target_position": target}
+
+
+def validate(actions, state=None):
+    return ActionValidator(state or game_state()).validate(actions)
+
+
+def only_action(result):
+    assert result["rejected"] == []
+    assert len(result["actions"]) == 1
+    return result["actions"][0]
+
+
+def reasons(result):
+    return [entry["reason"] for entry in result["rejected"]]
+
+
+# --- Movement ---
+
+def test_valid_move_is_kept_with_its_states():
+    result = validate([move("w1", [1, 0], [2, 1])])
+    action = only_action(result)
+    assert result["repaired"] == []
+    assert action["target_position"] == [2, 1]
+    assert action["state_before"] == {"position": [1, 0], "remainingMovement": 2, "status": "ready"}
+    assert action["state_after"] == {"position": [2, 1], "remainingMovement": 0, "status": "exhausted"}
+
+
+@pytest.mark.parametrize("unit_id, start, target, clamped, problem", [
+    ("w1", [1, 0], [4, 0], [3, 0], "target on water"),
+    ("s2", [6, 3], [6, 0], [6, 1], "target not reachable this turn"),
+    ("w1", [1, 0], [1, 2], [1, 1], "target occupied"),
+])
+def test_move_is_clamped_to_the_nearest_reachable_tile(unit_id, start, target, clamped, problem):
+    result = validate([move(unit_id, start, target)])
+    action = only_action(result)
+    assert action["target_position"] == clamped
+    assert action["state_after"]["position"] == clamped
+    assert result["repaired"] == [{"index": 0, "type": "movement",
+                                   "reason": f"{problem}, moved to {clamped} instead"}]
+
+
+def test_move_that_gets_no_closer_is_dropped():
+    # Water on (2, 0) and (1, 1): no tile w1 can reach is closer to (3, 0) than where it is
+    state = game_state()
+    state["map_data"]["terrain"][0][2] = 1
+    state["map_data"]["terrain"][1][1] = 1
+    result = validate([move("w1", [1, 0], [3, 0])], state)
+    assert result["actions"] == []
+    assert reasons(result) == ["target not reachable this turn"]
+
+
+@pytest.mark.parametrize("target, reason", [
+    ([9, 9], "target outside the map"),
+    ([-1, 0], "target outside the map"),
+    ([1], "target_position must be [x, y]"),
+    ([1.5, 2], "target_position must be [x, y]"),
+    ([1, 0], "unit is already on the target tile"),
+])
+def test_malformed_or_pointless_targets_are_dropped(target, reason):
+    result = validate([move("w1", [1, 0], target)])
+    assert reasons(result) == [reason]
+
+
+def test_occupancy_follows_the_replay():
+    # w1 leaves (1, 0) first, so w2 can end its move there
+    result = validate([move("w1", [1, 0], [3, 0]), move("w2", [1, 2], [1, 0])])
+    assert [action["target_position"] for action in result["actions"]] == [[3, 0], [1, 0]]
+    assert result["repaired"] == []
+
+    # In the other order the tile is still taken
+    result = validate([move("w2", [1, 2], [1, 0]), move("w1", [1, 0], [3, 0])])
+    assert result["actions"][0]["target_position"] == [1, 1]
+    assert result["repaired"][0]["reason"] == "target occupied, moved to [1, 1] instead"
+
+
+def test_second_move_of_a_unit_starts_where_the_first_ended():
+    result = validate([move("w1", [1, 0], [2, 0]), move("w1", [1, 0], [3, 0]), move("w1", [3, 0], [3, 1])])
+    first, second = result["actions"]
+    assert second["position"] == [2, 0]
+    assert second["state_before"]["remainingMovement"] == 1
+    assert result["repaired"] == [{"index": 1, "type": "movement", "reason": "unit is on [2, 0]"}]
+    assert reasons(result) == ["unit has no movement left"]
+
+
+def test_unknown_unit_and_action_type():
+    result = validate([move("nobody", [5, 5], [5, 4]), {"type": "dance"}, "move"])
+    assert reasons(result) == ["unit not found", "unknown action type", "unknown action type"]
+
+
+def test_game_state_is_not_modified():
+    state = game_state()
+    before = copy.deepcopy(state)
+    validate([move("w1", [1, 0], [3, 0]),
+              {"type": "construction", "building": "city", "unit_id": "s1", "position": [0, 4]}], state)
+    assert state == before
+
+
+# --- Attacks ---
+
+def attack(unit_id, position, target_id, target, **states):
+    return {"type": "attack", "unit_id": unit_id, "position": position,
+            "target_unit_id": target_id, "target_position": target, **states}
+
+
+def test_reported_health_is_clamped_and_dead_targets_are_removed():
+    result = validate([
+        attack("w2", [1, 2], "p1", [3, 3], state_after={"health": 500}, target_state_after={"health": -4}),
+        attack("w1", [1, 0], "p1", [3, 3]),
+    ])
+    action = result["actions"][0]
+    assert action["state_after"]["health"] == 80
+    assert action["target_state_after"]["health"] == 0
+    assert result["repaired"] == [{"index": 0, "type": "attack",
+                                   "reason": "state_after health clamped to 80; "
+                                             "target_state_after health clamped to 0"}]
+    # p1 is gone for the next attack
+    assert reasons(result) == ["target not found"]
+
+
+def test_health_within_range_is_kept():
+    result = validate([attack("w2", [1, 2], "p1", [3, 3], state_after={"health": 70},
+                              target_state_after={"health": 20})])
+    action = only_action(result)
+    assert (action["state_after"]["health"], action["target_state_after"]["health"]) == (70, 20)
+    assert result["repaired"] == []
+
+
+def test_attack_is_dropped_during_a_ceasefire():
+    result = validate([attack("w2", [1, 2], "p1", [3, 3])], game_state(ceasefire_turns=2))
+    assert reasons(result) == ["ceasefire"]
+
+
+def test_target_out_of_range():
+    result = validate([attack("w1", [1, 0], "p1", [3, 3])])
+    assert reasons(result) == ["target out of range"]
+
+
+def test_target_outside_the_fog_is_not_found():
+    state = game_state()
+    state["ia"]["fog_grid"][3][3] = 0
+    result = validate([attack("w2", [1, 2], "p1", [3, 3])], state)
+    assert reasons(result) == ["target not found"]
+
+
+# --- Cities and productions (costs are paid in order) ---
+
+def found_city(unit_id, position, name):
+    return {"type": "construction", "building": "city", "unit_id": unit_id, "position": position, "city_name": name}
+
+
+def train(city_id, item_id="warrior"):
+    return {"type": "city_production", "city_id": city_id, "action": "train", "item_id": item_id}
+
+
+def test_only_the_cities_that_can_be_paid_are_founded():
+    validator = ActionValidator(game_state())
+    result = validator.validate([found_city("s1", [0, 4], "A"), found_city("s2", [6, 3], "B")])
+    assert [action["city_name"] for action in result["actions"]] == ["A"]
+    assert reasons(result) == ["not enough resources for a city"]
+    assert validator.resources == {"wood": 10, "stone": 5, "food": 150}
+
+
+def test_city_is_founded_on_the_settlers_tile():
+    result = validate([found_city("s1", [3, 4], "A")])
+    assert only_action(result)["position"] == [0, 4]
+    assert result["repaired"][0]["reason"] == "city founded on the settler's tile [0, 4]"
+
+
+def test_production_in_a_city_founded_this_turn():
+    result = validate([found_city("s1", [0, 4], "A"), train("A")])
+    assert len(result["actions"]) == 2
+    assert result["actions"][1]["position"] == [0, 4]
+
+
+def test_productions_after_the_money_runs_out_are_dropped():
+    result = validate([found_city("s1", [0, 4], "A"), train("c1"), train("A")])
+    assert [action["type"] for action in result["actions"]] == ["construction", "city_production"]
+    assert reasons(result) == ["not enough resources"]
+
+
+def test_production_checks():
+    result = validate([
+        train("nowhere"),
+        train("c1", "dragon"),
+        {"type": "city_production", "city_id": "c1", "action": "research", "item_id": "bronze_working"},
+        train("Hiria"),
+        train("c1"),
+    ])
+    assert reasons(result) == ["city not found", "unknown troop", "unknown technology",
+                               "city is already producing"]
+    # The city was named instead of given by id
+    assert result["repaired"] == [{"index": 3, "type": "city_production", "reason": "city_id corrected"}]
+
+
+def test_validate_plan_keeps_the_rest_of_the_response():
+    checked = validate_plan(game_state(), {"actions": "none", "reasoning": "x"})
+    assert checked == {"actions": [], "rejected": [], "repaired": [], "reasoning": "x"}
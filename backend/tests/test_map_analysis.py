@@ -0,0 +1,106 @@
+"""
+map_analysis.land_components (vectorized union-find over runs of land)
+checked against a breadth-first flood fill.
+"""
+from collections import deque
+
+import numpy as np
+import pytest
+
+from map_analysis import land_components, NO_COMPONENT, WATER
+
+
+def flood_fill_components(terrain):
+    """Reference labelling: BFS from every unlabelled land tile, in row-major order"""
+    terrain = np.asarray(terrain)
+    height, width = terrain.shape
+    labels = np.zeros((height, width), dtype=np.uint32)
+    count = 0
+    for y in range(height):
+        for x in range(width):
+            if terrain[y, x] == WATER or labels[y, x]:
+                continue
+            count += 1
+            labels[y, x] = count
+            queue = deque([(x, y)])
+            while queue:
+                cx, cy = queue.popleft()
+                for nx, ny in ((cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)):
+                    if 0 <= nx < width and 0 <= ny < height and terrain[ny, nx] != WATER and not labels[ny, nx]:
+                        labels[ny, nx] = count
+                        queue.append((nx, ny))
+    return labels, count
+
+
+def grid(rows):
+    """Terrain from strings: '#' is land, '.' is water"""
+    return np.array([[0 if char == "#" else WATER for char in row] for row in rows], dtype=np.uint8)
+
+
+def assert_matches_reference(terrain):
+    labels, count = land_components(terrain)
+    expected, expected_count = flood_fill_components(terrain)
+    assert count == expected_count
+    np.testing.assert_array_equal(labels, expected)
+
+
+def test_empty_and_all_water():
+    labels, count = land_components(np.zeros((0, 0), dtype=np.uint8))
+    assert count == 0 and labels.shape == (0, 0)
+    labels, count = land_components(np.full((4, 5), WATER, dtype=np.uint8))
+    assert count == 0
+    assert (labels == NO_COMPONENT).all()
+
+
+def test_all_land_is_one_component():
+    labels, count = land_components(np.zeros((3, 7), dtype=np.uint8))
+    assert count == 1
+    assert (labels == 1).all()
+
+
+def test_diagonal_tiles_are_not_connected():
+    labels, count = land_components(grid(["#.", ".#"]))
+    assert count == 2
+    assert labels.tolist() == [[1, 0], [0, 2]]
+
+
+def test_labels_follow_the_first_tile_in_row_major_order():
+    labels, count = land_components(grid([
+        "..##",
+        "#...",
+        "#.##",
+    ]))
+    assert count == 3
+    assert labels.tolist() == [[0, 0, 1, 1], [2, 0, 0, 0], [2, 0, 3, 3]]
+
+
+@pytest.mark.parametrize("rows", [
+    # U shape: the two arms only meet in the last row
+    ["#.#.#", "#.#.#", "#.#.#", "#####"],
+    # Comb whose teeth join through the top row, read bottom-up
+    ["#####", "#.#.#", "#.#.#"],
+    # Spiral: one component that needs several hooking rounds
+    ["#######", "......#", "#####.#", "#...#.#", "#.###.#", "#.....#", "#######"],
+    # Staircase of runs overlapping by one tile
+    ["##....", ".##...", "..##..", "...##.", "....##"],
+    # Checkerboard: every land tile alone
+    ["#.#.#.", ".#.#.#", "#.#.#."],
+])
+def test_hand_built_maps(rows):
+    assert_matches_reference(grid(rows))
+
+
+@pytest.mark.parametrize("water", [0.2, 0.4, 0.5, 0.6, 0.8])
+def test_random_maps_match_flood_fill(water):
+    rng = np.random.default_rng(int(water * 100))
+    for _ in range(20):
+        height, width = rng.integers(1, 40, size=2)
+        terrain = np.where(rng.random((height, width)) < water, WATER, 0).astype(np.uint8)
+        assert_matches_reference(terrain)
+
+
+def test_resource_tiles_are_land():
+    terrain = np.array([[2, 3, WATER, 4], [5, WATER, WATER, 0]], dtype=np.uint8)
+    labels, count = land_components(terrain)
+    assert count == 2
+    assert labels.tolist() == [[1, 1, 0, 2], [1, 0, 0, 2]]
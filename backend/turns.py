@@ -0,0 +1,222 @@
+"""
+Authoritative end-of-turn pipeline.
+
+end_turn runs, for both sides in one pass over the game, what the browser used
+to do in endTurn (processCityProduction, processAICityProduction,
+calculateAndDistributeResources, increaseCityPopulation and the unit resets):
+
+1. production: finished troops are placed next to their city, finished
+   buildings are built or upgraded
+2. research: finished technologies are added to the player; only the timers
+   due this turn are visited (see scheduler.py)
+3. resource income (economy.py)
+4. city population growth
+5. ceasefire countdown, next turn and unit movement reset
+
+It returns a compact summary of what changed, so the client does not have to
+upload the whole game every turn.
+"""
+import random
+import uuid
+from database import (get_troop_type, get_building_type, get_technology_type,
+                      find_unoccupied_position)
+from economy import resource_income
+from fog_of_war import add_sight_source
+from spatial_index import get_spatial_index
+from scheduler import (SCHEDULE_FIELD, PRODUCTION, RESEARCH, schedule_timers,
+                       pop_due_events)
+
+PLAYER_TYPES = ("player", "ia")
+
+# Empty production slot of a city (same shape as the frontend)
+EMPTY_PRODUCTION = {
+    "current_item": None,
+    "turns_remaining": 0,
+    "itemType": None,
+    "production_type": None,
+}
+
+
+def city_position_list(city):
+    """City position as [x, y], whether stored as [x, y] or {"x", "y"}"""
+    position = city.get("position")
+    if isinstance(position, dict):
+        return [position.get("x", 0), position.get("y", 0)]
+    return list(position[:2])
+
+
+def complete_troop(game, player_type, city, item_id):
+    """
+    Create a finished troop on the nearest free land tile around its city.
+    Returns the new unit or None if there is no free tile.
+    """
+    index = get_spatial_index(game)
+    position = find_unoccupied_position(game["map_data"], city_position_list(city), index)
+    if position is None:
+        return None
+    unit = get_troop_type(item_id, position)
+    if unit is None:
+        return None
+
+    prefix = "ia-unit" if player_type == "ia" else "unit"
+    unit.update({
+        "id": f"{prefix}-{uuid.uuid4().hex[:12]}",
+        "owner": player_type,
+        "status": "ready",
+        "remainingMovement": unit.get("movement", 2),
+    })
+    add_sight_source(game, player_type, position)
+    units = game[player_type].setdefault("units", [])
+    index.add_unit(player_type, unit)
+    units.append(unit)
+    return unit
+
+
+def complete_building(game, city, item_id, production_type):
+    """
+    Build a new building or upgrade an existing one.
+    Returns the building or None if there is nothing to upgrade.
+    """
+    details = get_building_type(item_id) or {"type_id": item_id, "name": f"Building {item_id}"}
+    buildings = city.setdefault("buildings", [])
+
+    if production_type in ("upgrade", 2):
+        for index, building in enumerate(buildings):
+            if isinstance(building, dict) and building.get("type_id") == item_id:
+                upgraded = dict(building)
+                upgraded["level"] = upgraded.get("level", 1) + 1
+                if upgraded.get("output"):
+                    upgraded["output"] = {resource: amount + details.get("level_upgrade", 1)
+                                          for resource, amount in upgraded["output"].items()}
+                elif details.get("output"):
+                    upgraded["output"] = dict(details["output"])
+                buildings[index] = upgraded
+                return upgraded
+        return None
+
+    building = dict(details)
+    building.update({
+        "id": f"{item_id}_{uuid.uuid4().hex[:12]}",
+        "type_id": item_id,
+        "constructed_at": game.get("turn", 1),
+        "level": 1,
+    })
+    buildings.append(building)
+    return building
+
+
+def complete_production(game, player_type, city):
+    """
+    Finish the current production of a city and clear the slot.
+    Returns a summary entry or None if nothing could be produced.
+    """
+    production = city["production"]
+    item_id = production["current_item"]
+    item_type = production.get("itemType") or "troop"
+    city["production"] = dict(EMPTY_PRODUCTION)
+
+    if item_type == "troop":
+        unit = complete_troop(game, player_type, city, item_id)
+        if unit is None:
+            return None
+        return {"city": city.get("name"), "type": "troop", "item": item_id,
+                "unit_id": unit["id"], "position": unit["position"]}
+
+    building = complete_building(game, city, item_id, production.get("production_type") or "build")
+    if building is None:
+        return None
+    return {"city": city.get("name"), "type": "building", "item": item_id, "level": building.get("level", 1)}
+
+
+def complete_research(game, player_type, tech_id):
+    """
+    Add a finished technology to a player (once). Returns True if it was new.
+    """
+    technologies = game[player_type].setdefault("technologies", [])
+    for tech in technologies:
+        if tech == tech_id or (isinstance(tech, dict) and tech.get("id") == tech_id):
+            return False
+    technologies.append(get_technology_type(tech_id) or tech_id)
+    return True
+
+
+def process_due_timers(game, summary):
+    """
+    Complete the production and research timers due this turn (popped from
+    the game's completion-turn schedule, see scheduler.py)
+    """
+    if SCHEDULE_FIELD not in game:
+        # Game saved before the scheduler: enqueue its running timers once
+        schedule_timers(game)
+
+    for player_type, city, kind, item_id, slot in pop_due_events(game):
+        if player_type not in summary:
+            continue
+        if kind == PRODUCTION:
+            completed = complete_production(game, player_type, city)
+            if completed:
+                summary[player_type]["completed"].append(completed)
+            continue
+
+        if complete_research(game, player_type, item_id):
+            summary[player_type]["technologies"].append(item_id)
+        if kind == RESEARCH:
+            city["research"] = None
+        else:
+            for building in city.get("buildings") or []:
+                if isinstance(building, dict) and building.get("production") is slot:
+                    building["production"] = None
+
+
+def grow_population(game, player_type, summary):
+    """
+    Every city with buildings grows by a random 1-4 per building (increaseCityPopulation)
+    """
+    for city in game[player_type].get("cities", []):
+        buildings = city.get("buildings") or []
+        if buildings:
+            increment = random.randint(1, 4) * len(buildings)
+            city["population"] = (city.get("population") or 0) + increment
+            summary["population"][city.get("id") or city.get("name")] = increment
+
+
+def reset_units(game, player_type):
+    """Ready every unit of a player for the next turn"""
+    for unit in game[player_type].get("units", []):
+        unit["status"] = "ready"
+        unit["remainingMovement"] = unit.get("movement") or 2
+
+
+def end_turn(game):
+    """
+    Run the end-of-turn pipeline for both players (modifies the game in place).
+    Returns a compact summary of the changes.
+    """
+    summary = {}
+    for player_type in PLAYER_TYPES:
+        if player_type in game:
+            summary[player_type] = {"completed": [], "technologies": [], "income": {}, "population": {}}
+    process_due_timers(game, summary)
+
+    # Income after production, so buildings finished this turn already produce
+    income = resource_income(game, tuple(summary))
+    for player_type, side_summary in summary.items():
+        resources = game[player_type].setdefault("resources", {})
+        for resource, amount in income[player_type]["total"].items():
+            resources[resource] = resources.get(resource, 0) + amount
+        side_summary["income"] = income[player_type]["total"]
+        side_summary["resources"] = resources
+        grow_population(game, player_type, side_summary)
+        reset_units(game, player_type)
+
+    # Ceasefire countdown
+    if game.get("ceasefire_turns", 0) > 0:
+        game["ceasefire_turns"] -= 1
+        game["ceasefire_active"] = game["ceasefire_turns"] > 0
+
+    game["turn"] = (game.get("turn") or 0) + 1
+    game["current_player"] = "player"
+
+    summary["turn"] = game["turn"]
+    summary["ceasefire_turns"] = game.get("ceasefire_turns", 0)
+    return summary
@@ -393,57 +393,35 @@ export const gameAPI = {
    */
   async getAllMaps() {
     try {
-      const response = await fetchWithAuth(`${API_BASE_URL}/maps`);
-      if (!response.ok) {
-        // If it's a 404, it might mean there are no maps - return empty array
-        if (response.status === 404) {
-          console.log("No maps found (404 response)");
-          return [];
+      // The catalog returns metadata only (no grid or terrain matrices)
+      const maps = [];
+      let cursor = null;
+      do {
+        const params = new URLSearchParams({ limit: '100' });
+        if (cursor) {
+          params.set('cursor', cursor);
         }
-        throw new Error(`Failed to fetch maps: ${response.status}`);
-      }
-
-      // Parse response - handle empty responses
-      const responseText = await response.text();
-      if (!responseText || responseText.trim() === '') {
-        console.log("Empty response when fetching maps - returning empty array");
-        return [];
-      }
-
-      // Parse the JSON response
-      const maps = JSON.parse(responseText);
+        const response = await fetchWithAuth(`${API_BASE_URL}/maps/catalog?${params}`);
+        if (!response.ok) {
+          throw new Error(`Failed to fetch maps: ${response.status}`);
+        }
+        const page = await response.json();
+        maps.push(...(page.maps || []));
+        cursor = page.next_cursor;
+      } while (cursor);
       console.log("Fetched maps:", maps);
 
-      // If response is not an array, return empty array
-      if (!Array.isArray(maps)) {
-        console.warn("Maps response is not an array, returning empty array instead");
-        return [];
-      }
-
       // Normalize map data to ensure consistent property names
-      return maps.map(map => {
-        // Preserve the original ID from the database when possible
-        let mapId;
-        if (map._id) {
-          mapId = map._id;
-        } else if (map.map_id) {
-          mapId = map.map_id;
-        } else {
-          // Only use generated ID as a last resort
-          mapId = `map-${Date.now()}-${Math.random().toString(36).substr(2, 5)}`;
-          console.warn(`Generated fallback ID for map: ${mapId}`);
-        }
-
-        return {
-          map_id: mapId,
-          width: map.width || 30,
-          height: map.height || 15,
-          difficulty: map.difficulty || 'medium',
-          name: map.name || `Mapa ${map.width || 30}x${map.height || 15}`,
-          startPoint: map.startPoint || [15, 7],
-          // Include other properties as needed
-        };
-      });
+      return maps.map(map => ({
+        map_id: map.map_id,
+        width: map.width || 30,
+        height: map.height || 15,
+        difficulty: map.difficulty || 'medium',
+        name: map.name || `Mapa ${map.width || 30}x${map.height || 15}`,
+        startPoint: map.startPoint || [15, 7],
+        resource_counts: map.resource_counts || {},
+        thumbnail_url: map.thumbnail_url
+      }));
     } catch (error) {
       console.error("Error fetching maps:", error);
       // Return empty array instead of throwing error
@@ -562,15 +540,223 @@ export const gameAPI = {
   },
 
   /**
-   * Get all games for the current user
+   * Move units on the server (movement rules apply) and get only the fog tiles that changed
+   * @param {string} playerType - 'player' or 'ia'
+   * @param {Array} moves - [{ unit_id, position: [x, y] }] or [{ from: [x, y], position: [x, y] }]
+   * @returns {Promise<Object>} { revealed, visible, hidden } as [x, y] lists,
+   *   moves: [{ unit_id, position, path, remainingMovement, status }] and the refused moves in errors
+   */
+  async moveUnitsWithFog(playerType, moves) {
+    const response = await fetchWithAuth(`${API_BASE_URL}/game/fog/move`, {
+      method: 'POST',
+      body: JSON.stringify({ player_type: playerType, moves }),
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to move units: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Tiles a unit can move to this turn (server movement rules)
+   * @param {string} playerType - "player" or "ia"
+   * @param {Object} unit - Unit with id, or with position if it has no id
+   * @returns {Promise<Object>} { position, moves: [{ x, y, cost, remainingMovement, path }] }
+   */
+  async getUnitMoves(playerType, unit) {
+    const params = new URLSearchParams({ player_type: playerType });
+    if (unit.id !== undefined && unit.id !== null) {
+      params.set('unit_id', unit.id);
+    } else {
+      params.set('x', unit.position[0]);
+      params.set('y', unit.position[1]);
+    }
+    const response = await fetchWithAuth(`${API_BASE_URL}/game/units/moves?${params}`);
+    if (!response.ok) {
+      throw new Error(`Failed to get unit moves: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Visible enemy units a unit can attack, nearest first
+   * @param {string} playerType - "player" or "ia"
+   * @param {Object} unit - Unit with id, or with position if it has no id
+   * @returns {Promise<Object>} { targets: [{ id, type_id, position, health }] }
+   */
+  async getAttackTargets(playerType, unit) {
+    const params = new URLSearchParams({ player_type: playerType });
+    if (unit.id !== undefined && unit.id !== null) {
+      params.set('unit_id', unit.id);
+    } else {
+      params.set('x', unit.position[0]);
+      params.set('y', unit.position[1]);
+    }
+    const response = await fetchWithAuth(`${API_BASE_URL}/game/units/targets?${params}`);
+    if (!response.ok) {
+      throw new Error(`Failed to get attack targets: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Resolve an attack on the server (the loser is removed from the game)
+   * @param {string} playerType - Owner of the attacker: "player" or "ia"
+   * @param {Object} attacker - Unit with id, or with position if it has no id
+   * @param {Object} defender - Enemy unit with id, or with position
+   * @returns {Promise<Object>} { winner, attacker_health, defender_health, blows }
+   */
+  async resolveBattle(playerType, attacker, defender) {
+    const ref = (unit) => (unit.id !== undefined && unit.id !== null)
+      ? { unit_id: unit.id }
+      : { x: unit.position[0], y: unit.position[1] };
+    const response = await fetchWithAuth(`${API_BASE_URL}/game/battle`, {
+      method: 'POST',
+      body: JSON.stringify({ player_type: playerType, attacker: ref(attacker), defender: ref(defender) }),
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to resolve battle: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Estimated outcome of a fight (for an attack preview)
+   * @param {Object} attacker - { type_id, health?, attack?, defense? }
+   * @param {Object} defender - { type_id, health?, attack?, defense? }
+   * @returns {Promise<Object>} { win_probability, loss_probability, expected_attacker_health, expected_defender_health, expected_blows }
+   */
+  async getBattleOdds(attacker, defender) {
+    const stats = ({ type_id, health, attack, defense }) => ({ type_id, health, attack, defense });
+    const response = await fetchWithAuth(`${API_BASE_URL}/combat/odds`, {
+      method: 'POST',
+      body: JSON.stringify({ attacker: stats(attacker), defender: stats(defender) }),
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to get battle odds: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Move a unit to a reachable tile on the server
+   * @param {string} playerType - "player" or "ia"
+   * @param {Object} unit - Unit with id, or with position if it has no id
+   * @param {Array} position - Target [x, y]
+   * @returns {Promise<Object>} { path, remainingMovement, status, fog }
+   */
+  async moveUnit(playerType, unit, position) {
+    const body = { player_type: playerType, position };
+    if (unit.id !== undefined && unit.id !== null) {
+      body.unit_id = unit.id;
+    } else {
+      body.x = unit.position[0];
+      body.y = unit.position[1];
+    }
+    const response = await fetchWithAuth(`${API_BASE_URL}/game/units/move`, {
+      method: 'POST',
+      body: JSON.stringify(body),
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to move unit: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Shortest land path between two tiles (ignores movement points)
+   * @param {string} playerType - "player" or "ia"
+   * @param {Array} start - [x, y]
+   * @param {Array} goal - [x, y]
+   * @returns {Promise<Object>} { path, cost } (path is null if unreachable)
+   */
+  async findPath(playerType, start, goal) {
+    const response = await fetchWithAuth(`${API_BASE_URL}/game/path`, {
+      method: 'POST',
+      body: JSON.stringify({ player_type: playerType, start, goal }),
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to find path: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * End the current turn on the server (production, research, income,
+   * population and unit resets for both players)
+   * @param {string} gameId - Game ID
+   * @param {number} turn - Turn being ended (the server answers 409 if it is not the current one)
+   * @returns {Promise<Object>} Summary of the changes: { turn, player, ia, ceasefire_turns }
+   */
+  async endTurn(gameId, turn) {
+    const response = await fetchWithAuth(`${API_BASE_URL}/game/${gameId}/end-turn`, {
+      method: 'POST',
+      body: JSON.stringify({ turn }),
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to end turn: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Apply the actions of an AI turn to the game on the server (movement,
+   * fog, attacks, new cities, productions) in one transaction
+   * @param {string} gameId - Game ID
+   * @param {Array} actions - AI actions (as returned by getAIAction)
+   * @returns {Promise<Object>} { events, rejected, repaired, resources } - events in order, to animate
+   */
+  async applyAITurn(gameId, actions) {
+    const response = await fetchWithAuth(`${API_BASE_URL}/game/${gameId}/ai-turn`, {
+      method: 'POST',
+      body: JSON.stringify({ actions }),
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to apply AI turn: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Get the resource tiles and per-turn income of every city of both players
+   * @returns {Promise<Object>} { player: { cities, total }, ia: { cities, total } }
+   */
+  async getEconomy() {
+    const response = await fetchWithAuth(`${API_BASE_URL}/game/economy`);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch economy: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Get one page of saved game summaries (no map or fog grids)
+   */
+  async getUserGameSummaries(cursor = null, limit = 20) {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    const response = await fetchWithAuth(`${API_BASE_URL}/user/games/summary?${params}`);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch user games: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Get all games for the current user (summaries only, the full game is
+   * fetched with loadGame when it is opened)
    */
   async getUserGames() {
     try {
-      const response = await fetchWithAuth(`${API_BASE_URL}/user/games`);
-      if (!response.ok) {
-        throw new Error(`Failed to fetch user games: ${response.status}`);
-      }
-      const games = await response.json();
+      const games = [];
+      let cursor = null;
+      do {
+        const page = await gameAPI.getUserGameSummaries(cursor);
+        games.push(...page.games);
+        cursor = page.next_cursor;
+      } while (cursor);
 
       // Process games to ensure they have all required fields
       return games.map(game => ({
@@ -737,6 +923,105 @@ export const gameAPI = {
     }
   },
 
+  /**
+   * Start the AI turn in the background (same body as getAIAction).
+   * With stream = true the actions are published while the model generates them.
+   * @returns {Promise<Object>} { job_id, status, created }
+   */
+  async submitAIJob(gameState, prompt = '', rules = null, stream = false) {
+    try {
+      const response = await fetchWithAuth(`${API_BASE_URL}/ai/jobs`, {
+        method: 'POST',
+        body: JSON.stringify({
+          game_state: gameState,
+          prompt: prompt,
+          rules: rules,
+          stream: stream
+        }),
+      });
+
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.error || `Failed to start AI turn: ${response.status}`);
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error("Error starting AI turn:", error);
+      throw error;
+    }
+  },
+
+  /**
+   * Status of an AI job ({ job_id, status, result?, error? })
+   */
+  async getAIJob(jobId) {
+    try {
+      const response = await fetchWithAuth(`${API_BASE_URL}/ai/jobs/${jobId}`);
+
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.error || `Failed to get AI job: ${response.status}`);
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error("Error getting AI job:", error);
+      throw error;
+    }
+  },
+
+  /**
+   * Wait for the result of an AI job with server-sent events
+   * (falls back to polling if EventSource is not available)
+   * @param {Function} onAction - called with each streamed action as soon as it arrives
+   * @returns {Promise<Object>} the AI response
+   */
+  waitForAIJob(jobId, onAction = null, pollInterval = 1000) {
+    if (typeof EventSource === 'undefined') {
+      return new Promise((resolve, reject) => {
+        const poll = async () => {
+          try {
+            const job = await this.getAIJob(jobId);
+            if (job.status === 'done') return resolve(job.result);
+            if (job.status === 'failed') return reject(new Error(job.error));
+            setTimeout(poll, pollInterval);
+          } catch (error) {
+            reject(error);
+          }
+        };
+        poll();
+      });
+    }
+
+    return new Promise((resolve, reject) => {
+      const source = new EventSource(`${API_BASE_URL}/ai/jobs/${jobId}/events`, { withCredentials: true });
+      source.addEventListener('action', (event) => {
+        if (onAction) onAction(JSON.parse(event.data).action);
+      });
+      source.addEventListener('result', (event) => {
+        source.close();
+        resolve(JSON.parse(event.data).result);
+      });
+      source.addEventListener('error', (event) => {
+        source.close();
+        // Server "error" events carry data; connection errors do not
+        const message = event.data ? JSON.parse(event.data).error : 'Lost connection to AI job';
+        reject(new Error(message));
+      });
+    });
+  },
+
+  /**
+   * AI turn with streamed actions: onAction is called with every action as
+   * soon as the model has generated it
+   * @returns {Promise<Object>} the complete AI response
+   */
+  async streamAIAction(gameState, onAction) {
+    const job = await this.submitAIJob(gameState, '', null, true);
+    return this.waitForAIJob(job.job_id, onAction);
+  },
+
   /**
    * Negotiation with AI (peace/resource exchange)
    * @param {Object} negotiationData - { offer, game_state }